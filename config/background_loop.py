@@ -0,0 +1,48 @@
+"""
+后台事件循环线程
+
+同步代码（Celery任务、同步视图）需要调用基于asyncio的共享客户端时，
+由一个守护线程承载事件循环，协程通过submit()提交，返回concurrent.futures.Future。
+讯飞星火客户端和千问客户端各持有一个实例。
+"""
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    """按需启动（仅一次）的后台事件循环"""
+
+    def __init__(self, name):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """启动事件循环线程并返回事件循环"""
+        with self._lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self.loop = loop
+        return self.loop
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.ensure_started())
+
+    def stop(self):
+        """停止事件循环，之后再submit会启动新的循环"""
+        with self._lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self.loop = None
+                self._thread = None
@@ -15,6 +15,9 @@ XUNFEI_APP_ID = "your_app_id"
 XUNFEI_API_SECRET = "your_api_secret"
 XUNFEI_API_KEY = "your_api_key"
 XUNFEI_ASR_API_KEY = "your_asr_api_key"
+# 实时语音转写（RTASR），也可通过同名环境变量配置
+XUNFEI_RTASR_APP_ID = "your_rtasr_app_id"
+XUNFEI_RTASR_API_KEY = "your_rtasr_api_key"
 
 # Django密钥（生产环境应使用强随机密钥）
 SECRET_KEY = "your-secret-key-here" 
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -90,11 +91,64 @@ WSGI_APPLICATION = "config.wsgi.application"
 ASGI_APPLICATION = "config.asgi.application"
 
 # Channel Layers配置（用于WebSocket）
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
-    }
+# CHANNEL_LAYER_BACKEND可选：
+#   memory        进程内通道层（默认），只能单进程运行，开发和测试使用
+#   redis         Redis通道层，可部署多个ASGI进程/节点；CHANNEL_REDIS_HOSTS配置多个地址（逗号分隔）时按组名一致性哈希分片
+#   redis_pubsub  基于Redis Pub/Sub的通道层，延迟更低但不保证送达
+CHANNEL_LAYER_BACKEND = os.environ.get('CHANNEL_LAYER_BACKEND', 'memory')
+CHANNEL_REDIS_HOSTS = [host for host in os.environ.get('CHANNEL_REDIS_HOSTS', 'redis://localhost:6379/1').split(',') if host]
+# 视频帧是高频消息：单个通道积压超过capacity条后新消息直接丢弃，
+# 消息过期时间较短，观看者不会收到积压的陈旧画面
+CHANNEL_LAYER_CONFIG = {
+    "capacity": int(os.environ.get('CHANNEL_LAYER_CAPACITY', 100)),
+    "expiry": int(os.environ.get('CHANNEL_LAYER_EXPIRY', 10)),
+    "group_expiry": int(os.environ.get('CHANNEL_LAYER_GROUP_EXPIRY', 86400)),
 }
+if CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": CHANNEL_REDIS_HOSTS, **CHANNEL_LAYER_CONFIG}
+        }
+    }
+elif CHANNEL_LAYER_BACKEND == 'redis_pubsub':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {"hosts": CHANNEL_REDIS_HOSTS}
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": CHANNEL_LAYER_CONFIG
+        }
+    }
+
+# 缓存配置（帖子流和帖子详情的响应缓存使用default缓存）
+# CACHE_BACKEND可选：
+#   locmem  进程内缓存（默认），每个进程各自缓存和失效
+#   redis   Redis缓存，多个进程共享缓存和失效版本，地址由CACHE_REDIS_URL配置
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/2'),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+
+# 指标接口（/metrics/connections/、/metrics/cache/）的访问令牌，请求头X-Metrics-Token需与之相同；
+# staff用户无需令牌。未配置令牌时非staff请求返回404
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
 
 
 # Database
@@ -223,3 +277,7 @@ CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_WORKER_CONCURRENCY = 1
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 1
+# 面试片段合成走独立队列，并发数由该队列worker的-c参数控制
+CELERY_TASK_ROUTES = {
+    'interviews.mux_interview_clip': {'queue': 'media'},
+}
@@ -6,6 +6,8 @@ For more information please see:
 """
 from django.contrib import admin
 from django.urls import path, include
+from config.ws_metrics import connection_metrics_view
+from posts.cache import cache_metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -16,4 +18,6 @@ urlpatterns = [
     path('knowledge-base/', include('knowledge_base.urls')),
     path('interview/', include('interviews.urls')),  # 修改为单数形式，匹配API规范
     path('positions/', include('positions.urls')),  # 添加positions的URL配置
+    path('metrics/connections/', connection_metrics_view),  # 本进程WebSocket连接指标（仅staff或携带METRICS_TOKEN）
+    path('metrics/cache/', cache_metrics_view),  # 本进程帖子响应缓存命中率（仅staff或携带METRICS_TOKEN）
 ]
@@ -0,0 +1,251 @@
+"""
+WebSocket连接级指标
+
+每个使用ConnectionMetricsMixin的消费者连接都会登记一份ConnectionStats：
+收到的消息数和字节数、视频帧的接收/处理/丢弃数、按消息类别的处理耗时直方图、
+处理期间的CPU时间，以及消费者上报的当前缓冲字节数（录制写盘队列、RTASR发送和重发缓冲等）。
+另外每个事件循环有一个后台任务按固定间隔测量事件循环延迟。
+
+缓冲字节数超过WS_SESSION_MAX_BUFFERED_BYTES时，should_shed_frame()返回True，消费者丢弃新到的视频帧。
+
+查看方式：staff用户或带X-Metrics-Token请求头（与METRICS_TOKEN设置相同）访问 /metrics/connections/，
+或运行 python manage.py ws_metrics（从METRICS_TOKEN读取令牌）。
+"""
+import asyncio
+import bisect
+import hmac
+import os
+import resource
+import time
+
+from django.conf import settings
+from django.http import HttpResponseForbidden, HttpResponseNotFound, JsonResponse
+
+# 直方图桶上界（毫秒）
+LATENCY_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """固定桶的耗时直方图"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, ms)] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q):
+        """按桶上界估计分位数（毫秒）"""
+        count = sum(self.counts)
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(LATENCY_BUCKETS[i], round(self.max, 1)) if i < len(LATENCY_BUCKETS) else round(self.max, 1)
+        return round(self.max, 1)
+
+    def as_dict(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'avg_ms': round(self.total / count, 2) if count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'max_ms': round(self.max, 1),
+            'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+inf'], self.counts)),
+        }
+
+
+class ConnectionStats:
+    """单个WebSocket连接的指标"""
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.kind = type(consumer).__name__
+        self.channel_name = consumer.channel_name
+        self.connected_at = time.time()
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_shed = 0
+        self.cpu_seconds = 0.0
+        self.latency = {}
+
+    def observe(self, label, seconds, cpu_seconds=0.0):
+        """记录一次处理耗时；cpu_seconds为处理期间事件循环线程的CPU时间（含期间其他协程，仅供参考）"""
+        histogram = self.latency.get(label)
+        if histogram is None:
+            histogram = self.latency[label] = Histogram()
+        histogram.observe(seconds)
+        self.cpu_seconds += cpu_seconds
+
+    def as_dict(self):
+        user = getattr(self.consumer, 'user', None)
+        return {
+            'kind': self.kind,
+            'channel_name': self.channel_name,
+            'user': getattr(user, 'username', None),
+            'connected_seconds': round(time.time() - self.connected_at, 1),
+            'messages_in': self.messages_in,
+            'bytes_in': self.bytes_in,
+            'frames_received': self.frames_received,
+            'frames_processed': self.frames_processed,
+            'frames_shed': self.frames_shed,
+            'buffered_bytes': self.consumer.get_buffered_bytes(),
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'latency': {label: h.as_dict() for label, h in self.latency.items()},
+        }
+
+
+class LoopLagMonitor:
+    """按固定间隔睡眠，实际醒来时间与预期的差值即事件循环延迟"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.histogram = Histogram()
+        self.last = 0.0
+        self._task = None
+
+    def ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - started - self.interval)
+            self.histogram.observe(self.last)
+
+    def as_dict(self):
+        return dict(self.histogram.as_dict(), last_ms=round(self.last * 1000, 1), interval=self.interval)
+
+
+class ConnectionRegistry:
+    """进程内所有连接的指标"""
+
+    def __init__(self):
+        self.connections = {}
+        self.loop_monitor = LoopLagMonitor(getattr(settings, 'WS_LOOP_LAG_INTERVAL', 0.5))
+
+    def register(self, consumer):
+        stats = self.connections[consumer.channel_name] = ConnectionStats(consumer)
+        self.loop_monitor.ensure_started()
+        return stats
+
+    def unregister(self, consumer):
+        self.connections.pop(consumer.channel_name, None)
+
+    def snapshot(self):
+        return {
+            'process': _process_stats(len(self.connections)),
+            'loop_lag': self.loop_monitor.as_dict(),
+            'connections': [stats.as_dict() for stats in list(self.connections.values())],
+        }
+
+
+def _process_stats(connection_count):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    stats = {
+        'pid': os.getpid(),
+        'connections': connection_count,
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+        'max_rss_bytes': usage.ru_maxrss * 1024,
+    }
+    try:
+        with open('/proc/self/statm') as f:
+            stats['rss_bytes'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    return stats
+
+
+connection_metrics = ConnectionRegistry()
+
+
+class ConnectionMetricsMixin:
+    """
+    AsyncWebsocketConsumer的指标混入类，需放在基类之前：
+        class InterviewConsumer(ConnectionMetricsMixin, AsyncWebsocketConsumer)
+
+    子类重写get_buffered_bytes()上报自己持有的缓冲，收到视频帧时先调用should_shed_frame()。
+    """
+
+    conn_stats = None
+
+    async def websocket_connect(self, message):
+        self.conn_stats = connection_metrics.register(self)
+        await super().websocket_connect(message)
+
+    async def websocket_receive(self, message):
+        stats = self.conn_stats
+        if stats is None:
+            return await super().websocket_receive(message)
+        data = message.get('bytes')
+        label = 'bytes' if data is not None else 'text'
+        stats.messages_in += 1
+        stats.bytes_in += len(data) if data is not None else len(message.get('text') or '')
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        try:
+            await super().websocket_receive(message)
+        finally:
+            stats.observe(label, time.perf_counter() - started, time.thread_time() - cpu_started)
+
+    async def websocket_disconnect(self, message):
+        try:
+            await super().websocket_disconnect(message)
+        finally:
+            connection_metrics.unregister(self)
+
+    def get_buffered_bytes(self):
+        """该连接当前持有的缓冲字节数"""
+        return 0
+
+    def should_shed_frame(self):
+        """记一帧接收，缓冲超过上限时记为丢弃并返回True"""
+        stats = self.conn_stats
+        if stats is None:
+            return False
+        stats.frames_received += 1
+        limit = getattr(settings, 'WS_SESSION_MAX_BUFFERED_BYTES', 64 * 1024 * 1024)
+        if limit and self.get_buffered_bytes() > limit:
+            stats.frames_shed += 1
+            return True
+        return False
+
+
+def metrics_access_allowed(request):
+    """
+    指标接口仅允许staff用户或携带正确令牌的请求访问
+
+    不按来源地址放行：反向代理与ASGI进程同机部署时，所有请求的REMOTE_ADDR都是127.0.0.1。
+    """
+    if getattr(getattr(request, 'user', None), 'is_staff', False):
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    supplied = request.headers.get('X-Metrics-Token', '')
+    return bool(token and supplied) and hmac.compare_digest(token.encode(), supplied.encode())
+
+
+def metrics_denied_response():
+    """未配置令牌时返回404，不暴露指标接口的存在"""
+    if not getattr(settings, 'METRICS_TOKEN', ''):
+        return HttpResponseNotFound()
+    return HttpResponseForbidden()
+
+
+def connection_metrics_view(request):
+    """本进程的连接指标（仅staff用户或携带令牌的请求可访问）"""
+    if not metrics_access_allowed(request):
+        return metrics_denied_response()
+    return JsonResponse(connection_metrics.snapshot(), json_dumps_params={'ensure_ascii': False})
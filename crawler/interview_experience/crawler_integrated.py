@@ -30,7 +30,7 @@ from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import logging
 from django.contrib.auth import get_user_model
 from posts.models import Post, Tag
-from posts.services import tag_service
+from posts.tasks import enqueue_post_tagging
 from users.management.commands.create_test_users import Command as CreateTestUsersCommand
 import random
 
@@ -191,13 +191,6 @@ def create_post_from_crawler_data(crawler_item):
         
         logger.info(f"创建帖子成功: {post.id} - {post.title[:50]}")
         
-        # 生成并创建标签
-        try:
-            tags = tag_service.create_tags_for_post(post)
-            logger.info(f"为帖子 {post.id} 生成了 {len(tags)} 个标签")
-        except Exception as e:
-            logger.error(f"为帖子生成标签失败: {e}")
-        
         return post
         
     except Exception as e:
@@ -214,6 +207,10 @@ def save_crawler_data_as_posts(crawler_data):
         if post:
             created_posts.append(post)
     
+    # 标签由后台任务批量生成，多篇帖子合并为一次大模型调用
+    enqueue_post_tagging([post.id for post in created_posts])
+    logger.info(f"已为 {len(created_posts)} 个帖子投递标签生成任务")
+    
     return created_posts
 
 
@@ -291,17 +288,16 @@ def main():
         
         logger.info(f"爬虫运行完成，共创建 {len(created_posts)} 个帖子")
         
-        # 输出统计信息
+        # 输出统计信息（标签在后台生成，这里统计生成状态）
         if created_posts:
-            tag_counts = {}
-            for post in created_posts:
-                for tag in post.tags.all():
-                    tag_type = tag.get_tag_type_display()
-                    tag_counts[tag_type] = tag_counts.get(tag_type, 0) + 1
+            status_counts = {}
+            for post in Post.objects.filter(id__in=[post.id for post in created_posts]).only('tags_status'):
+                status = post.get_tags_status_display()
+                status_counts[status] = status_counts.get(status, 0) + 1
             
-            logger.info("标签统计:")
-            for tag_type, count in tag_counts.items():
-                logger.info(f"  {tag_type}: {count}")
+            logger.info("标签生成状态:")
+            for status, count in status_counts.items():
+                logger.info(f"  {status}: {count}")
         
         return created_posts
         
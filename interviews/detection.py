@@ -0,0 +1,341 @@
+"""
+视频帧人数检测服务（防作弊）
+
+所有WebSocket连接共享一个YOLO推理进程池，每个推理进程只加载一次模型，
+事件循环中只做入队，不做解码和推理。
+
+- 提交的帧进入有界等待队列，同一会话只保留最新一帧，旧帧直接丢弃
+- 调度线程把多个会话的帧合并成一个批次，做一次前向推理
+- 推理进程全忙时帧在队列中等待，超过max_age的帧出队时丢弃
+- 结果通过asyncio Future异步返回给消费者，被丢弃的帧返回None
+- 入队前由FrameSampler按会话采样：固定检测频率、跳过与上次检测几乎相同的画面，
+  检测到多人或人数变化后进入突发模式，短时间内提高检测频率
+
+用法：
+    count = await person_detector.detect(self.channel_name, img_bytes)
+    if count is not None and count > 1: ...  # 检测到多人
+
+WebSocket消费者通过PersonCheckMixin使用：帧到达时消费者按顺序转发、保存、录制，
+检测作为旁路任务运行，只负责推送cheat_detected，不延迟也不打乱视频帧。
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PERSON_CLASS_ID = 0  # COCO中person的类别编号
+UNDECODABLE = -1
+
+# 推理进程内的模型实例
+_model = None
+
+
+def _init_worker(model_path):
+    """推理进程初始化：每个进程只加载一次YOLO模型"""
+    global _model
+    from ultralytics import YOLO
+    _model = YOLO(model_path)
+
+
+def _detect_batch(frames):
+    """在推理进程中解码一批JPEG并做一次前向推理，返回每帧的人数（无法解码为-1）"""
+    import cv2
+    import numpy as np
+
+    counts = [UNDECODABLE] * len(frames)
+    images = []
+    indexes = []
+    for i, img_bytes in enumerate(frames):
+        img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            images.append(img)
+            indexes.append(i)
+    if images:
+        results = _model(images, verbose=False)
+        for i, result in zip(indexes, results):
+            counts[i] = sum(1 for b in result.boxes.data.cpu().numpy() if int(b[5]) == PERSON_CLASS_ID)
+    return counts
+
+
+def _frame_hash(img_bytes):
+    """计算帧的64位差值哈希（dHash），只以1/8分辨率解码灰度图，开销很小"""
+    import cv2
+    import numpy as np
+
+    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class FrameDecodeError(ValueError):
+    """帧数据无法解码为图像"""
+
+
+class _PendingFrame:
+    __slots__ = ('img_bytes', 'loop', 'future', 'submitted_at')
+
+    def __init__(self, img_bytes, loop, future):
+        self.img_bytes = img_bytes
+        self.loop = loop
+        self.future = future
+        self.submitted_at = time.monotonic()
+
+
+class _SamplerState:
+    __slots__ = ('last_checked_at', 'last_detected_at', 'last_hash', 'last_count', 'burst_until')
+
+    def __init__(self):
+        self.last_checked_at = float('-inf')
+        self.last_detected_at = float('-inf')
+        self.last_hash = None
+        self.last_count = None
+        self.burst_until = float('-inf')
+
+
+class FrameSampler:
+    """按会话决定哪些帧需要做人数检测"""
+
+    def __init__(self, interval=None, burst_interval=None, burst_duration=None,
+                 hash_threshold=None, max_skip=None):
+        # 显式传入或配置为0的值同样有效（如YOLO_BURST_DURATION = 0关闭突发模式）
+        # 常规检测间隔（秒）
+        self.interval = interval if interval is not None else getattr(settings, 'YOLO_SAMPLE_INTERVAL', 1.0)
+        # 突发模式下的检测间隔和持续时间（秒）
+        self.burst_interval = burst_interval if burst_interval is not None else getattr(settings, 'YOLO_BURST_INTERVAL', 0.2)
+        self.burst_duration = burst_duration if burst_duration is not None else getattr(settings, 'YOLO_BURST_DURATION', 5.0)
+        # 与上次检测帧的哈希汉明距离不超过该值视为重复画面，设为负数关闭去重
+        self.hash_threshold = hash_threshold if hash_threshold is not None else getattr(settings, 'YOLO_DEDUP_THRESHOLD', 4)
+        # 重复画面最多连续跳过的时间（秒），到期强制检测一次，为0时关闭去重
+        self.max_skip = max_skip if max_skip is not None else getattr(settings, 'YOLO_DEDUP_MAX_SKIP', 3.0)
+        self._sessions = {}
+
+    async def should_detect(self, session_key, img_bytes):
+        """判断该帧是否需要送去检测；去重用的哈希在线程池中计算，不占用事件循环"""
+        state = self._sessions.setdefault(session_key, _SamplerState())
+        now = time.monotonic()
+        bursting = now < state.burst_until
+        if now - state.last_checked_at < (self.burst_interval if bursting else self.interval):
+            return False
+        state.last_checked_at = now
+
+        if bursting or self.hash_threshold < 0 or self.max_skip <= 0:
+            frame_hash = None
+        else:
+            frame_hash = await asyncio.get_running_loop().run_in_executor(None, _frame_hash, img_bytes)
+            if (frame_hash is not None and state.last_hash is not None
+                    and now - state.last_detected_at < self.max_skip
+                    and bin(frame_hash ^ state.last_hash).count('1') <= self.hash_threshold):
+                return False
+        state.last_detected_at = now
+        state.last_hash = frame_hash
+        return True
+
+    def record(self, session_key, count):
+        """记录检测结果，检测到多人或人数变化时进入突发模式"""
+        state = self._sessions.get(session_key)
+        if state is None:
+            return
+        if count is None:
+            # 该帧未完成检测，下次不再拿它做去重基准
+            state.last_hash = None
+            return
+        if count > 1 or (state.last_count is not None and count != state.last_count):
+            state.burst_until = time.monotonic() + self.burst_duration
+        state.last_count = count
+
+    def discard(self, session_key):
+        self._sessions.pop(session_key, None)
+
+
+class PersonDetector:
+    """共享的YOLO人数检测服务"""
+
+    def __init__(self, model_path=None, workers=None, batch_size=None, batch_wait=None,
+                 queue_size=None, max_age=None, sampler=None):
+        self.model_path = model_path or getattr(settings, 'YOLO_MODEL_PATH', 'yolo11n.pt')
+        self.workers = workers or getattr(settings, 'YOLO_WORKERS', 1)
+        self.batch_size = batch_size or getattr(settings, 'YOLO_BATCH_SIZE', 8)
+        # 凑批最多等待的时间（秒）
+        self.batch_wait = batch_wait or getattr(settings, 'YOLO_BATCH_WAIT', 0.02)
+        self.queue_size = queue_size or getattr(settings, 'YOLO_QUEUE_SIZE', 32)
+        # 帧在队列中等待超过该时间（秒）即视为过期
+        self.max_age = max_age or getattr(settings, 'YOLO_FRAME_MAX_AGE', 1.0)
+        self.sampler = sampler or FrameSampler()
+        self._pending = OrderedDict()  # 会话 -> 最新一帧
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(self.workers)  # 同时在推理的批次数
+        self._executor = None
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch_loop, name='person-detector', daemon=True)
+                self._thread.start()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn避免fork出带有事件循环和线程的ASGI进程
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.model_path,)
+            )
+        return self._executor
+
+    @staticmethod
+    def _resolve(frame, result):
+        def set_result():
+            if not frame.future.done():
+                frame.future.set_result(result)
+        try:
+            frame.loop.call_soon_threadsafe(set_result)
+        except RuntimeError:
+            pass  # 连接所在的事件循环已关闭
+
+    async def detect(self, session_key, img_bytes):
+        """
+        提交一帧JPEG数据，异步返回画面中的人数
+
+        Returns:
+            人数；帧被采样跳过、被同一会话的新帧替换、队列满被挤出、过期或推理失败时返回None
+        Raises:
+            FrameDecodeError: 帧数据无法解码
+        """
+        if not await self.sampler.should_detect(session_key, img_bytes):
+            return None
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        frame = _PendingFrame(img_bytes, loop, loop.create_future())
+        with self._cond:
+            dropped = self._pending.pop(session_key, None)
+            if dropped is None and len(self._pending) >= self.queue_size:
+                _, dropped = self._pending.popitem(last=False)
+            self._pending[session_key] = frame
+            self._cond.notify()
+        if dropped is not None:
+            self._resolve(dropped, None)
+
+        count = await frame.future
+        self.sampler.record(session_key, None if count == UNDECODABLE else count)
+        if count == UNDECODABLE:
+            raise FrameDecodeError('无法解码图像数据')
+        return count
+
+    def discard(self, session_key):
+        """丢弃会话尚未推理的帧和采样状态（连接断开时调用）"""
+        self.sampler.discard(session_key)
+        with self._cond:
+            frame = self._pending.pop(session_key, None)
+        if frame is not None:
+            self._resolve(frame, None)
+
+    def _next_batch(self):
+        """等待并取出一个批次：凑满batch_size或等待batch_wait后返回"""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.batch_wait
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                batch.append(self._pending.popitem(last=False)[1])
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            # 推理进程全忙时在这里阻塞，新帧留在队列中替换旧帧
+            self._slots.acquire()
+            batch = []
+            try:
+                batch = self._next_batch()
+                now = time.monotonic()
+                fresh = []
+                for frame in batch:
+                    if now - frame.submitted_at > self.max_age:
+                        self._resolve(frame, None)
+                    else:
+                        fresh.append(frame)
+                if not fresh:
+                    self._slots.release()
+                    continue
+                future = self._get_executor().submit(_detect_batch, [frame.img_bytes for frame in fresh])
+                future.add_done_callback(lambda f, frames=fresh: self._on_batch_done(f, frames))
+            except Exception as e:
+                logger.error(f"人数检测调度失败: {e}")
+                self._slots.release()
+                for frame in batch:
+                    self._resolve(frame, None)
+
+    def _on_batch_done(self, future, frames):
+        self._slots.release()
+        try:
+            counts = future.result()
+        except BrokenProcessPool as e:
+            logger.error(f"人数检测推理进程异常退出: {e}")
+            self._executor = None
+            counts = [None] * len(frames)
+        except Exception as e:
+            logger.error(f"人数检测推理失败: {e}")
+            counts = [None] * len(frames)
+        for frame, count in zip(frames, counts):
+            self._resolve(frame, count)
+
+
+person_detector = PersonDetector()
+
+
+class PersonCheckMixin:
+    """
+    消费者的人数检测混入类
+
+    start_person_check()为一帧启动旁路检测任务，检测到多人时推送cheat_detected；
+    切换问题（录制器轮换）和断开连接时调用cancel_person_checks()取消尚未完成的检测。
+    """
+
+    person_checks = None
+
+    def start_person_check(self, img_bytes):
+        if self.person_checks is None:
+            self.person_checks = set()
+        task = asyncio.ensure_future(self._check_persons(img_bytes))
+        self.person_checks.add(task)
+        task.add_done_callback(self.person_checks.discard)
+
+    def cancel_person_checks(self):
+        for task in list(self.person_checks or ()):
+            task.cancel()
+
+    async def _check_persons(self, img_bytes):
+        try:
+            persons = await person_detector.detect(self.channel_name, img_bytes)
+            # persons为None表示该帧被采样跳过、被更新的帧替换或已过期，未做检测
+            if persons is not None and persons > 1:
+                await self.send(text_data=json.dumps({
+                    'type': 'cheat_detected',
+                    'text': '检测到多个人，疑似作弊！'
+                }))
+        except FrameDecodeError:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'text': '无法解码图像数据'
+            }))
+        except Exception as e:
+            logger.error(f"人数检测失败: {str(e)}")
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from interviews.rtasr import AUDIO_BYTES_PER_SECOND, RTASRManager
+from interviews.rtasr_fake import start_fake_server
+
+
+class Command(BaseCommand):
+    help = '模拟多个面试会话并发推送音频，压测RTASR会话管理（默认连接本地模拟服务）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=200, help='并发会话数')
+        parser.add_argument('--seconds', type=float, default=10, help='每个会话推送的音频时长')
+        parser.add_argument('--chunk-ms', type=int, default=40, help='每段音频的时长（毫秒）')
+        parser.add_argument('--url', help='RTASR地址，不指定时启动本地模拟服务')
+        parser.add_argument('--drop-rate', type=float, default=0.0, help='模拟服务每次下发结果后主动断开的概率')
+        parser.add_argument('--delay', type=float, default=0.0, help='模拟服务下发每条结果前的延迟（秒）')
+
+    def handle(self, *args, **options):
+        metrics = asyncio.run(self.run(options))
+        self.stdout.write(json.dumps(metrics, ensure_ascii=False, indent=2))
+
+    async def run(self, options):
+        runner = None
+        url = options['url']
+        if url:
+            manager = RTASRManager(url=url)
+            if not manager.enabled:
+                raise CommandError('未配置XUNFEI_RTASR_APP_ID/XUNFEI_RTASR_API_KEY')
+        else:
+            runner, url = await start_fake_server(drop_rate=options['drop_rate'], delay=options['delay'])
+            self.stdout.write(f'本地模拟RTASR服务: {url}')
+            # 模拟服务不校验签名
+            manager = RTASRManager(url=url, app_id='loadtest', api_key='loadtest')
+        chunk = bytes(AUDIO_BYTES_PER_SECOND * options['chunk_ms'] // 1000)
+        chunks = int(options['seconds'] * 1000 / options['chunk_ms'])
+
+        async def on_result(data):
+            pass
+
+        async def interview(i):
+            session = manager.open(f'loadtest-{i}', on_result)
+            start = time.monotonic()
+            for n in range(chunks):
+                await session.send_audio(chunk)
+                # 按实时速率推送
+                await asyncio.sleep(max(0, start + (n + 1) * options['chunk_ms'] / 1000 - time.monotonic()))
+            await session.end()
+
+        started = time.monotonic()
+        await asyncio.gather(*(interview(i) for i in range(options['sessions'])))
+        # 等待最后的识别结果
+        await asyncio.sleep(2)
+        metrics = manager.metrics()
+        metrics['wall_time'] = round(time.monotonic() - started, 3)
+        await manager.shutdown()
+        if runner is not None:
+            await runner.cleanup()
+        return metrics
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("interviews", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InterviewEvaluationSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scores",
+                    models.JSONField(
+                        default=list,
+                        help_text="按评估维度顺序存储的百分制得分",
+                        verbose_name="各维度得分",
+                    ),
+                ),
+                ("total_score", models.FloatField(default=0, verbose_name="总分")),
+                (
+                    "answer_count",
+                    models.IntegerField(default=0, verbose_name="答题数量"),
+                ),
+                (
+                    "result",
+                    models.JSONField(
+                        default=dict,
+                        help_text="不含lastCompare的完整评估结果",
+                        verbose_name="评估结果",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="生成时间"),
+                ),
+                (
+                    "interview",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="evaluation_snapshot",
+                        to="interviews.interview",
+                        verbose_name="面试",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "面试评估快照",
+                "verbose_name_plural": "面试评估快照",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
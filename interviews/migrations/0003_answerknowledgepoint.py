@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_knowledge_points(apps, schema_editor):
+    InterviewAnswer = apps.get_model("interviews", "InterviewAnswer")
+    AnswerKnowledgePoint = apps.get_model("interviews", "AnswerKnowledgePoint")
+    rows = []
+    for answer in InterviewAnswer.objects.only("id", "knowledge_points").iterator():
+        for point in answer.knowledge_points or []:
+            if point:
+                rows.append(
+                    AnswerKnowledgePoint(answer_id=answer.id, name=str(point)[:200])
+                )
+        if len(rows) >= 1000:
+            AnswerKnowledgePoint.objects.bulk_create(rows)
+            rows = []
+    AnswerKnowledgePoint.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("interviews", "0002_interviewevaluationsnapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnswerKnowledgePoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        db_index=True, max_length=200, verbose_name="知识点"
+                    ),
+                ),
+                (
+                    "answer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="knowledge_point_rows",
+                        to="interviews.interviewanswer",
+                        verbose_name="答题记录",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "答题知识点",
+                "verbose_name_plural": "答题知识点",
+            },
+        ),
+        migrations.RunPython(backfill_knowledge_points, migrations.RunPython.noop),
+    ]
@@ -109,6 +109,18 @@ class InterviewAnswer(models.Model):
         question_str = str(self.question)[:10] if self.question else ''
         return f"{user_str} - {question_str}..."
 
+class AnswerKnowledgePoint(models.Model):
+    """答题知识点（InterviewAnswer.knowledge_points的规范化副本，用于数据库侧分组统计）"""
+    answer = models.ForeignKey(InterviewAnswer, on_delete=models.CASCADE, related_name='knowledge_point_rows', verbose_name='答题记录')
+    name = models.CharField(max_length=200, db_index=True, verbose_name='知识点')
+
+    class Meta:
+        verbose_name = '答题知识点'
+        verbose_name_plural = '答题知识点'
+
+    def __str__(self):
+        return self.name
+
 class CodingProblem(models.Model):
     """代码题模型"""
     DIFFICULTY_CHOICES = [
@@ -170,3 +182,21 @@ class InterviewCodingAnswer(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.problem.title}"
+
+
+class InterviewEvaluationSnapshot(models.Model):
+    """面试评估快照（所有答案评分完成后写入一次，答案变更时失效）"""
+    interview = models.OneToOneField(Interview, on_delete=models.CASCADE, related_name='evaluation_snapshot', verbose_name='面试')
+    scores = models.JSONField(default=list, verbose_name='各维度得分', help_text='按评估维度顺序存储的百分制得分')
+    total_score = models.FloatField(default=0, verbose_name='总分')
+    answer_count = models.IntegerField(default=0, verbose_name='答题数量')
+    result = models.JSONField(default=dict, verbose_name='评估结果', help_text='不含lastCompare的完整评估结果')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='生成时间')
+
+    class Meta:
+        verbose_name = '面试评估快照'
+        verbose_name_plural = '面试评估快照'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"面试{self.interview_id} - {self.total_score}分"
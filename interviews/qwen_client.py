@@ -0,0 +1,90 @@
+"""
+通义千问（DashScope OpenAI兼容模式）共享客户端
+
+进程内所有千问调用共享一个后台事件循环和一个AsyncOpenAI客户端，
+底层httpx连接池在多次调用之间复用，不再每次调用都新建客户端和TLS连接。
+连接复用只在长期运行的ASGI进程中有效：Celery worker配置了CELERY_WORKER_MAX_TASKS_PER_CHILD = 1，
+每个任务都在新的子进程中执行，连接池随进程重建。
+
+用法：
+    client = get_qwen_client()
+    text = client.chat(content)            # 同步调用（Celery任务中使用）
+    text = await client.achat(content)     # 异步调用
+"""
+import asyncio
+import logging
+import threading
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI
+
+from config.background_loop import BackgroundLoop
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'qwen2.5-omni-7b'
+
+
+class QwenClient:
+    """基于AsyncOpenAI的千问流式对话客户端"""
+
+    def __init__(self, api_key=None, base_url=None, max_connections=None, timeout=None):
+        self.api_key = api_key or getattr(settings, 'QWEN_API_KEY', '')
+        self.base_url = base_url or getattr(settings, 'QWEN_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')
+        self.max_connections = max_connections or getattr(settings, 'QWEN_MAX_CONNECTIONS', 8)
+        self.timeout = timeout or getattr(settings, 'QWEN_REQUEST_TIMEOUT', 120)
+        self._background = BackgroundLoop('qwen-client')
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=self.timeout
+            )
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client)
+        return self._client
+
+    async def _chat(self, content, model):
+        completion = await self._get_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": content}],
+            modalities=["text"],
+            stream=True
+        )
+        # 处理流式响应
+        parts = []
+        async for chunk in completion:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        return ''.join(parts)
+
+    def chat(self, content, model=DEFAULT_MODEL):
+        """同步调用，content为字符串或多模态消息列表，返回完整回复文本"""
+        future = self._background.submit(self._chat(content, model))
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def achat(self, content, model=DEFAULT_MODEL):
+        """异步调用，返回完整回复文本"""
+        return await asyncio.wrap_future(self._background.submit(self._chat(content, model)))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_qwen_client():
+    """获取进程内共享的千问客户端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = QwenClient()
+    return _client
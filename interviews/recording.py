@@ -0,0 +1,225 @@
+"""
+面试音视频片段录制
+
+每道题一个ClipRecorder，音频帧和视频帧到达时即写入磁盘，内存占用不随回答时长增长：
+- 音频：16kHz/16bit/单声道PCM，边收边追加到WAV文件
+- 视频：JPEG帧首尾相接追加到一个MJPEG文件，不再逐帧落盘成图片
+
+所有文件写入都在一个共享的写线程中按提交顺序执行，事件循环只负责入队；
+录制结束后由Celery任务interviews.mux_interview_clip调用mux_clip合成mp4。
+"""
+import asyncio
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+import wave
+
+import ffmpeg
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CHANNELS = 1
+AUDIO_SAMPLE_WIDTH = 2
+AUDIO_SAMPLE_RATE = 16000
+VIDEO_FRAME_RATE = 1
+
+
+class _DiskWriter:
+    """共享写线程，按提交顺序执行文件操作"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='clip-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            fn, args, done = self._queue.get()
+            try:
+                fn(*args)
+                if done:
+                    done(None)
+            except Exception as e:
+                logger.error(f"写入音视频片段失败: {e}")
+                if done:
+                    done(e)
+
+    def submit(self, fn, *args):
+        """提交一个写操作，不等待完成"""
+        self._ensure_started()
+        self._queue.put((fn, args, None))
+
+    async def run(self, fn, *args):
+        """提交一个写操作并等待它（及之前提交的所有操作）完成"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def done(error):
+            def set_result():
+                if future.done():
+                    return
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+            loop.call_soon_threadsafe(set_result)
+
+        self._queue.put((fn, args, done))
+        await future
+
+
+_writer = _DiskWriter()
+
+
+class ClipRecorder:
+    """单道题的音视频录制器"""
+
+    def __init__(self, session_id, question_idx, save_dir=None):
+        self.save_dir = save_dir or getattr(settings, 'INTERVIEW_CLIP_DIR', './interview_clips')
+        prefix = os.path.join(self.save_dir, f'{session_id}_q{question_idx+1}')
+        self.audio_path = f'{prefix}.wav'
+        self.video_path = f'{prefix}.mjpeg'
+        self.av_path = f'{prefix}_av.mp4'
+        self.video_only_path = f'{prefix}_video.mp4'
+        self.audio_bytes = 0
+        self.frame_count = 0
+        # 已提交和已写盘的字节数分别只在事件循环线程和写线程中更新，差值即写盘队列中的积压
+        self.submitted_bytes = 0
+        self.written_bytes = 0
+        self._wav = None
+        self._video = None
+
+    # ---------- 事件循环中调用 ----------
+
+    def add_audio(self, pcm_bytes):
+        """追加一段已解码的PCM音频"""
+        if pcm_bytes:
+            self.audio_bytes += len(pcm_bytes)
+            self.submitted_bytes += len(pcm_bytes)
+            _writer.submit(self._write_audio, pcm_bytes)
+
+    def add_frame(self, jpeg_bytes):
+        """追加一帧已解码的JPEG图像"""
+        if jpeg_bytes:
+            self.frame_count += 1
+            self.submitted_bytes += len(jpeg_bytes)
+            _writer.submit(self._write_frame, jpeg_bytes)
+
+    @property
+    def pending_bytes(self):
+        """已提交但尚未写盘的字节数"""
+        return self.submitted_bytes - self.written_bytes
+
+    async def finish(self):
+        """等待所有数据落盘并关闭文件，返回交给合成任务的片段描述"""
+        await _writer.run(self._close_files)
+        return {
+            'audio_path': self.audio_path if self.audio_bytes else None,
+            'video_path': self.video_path if self.frame_count else None,
+            'av_path': self.av_path,
+            'video_only_path': self.video_only_path,
+            'frame_count': self.frame_count,
+            'finished_at': time.time(),
+        }
+
+    def discard(self):
+        """丢弃本题录制内容并删除文件"""
+        _writer.submit(self._remove_files)
+
+    # ---------- 写线程中执行 ----------
+
+    def _write_audio(self, pcm_bytes):
+        if self._wav is None:
+            os.makedirs(self.save_dir, exist_ok=True)
+            self._wav = wave.open(self.audio_path, 'wb')
+            self._wav.setnchannels(AUDIO_CHANNELS)
+            self._wav.setsampwidth(AUDIO_SAMPLE_WIDTH)
+            self._wav.setframerate(AUDIO_SAMPLE_RATE)
+        self._wav.writeframesraw(pcm_bytes)
+        self.written_bytes += len(pcm_bytes)
+
+    def _write_frame(self, jpeg_bytes):
+        if self._video is None:
+            os.makedirs(self.save_dir, exist_ok=True)
+            self._video = open(self.video_path, 'wb')
+        self._video.write(jpeg_bytes)
+        self.written_bytes += len(jpeg_bytes)
+
+    def _close_files(self):
+        # wave在close时回填文件头中的长度
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+        if self._video is not None:
+            self._video.close()
+            self._video = None
+
+    def _remove_files(self):
+        self._close_files()
+        for path in (self.audio_path, self.video_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def build_mux_command(clip):
+    """
+    根据片段描述生成ffmpeg命令
+
+    Returns:
+        (命令参数列表, 输出路径)；无需合成时命令为None
+    """
+    audio_path = clip.get('audio_path')
+    video_path = clip.get('video_path')
+    if video_path:
+        video_stream = ffmpeg.input(video_path, format='mjpeg', framerate=VIDEO_FRAME_RATE)
+    if audio_path and video_path:
+        # 合成带声mp4
+        audio_stream = ffmpeg.input(audio_path)
+        output = ffmpeg.output(video_stream, audio_stream, clip['av_path'], vcodec='libx264', acodec='aac', pix_fmt='yuv420p', shortest=None)
+        return output.overwrite_output().compile(), clip['av_path']
+    if audio_path:
+        return None, audio_path
+    if video_path:
+        # 只合成无声视频
+        output = video_stream.output(clip['video_only_path'], vcodec='libx264', pix_fmt='yuv420p')
+        return output.overwrite_output().compile(), clip['video_only_path']
+    return None, None
+
+
+def mux_clip(clip, timeout=None):
+    """
+    合成片段并清理中间文件（在合成任务进程中调用）
+
+    Returns:
+        (最终文件路径, 耗时统计)；无内容时路径为None
+    """
+    timeout = timeout or getattr(settings, 'INTERVIEW_MUX_TIMEOUT', 300)
+    started_at = time.time()
+    metrics = {
+        'frames': clip.get('frame_count', 0),
+        'queue_wait': round(started_at - clip['finished_at'], 3) if clip.get('finished_at') else None,
+    }
+    cmd, path = build_mux_command(clip)
+    if cmd is not None:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg合成失败({result.returncode}): {result.stderr.decode(errors='ignore')[-500:]}")
+        # 合成成功后删除中间文件，仅有音频时wav即为最终文件
+        for intermediate in (clip.get('audio_path'), clip.get('video_path')):
+            if intermediate and intermediate != path and os.path.exists(intermediate):
+                os.remove(intermediate)
+    metrics['encode'] = round(time.time() - started_at, 3)
+    if path and os.path.exists(path):
+        metrics['size'] = os.path.getsize(path)
+    return path, metrics
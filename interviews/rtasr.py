@@ -0,0 +1,483 @@
+"""
+讯飞实时语音转写（RTASR）会话管理
+
+所有面试会话的RTASR连接都在ASGI事件循环中以协程运行，共享一个aiohttp会话，
+不再每个会话一个阻塞连接加一个接收线程：
+
+- 发送队列有界（RTASR_SEND_QUEUE_SIZE），队列满时send_audio最多等待RTASR_SEND_TIMEOUT秒，
+  仍无空位则丢弃该段音频并计数，上游变慢时不会无限堆积内存
+- 最近尚未得到最终结果的音频保存在环形缓冲中（最多RTASR_REPLAY_SECONDS秒），
+  连接中途断开后自动重连（最多连续RTASR_MAX_RECONNECTS次，指数退避），并先重发缓冲中的音频
+- 每个会话记录发送量、丢弃量、重连次数和结果延迟，会话关闭时写日志，rtasr_manager.metrics()汇总
+
+讯飞RTASR协议一条连接只能承载一路音频，会话之间共享的是事件循环、连接池和配置，而不是同一条连接。
+
+用法：
+    session = rtasr_manager.open(key, on_result=self.handle_asr_result, on_status=self.on_asr_status)
+    await session.send_audio(pcm_bytes)
+    await session.end()                    # 一段语音结束，之后再有音频时自动重新建立连接
+    await rtasr_manager.close(key)
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import deque
+from urllib.parse import quote
+
+import aiohttp
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+AUDIO_BYTES_PER_SECOND = 16000 * 2  # 16kHz/16bit/单声道PCM
+END_MESSAGE = '{"end": true}'
+LATENCY_SAMPLES = 200
+
+_END = object()
+
+
+class RTASRError(Exception):
+    """RTASR握手失败或服务端返回错误"""
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 3)
+
+
+def parse_result(data):
+    """
+    解析结果数据（action=result的data字段）
+
+    结构为 cn.st.rt[].ws[].cw[].w，type为0表示一句话的最终结果，1表示中间结果
+
+    Returns:
+        (seg_id, 文本, 是否最终结果)；格式不符时返回None
+    """
+    try:
+        obj = json.loads(data) if isinstance(data, str) else data
+        st = obj['cn']['st']
+        text = ''.join(
+            cw['w']
+            for rt in st.get('rt', [])
+            for ws in rt.get('ws', [])
+            for cw in ws.get('cw', [])[:1]  # 每个词位只取第一候选
+        )
+        return obj.get('seg_id'), text, str(st.get('type')) == '0'
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def is_final_result(data):
+    """结果数据是否为一句话的最终结果"""
+    parsed = parse_result(data)
+    return bool(parsed and parsed[2])
+
+
+class Transcript:
+    """
+    增量拼装一次回答的转写文本
+
+    已确定的句子追加到sentences，当前句只保留最新的中间结果，
+    中间结果不会重复进入答案；每条结果只返回发生变化的那一句，供推送给前端。
+    """
+
+    def __init__(self):
+        self.sentences = []
+        self.partial = ''
+        self._last_seg_id = None
+
+    def feed(self, data):
+        """
+        处理一条识别结果
+
+        Returns:
+            {'sentence': 句子序号, 'text': 该句最新文本, 'final': 是否最终结果}；
+            无法解析、过期或空结果时返回None
+        """
+        parsed = parse_result(data)
+        if parsed is None:
+            return None
+        seg_id, text, final = parsed
+        if seg_id is not None:
+            # 重连后服务端的seg_id从0重新开始，其余情况下序号不大于已处理序号的结果为重复或乱序
+            if self._last_seg_id is not None and 0 < seg_id <= self._last_seg_id:
+                return None
+            self._last_seg_id = seg_id
+        if not text and not self.partial:
+            return None
+        update = {'sentence': len(self.sentences), 'text': text, 'final': final}
+        if final:
+            if text:
+                self.sentences.append(text)
+            self.partial = ''
+        else:
+            self.partial = text
+        return update
+
+    def add_sentence(self, text):
+        """追加一句非识别来源的文本（如手动输入）"""
+        if self.partial:
+            self.sentences.append(self.partial)
+            self.partial = ''
+        self.sentences.append(text)
+
+    def text(self):
+        """完整回答文本，包含尚未确定的当前句"""
+        return ''.join(self.sentences) + self.partial
+
+    def reset(self):
+        self.sentences = []
+        self.partial = ''
+
+
+class RTASRSession:
+    """单个面试会话的RTASR连接"""
+
+    def __init__(self, manager, key, on_result, on_status=None):
+        self.manager = manager
+        self.key = key
+        self.on_result = on_result
+        self.on_status = on_status
+        self.failed = False
+        self.closed = False
+        self._queue = asyncio.Queue(maxsize=manager.queue_size)
+        self._replay = deque()
+        self._replay_bytes = 0
+        self._queued_bytes = 0
+        self._pending_since = None  # 最早一段还没有得到识别结果的音频的发送时间
+        self._end_sent_at = None
+        self._ws = None
+        self._first_chunk = None  # 空闲后到达的第一段音频，建立连接后发送
+        self._results = asyncio.Queue()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {
+            'connects': 0,
+            'reconnects': 0,
+            'chunks_sent': 0,
+            'bytes_sent': 0,
+            'chunks_dropped': 0,
+            'chunks_replayed': 0,
+            'results': 0,
+            'end_latency': None,
+        }
+        self._dispatcher = asyncio.ensure_future(self._dispatch_results())
+        self._task = asyncio.ensure_future(self._run())
+
+    @property
+    def connected(self):
+        return self._ws is not None and not self._ws.closed
+
+    @property
+    def buffered_bytes(self):
+        """发送队列和重发缓冲中的音频字节数"""
+        return self._queued_bytes + self._replay_bytes
+
+    # ---------- 提供给消费者的接口 ----------
+
+    async def send_audio(self, chunk):
+        """发送一段PCM音频，返回是否入队（会话失败、已关闭或队列持续满时返回False）"""
+        if self.failed or self.closed or not chunk:
+            return False
+        try:
+            await asyncio.wait_for(self._queue.put(chunk), self.manager.send_timeout)
+            self._queued_bytes += len(chunk)
+            return True
+        except asyncio.TimeoutError:
+            self.stats['chunks_dropped'] += 1
+            logger.warning(f"RTASR会话 {self.key} 发送队列已满，丢弃一段音频")
+            return False
+
+    async def end(self):
+        """通知服务端当前这段语音结束"""
+        if not self.failed and not self.closed:
+            await self._queue.put(_END)
+
+    def metrics(self):
+        latencies = list(self._latencies)
+        return dict(
+            self.stats,
+            queued=self._queue.qsize(),
+            latency_p50=_percentile(latencies, 0.5),
+            latency_p95=_percentile(latencies, 0.95),
+        )
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for task in (self._task, self._dispatcher):
+            task.cancel()
+        await asyncio.gather(self._task, self._dispatcher, return_exceptions=True)
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+        logger.info(f"RTASR会话 {self.key} 关闭: {self.metrics()}")
+
+    # ---------- 连接管理 ----------
+
+    async def _notify(self, status):
+        if self.on_status:
+            try:
+                await self.on_status(status)
+            except Exception as e:
+                logger.error(f"RTASR状态回调失败: {e}")
+
+    def _remember(self, chunk):
+        """把已发送的音频放入重发缓冲，超出时长上限时丢弃最早的部分"""
+        self._replay.append(chunk)
+        self._replay_bytes += len(chunk)
+        while self._replay_bytes > self.manager.replay_bytes and len(self._replay) > 1:
+            self._replay_bytes -= len(self._replay.popleft())
+
+    def _clear_replay(self):
+        self._replay.clear()
+        self._replay_bytes = 0
+
+    async def _next_audio(self):
+        """空闲时等待下一段音频（跳过多余的结束标记）"""
+        while True:
+            item = self._dequeued(await self._queue.get())
+            if item is not _END:
+                return item
+
+    def _dequeued(self, item):
+        if item is not _END:
+            self._queued_bytes -= len(item)
+        return item
+
+    async def _run(self):
+        attempts = 0
+        announced = False  # 是否已通知消费者“已连接”，空闲后的按需重连不再重复通知
+        idle = True  # 没有待识别的音频时不保持连接，等音频到达再连
+        while not self.closed:
+            if idle and not self._replay and self._first_chunk is None:
+                self._first_chunk = await self._next_audio()
+            try:
+                self._ws = await self.manager.connect()
+            except Exception as e:
+                attempts += 1
+                logger.warning(f"RTASR会话 {self.key} 连接失败（第{attempts}次）: {e}")
+                if attempts > self.manager.max_reconnects:
+                    self.failed = True
+                    self._clear_replay()
+                    while not self._queue.empty():
+                        self._dequeued(self._queue.get_nowait())
+                    await self._notify('failed')
+                    return
+                announced = False
+                await self._notify('reconnecting')
+                await asyncio.sleep(min(self.manager.backoff * 2 ** (attempts - 1), 10))
+                continue
+            if self.stats['connects'] and not idle:
+                self.stats['reconnects'] += 1  # 只统计意外断开后的重连
+            self.stats['connects'] += 1
+            attempts = 0
+            if not announced:
+                announced = True
+                await self._notify('connected')
+            try:
+                idle = await self._stream(self._ws)
+            except Exception as e:
+                logger.warning(f"RTASR会话 {self.key} 连接中断: {e}")
+                idle = False
+            finally:
+                await self._ws.close()
+                self._ws = None
+
+    async def _stream(self, ws):
+        """在一条连接上发送音频，返回True表示语音正常结束，False表示连接意外断开"""
+        reader = asyncio.ensure_future(self._read(ws))
+        try:
+            # 先重发上一条连接上还没有得到最终结果的音频
+            for chunk in list(self._replay):
+                await ws.send_bytes(chunk)
+                self.stats['chunks_replayed'] += 1
+            if self._replay and self._pending_since is None:
+                self._pending_since = time.monotonic()
+            if self._first_chunk is not None:
+                await self._send_chunk(ws, self._first_chunk)
+                self._first_chunk = None
+            while True:
+                getter = asyncio.ensure_future(self._queue.get())
+                await asyncio.wait({getter, reader}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    # 服务端断开（如长时间静音超时）；没有待识别音频时等下一段音频再连
+                    return not self._replay
+                item = self._dequeued(getter.result())
+                if item is _END:
+                    self._end_sent_at = time.monotonic()
+                    await ws.send_str(END_MESSAGE)
+                    await asyncio.wait_for(asyncio.shield(reader), self.manager.connect_timeout)
+                    self._clear_replay()
+                    return True
+                await self._send_chunk(ws, item)
+        except asyncio.TimeoutError:
+            logger.warning(f"RTASR会话 {self.key} 等待最终结果超时")
+            return True
+        finally:
+            if not reader.done():
+                reader.cancel()
+            elif not reader.cancelled() and reader.exception():
+                logger.warning(f"RTASR会话 {self.key} 读取结果失败: {reader.exception()}")
+
+    async def _send_chunk(self, ws, chunk):
+        # 先放入重发缓冲，发送失败时重连后会重发
+        self._remember(chunk)
+        await ws.send_bytes(chunk)
+        self.stats['chunks_sent'] += 1
+        self.stats['bytes_sent'] += len(chunk)
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+
+    async def _read(self, ws):
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            message = json.loads(msg.data)
+            action = message.get('action')
+            if action == 'result':
+                self._on_result(message['data'])
+            elif action == 'error':
+                logger.warning(f"RTASR会话 {self.key} 服务端错误: {msg.data}")
+                break
+        if self._end_sent_at is not None:
+            self.stats['end_latency'] = round(time.monotonic() - self._end_sent_at, 3)
+            self._end_sent_at = None
+
+    def _on_result(self, data):
+        now = time.monotonic()
+        self.stats['results'] += 1
+        if self._pending_since is not None:
+            self._latencies.append(now - self._pending_since)
+            self._pending_since = None
+        if is_final_result(data):
+            # 已经得到最终结果的音频无需在重连后重发
+            self._clear_replay()
+        self._results.put_nowait(data)
+
+    async def _dispatch_results(self):
+        """按顺序回调识别结果，回调较慢时不阻塞连接上的读取"""
+        while True:
+            data = await self._results.get()
+            try:
+                await self.on_result(data)
+            except Exception as e:
+                logger.error(f"RTASR结果回调失败: {e}")
+
+
+class RTASRManager:
+    """进程内RTASR会话的注册表和共享连接配置"""
+
+    def __init__(self, url=None, app_id=None, api_key=None):
+        self.url = url or getattr(settings, 'RTASR_URL', 'ws://rtasr.xfyun.cn/v1/ws')
+        # 凭据只从配置或环境变量读取，缺失时不启用RTASR
+        self.app_id = app_id or getattr(settings, 'XUNFEI_RTASR_APP_ID', os.environ.get('XUNFEI_RTASR_APP_ID', ''))
+        self.api_key = api_key or getattr(settings, 'XUNFEI_RTASR_API_KEY', os.environ.get('XUNFEI_RTASR_API_KEY', ''))
+        self.queue_size = getattr(settings, 'RTASR_SEND_QUEUE_SIZE', 50)
+        self.send_timeout = getattr(settings, 'RTASR_SEND_TIMEOUT', 1.0)
+        self.replay_bytes = int(getattr(settings, 'RTASR_REPLAY_SECONDS', 5) * AUDIO_BYTES_PER_SECOND)
+        self.max_reconnects = getattr(settings, 'RTASR_MAX_RECONNECTS', 5)
+        self.connect_timeout = getattr(settings, 'RTASR_CONNECT_TIMEOUT', 10)
+        self.backoff = 0.5
+        self.sessions = {}
+        self._http = None
+        self._http_loop = None
+
+    @property
+    def enabled(self):
+        return bool(self.app_id and self.api_key)
+
+    def _get_http(self):
+        # aiohttp会话绑定创建时的事件循环，换循环时旧会话回到它自己的循环上关闭
+        loop = asyncio.get_running_loop()
+        if self._http is not None and not self._http.closed and self._http_loop is not loop:
+            self._close_http()
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+            self._http_loop = loop
+        return self._http
+
+    def _close_http(self):
+        old, old_loop = self._http, self._http_loop
+        self._http = self._http_loop = None
+        if old is None or old.closed:
+            return
+        if old_loop.is_closed():
+            # 循环已关闭，连接随循环一起失效，只释放连接器持有的资源
+            old.detach()
+            return
+        if old_loop is asyncio.get_running_loop():
+            asyncio.ensure_future(old.close())
+        else:
+            asyncio.run_coroutine_threadsafe(old.close(), old_loop)
+
+    def _create_url(self):
+        ts = str(int(time.time()))
+        base_string = hashlib.md5((self.app_id + ts).encode('utf-8')).hexdigest()
+        signa = hmac.new(self.api_key.encode('utf-8'), base_string.encode('utf-8'), hashlib.sha1).digest()
+        signa = base64.b64encode(signa).decode('utf-8')
+        return f"{self.url}?appid={self.app_id}&ts={ts}&signa={quote(signa)}"
+
+    async def connect(self):
+        """建立一条RTASR连接并完成握手"""
+        ws = await self._get_http().ws_connect(self._create_url(), timeout=self.connect_timeout, heartbeat=30)
+        try:
+            msg = await ws.receive(timeout=self.connect_timeout)
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                raise RTASRError(f"握手失败: {msg.type}")
+            message = json.loads(msg.data)
+            if message.get('action') != 'started':
+                raise RTASRError(f"握手失败: {msg.data}")
+        except BaseException:
+            await ws.close()
+            raise
+        return ws
+
+    def open(self, key, on_result, on_status=None):
+        """为一个面试会话打开RTASR会话（需在事件循环中调用），未配置凭据时返回None"""
+        if not self.enabled:
+            logger.error("未配置XUNFEI_RTASR_APP_ID/XUNFEI_RTASR_API_KEY，实时语音转写不可用")
+            return None
+        if key in self.sessions:
+            asyncio.ensure_future(self.sessions.pop(key).close())
+        session = self.sessions[key] = RTASRSession(self, key, on_result, on_status)
+        return session
+
+    async def close(self, key):
+        session = self.sessions.pop(key, None)
+        if session is not None:
+            await session.close()
+
+    async def shutdown(self):
+        """关闭所有会话和共享的aiohttp会话"""
+        for key in list(self.sessions):
+            await self.close(key)
+        http, self._http, self._http_loop = self._http, None, None
+        if http is not None and not http.closed:
+            await http.close()
+
+    def metrics(self):
+        """汇总当前所有会话的指标"""
+        per_session = {key: session.metrics() for key, session in self.sessions.items()}
+        totals = {
+            name: sum(m[name] for m in per_session.values())
+            for name in ('reconnects', 'chunks_sent', 'bytes_sent', 'chunks_dropped', 'chunks_replayed', 'results')
+        }
+        totals['sessions'] = len(per_session)
+        totals['failed'] = sum(1 for session in self.sessions.values() if session.failed)
+        latencies = [lat for session in self.sessions.values() for lat in session._latencies]
+        totals['latency_p50'] = _percentile(latencies, 0.5)
+        totals['latency_p95'] = _percentile(latencies, 0.95)
+        return totals
+
+
+rtasr_manager = RTASRManager()
@@ -0,0 +1,83 @@
+"""
+本地模拟RTASR服务，用于压测和重连测试
+
+协议与讯飞RTASR一致：握手成功后下发action=started；收到二进制音频后每0.2秒音频下发一次
+中间结果（type=1），每2秒音频下发一次最终结果（type=0）并开始新的一句；收到{"end": true}后
+下发剩余内容的最终结果并关闭连接。drop_rate大于0时每次下发结果后按该概率主动断开连接。
+"""
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+from .rtasr import AUDIO_BYTES_PER_SECOND
+
+PARTIAL_BYTES = AUDIO_BYTES_PER_SECOND // 5
+SENTENCE_BYTES = AUDIO_BYTES_PER_SECOND * 2
+WORDS = '我认为这个问题可以从原理和实践两个方面来回答'
+
+
+def build_result(seg_id, text, final):
+    data = {
+        'cn': {
+            'st': {
+                'bg': '0',
+                'ed': '0',
+                'rt': [{'ws': [{'cw': [{'w': ch, 'wp': 'n'}], 'wb': i, 'we': i + 1} for i, ch in enumerate(text)]}],
+                'type': '0' if final else '1',
+            }
+        },
+        'seg_id': seg_id,
+    }
+    return json.dumps({'action': 'result', 'code': '0', 'data': json.dumps(data, ensure_ascii=False), 'desc': 'success', 'sid': 'fake'})
+
+
+def create_app(drop_rate=0.0, delay=0.0):
+    async def handle(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str(json.dumps({'action': 'started', 'code': '0', 'data': '', 'desc': 'success', 'sid': 'fake'}))
+        seg_id = 0
+        sentence_bytes = 0
+        since_partial = 0
+
+        async def emit(final):
+            nonlocal seg_id, sentence_bytes
+            length = max(1, sentence_bytes * len(WORDS) // SENTENCE_BYTES)
+            if delay:
+                await asyncio.sleep(delay)
+            await ws.send_str(build_result(seg_id, WORDS[:length], final))
+            seg_id += 1  # 每条结果一个序号，中间结果和最终结果都递增
+            if final:
+                sentence_bytes = 0
+            return drop_rate and random.random() < drop_rate
+
+        async for msg in ws:
+            if msg.type == web.WSMsgType.BINARY:
+                sentence_bytes += len(msg.data)
+                since_partial += len(msg.data)
+                if since_partial >= PARTIAL_BYTES:
+                    since_partial = 0
+                    if await emit(sentence_bytes >= SENTENCE_BYTES):
+                        break
+            elif msg.type == web.WSMsgType.TEXT:
+                if sentence_bytes:
+                    await emit(True)
+                break
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/v1/ws', handle)
+    return app
+
+
+async def start_fake_server(host='127.0.0.1', port=0, drop_rate=0.0, delay=0.0):
+    """启动模拟服务，返回(runner, ws地址)"""
+    runner = web.AppRunner(create_app(drop_rate, delay))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'ws://{host}:{port}/v1/ws'
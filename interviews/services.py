@@ -17,7 +17,6 @@ from urllib.parse import urlencode, quote, urlparse
 from urllib3 import encode_multipart_formdata
 from wsgiref.handlers import format_date_time
 import websocket
-from websocket import create_connection, WebSocketConnectionClosedException
 
 from django.conf import settings
 from django.db import models
@@ -127,69 +126,6 @@ class XunfeiRealtimeTranscribeClient:
         except Exception:
             pass
 
-class XunfeiRTASRClient:
-    def __init__(self, app_id, api_key, on_result=None):
-        self.app_id = app_id
-        self.api_key = api_key
-        self.on_result = on_result
-        self.ws = None
-        self.trecv = None
-        self.connected = False
-        self.closed = False
-
-    def connect(self):
-        base_url = "ws://rtasr.xfyun.cn/v1/ws"
-        ts = str(int(time.time()))
-        tt = (self.app_id + ts).encode('utf-8')
-        md5 = hashlib.md5()
-        md5.update(tt)
-        baseString = md5.hexdigest()
-        baseString = bytes(baseString, encoding='utf-8')
-        apiKey = self.api_key.encode('utf-8')
-        signa = hmac.new(apiKey, baseString, hashlib.sha1).digest()
-        signa = base64.b64encode(signa)
-        signa = str(signa, 'utf-8')
-        url = base_url + "?appid=" + self.app_id + "&ts=" + ts + "&signa=" + quote(signa)
-        self.ws = create_connection(url)
-        self.connected = True
-        self.trecv = threading.Thread(target=self.recv)
-        self.trecv.start()
-
-    def send_audio(self, audio_bytes, is_last=False):
-        if self.connected and not self.closed:
-            self.ws.send(audio_bytes, opcode=2)  # opcode=2 for binary
-            if is_last:
-                self.ws.send(b'{"end": true}')
-
-    def recv(self):
-        try:
-            while self.ws.connected:
-                result = str(self.ws.recv())
-                if len(result) == 0:
-                    break
-                result_dict = json.loads(result)
-                if result_dict["action"] == "result":
-                    if self.on_result:
-                        self.on_result(result_dict["data"])
-                if result_dict["action"] == "error":
-                    if self.on_result:
-                        self.on_result("[RTASR错误] " + result)
-                    self.ws.close()
-                    self.closed = True
-                    return
-        except WebSocketConnectionClosedException:
-            self.closed = True
-        except Exception as e:
-            self.closed = True
-            if self.on_result:
-                self.on_result(f"[RTASR异常] {str(e)}")
-
-    def close(self):
-        if self.ws:
-            self.ws.close()
-        self.connected = False
-        self.closed = True 
-
 class XunfeiTranscriptionService:
     def __init__(self):
         self.Host = "ost-api.xfyun.cn"
@@ -736,117 +672,43 @@ from knowledge_base.services import XunfeiSparkService
 class InterviewEvaluationService:
     """面试评估服务"""
     
+    # 评估维度及其对应的答案评分字段
+    DIMENSION_FIELDS = [
+        ('专业知识水平', 'professional_knowledge'),
+        ('技能匹配度', 'skill_matching'),
+        ('语言表达能力', 'communication_skills'),
+        ('逻辑思维能力', 'logical_thinking'),
+        ('创新能力', 'innovation_ability'),
+        ('应变抗压能力', 'stress_handling'),
+    ]
+    
     def __init__(self):
         self.spark_service = XunfeiSparkService()
     
     def get_evaluation_result(self, interview_id):
-        """获取面试评估结果"""
-        from .models import Interview, InterviewAnswer
+        """获取面试评估结果（优先读取已保存的评估快照）"""
+        from .models import Interview, InterviewAnswer, InterviewEvaluationSnapshot
         
         try:
-            # 获取面试记录及其所有答案
             interview = Interview.objects.get(id=interview_id)
-            answers = InterviewAnswer.objects.filter(interview=interview)
-            
-            if not answers.exists():
-                return None
-            
-            # 计算六个维度的平均分
-            dimensions = [
-                '专业知识水平', '技能匹配度', '语言表达能力',
-                '逻辑思维能力', '创新能力', '应变抗压能力'
-            ]
-            
-            scores = []
-            for dimension in dimensions:
-                field_name = {
-                    '专业知识水平': 'professional_knowledge',
-                    '技能匹配度': 'skill_matching',
-                    '语言表达能力': 'communication_skills',
-                    '逻辑思维能力': 'logical_thinking',
-                    '创新能力': 'innovation_ability',
-                    '应变抗压能力': 'stress_handling'
-                }[dimension]
-                
-                avg_score = answers.aggregate(
-                    avg_score=models.Avg(field_name)
-                )['avg_score'] or 0
-                scores.append(round(avg_score * 20, 1))  # 转换为百分制
-            
-            # 生成雷达图评论
-            radar_comment = self._generate_radar_comment(dimensions, scores)
-            
-            # 统计知识点分布
-            knowledge_points = {}
-            for answer in answers:
-                if answer.knowledge_points:
-                    for point in answer.knowledge_points:
-                        knowledge_points[point] = knowledge_points.get(point, 0) + 1
-            
-            # 转换为饼图数据
-            pie_points = [
-                {'label': point, 'value': count}
-                for point, count in knowledge_points.items()
-            ]
-            
-            # 生成饼图评论
-            pie_comment = self._generate_pie_comment(pie_points)
-            
-            # 计算知识点掌握情况
-            mastery_data = {}
-            for answer in answers:
-                if answer.knowledge_points and answer.correctness_score:
-                    for point in answer.knowledge_points:
-                        if point not in mastery_data:
-                            mastery_data[point] = {'total': 0, 'count': 0}
-                        mastery_data[point]['total'] += answer.correctness_score
-                        mastery_data[point]['count'] += 1
+            dimensions = [label for label, field in self.DIMENSION_FIELDS]
             
-            # 转换为柱状图数据
-            bar_labels = []
-            bar_accuracy = []
-            for point, data in mastery_data.items():
-                bar_labels.append(point)
-                accuracy = data['total'] / (data['count'] * 5)  # 转换为0-1的比例
-                bar_accuracy.append(round(accuracy, 2))
-            
-            # 生成柱状图评论
-            bar_comment = self._generate_bar_comment(bar_labels, bar_accuracy)
-            
-            # 计算总分
-            total_score = round(sum(scores) / len(scores), 1)
-            
-            # 获取上一次面试结果进行对比
-            last_compare = self._get_last_compare_result(interview, dimensions, scores)
+            snapshot = InterviewEvaluationSnapshot.objects.filter(interview=interview).first()
+            if snapshot:
+                result = dict(snapshot.result)
+                scores = snapshot.scores
+            else:
+                answers = InterviewAnswer.objects.filter(interview=interview)
+                result = self._build_evaluation(interview, answers)
+                if not result:
+                    return None
+                scores = result['radar']['data']['scores']
+                if self._all_answers_scored(answers):
+                    self._save_snapshot(interview, answers, result)
             
-            # 生成总结
-            summary = self._generate_summary(interview, answers, scores, knowledge_points)
-            
-            return {
-                'radar': {
-                    'data': {
-                        'dimensions': dimensions,
-                        'scores': scores
-                    },
-                    'comment': radar_comment
-                },
-                'pie': {
-                    'data': {
-                        'points': pie_points
-                    },
-                    'comment': pie_comment
-                },
-                'bar': {
-                    'data': {
-                        'labels': bar_labels,
-                        'accuracy': bar_accuracy
-                    },
-                    'comment': bar_comment
-                },
-                'score': total_score,
-                'lastCompare': last_compare,
-                'summary': summary
-            }
+            # lastCompare只比较两份已有的得分向量，不再递归生成上一次面试的评估
+            result['lastCompare'] = self._get_last_compare_result(interview, dimensions, scores)
+            return result
             
         except Interview.DoesNotExist:
             return None
@@ -854,14 +716,194 @@ class InterviewEvaluationService:
             print(f"生成评估结果时出错: {e}")
             return None
     
-    def _generate_radar_comment(self, dimensions, scores):
-        """生成雷达图评论"""
-        try:
-            # 找出最高和最低分的维度
-            max_score_idx = scores.index(max(scores))
-            min_score_idx = scores.index(min(scores))
+    def refresh_evaluation_snapshot(self, interview_id):
+        """所有答案评分完成后生成并保存评估快照，已有快照时直接返回"""
+        from .models import InterviewAnswer, InterviewEvaluationSnapshot
+        
+        snapshot = InterviewEvaluationSnapshot.objects.filter(interview_id=interview_id).first()
+        if snapshot:
+            return snapshot
+        
+        answers = InterviewAnswer.objects.filter(interview_id=interview_id).select_related('interview')
+        if not self._all_answers_scored(answers):
+            return None
+        
+        interview = answers.first().interview
+        result = self._build_evaluation(interview, answers)
+        if not result:
+            return None
+        return self._save_snapshot(interview, answers, result)
+    
+    def _all_answers_scored(self, answers):
+        """判断面试的所有答案是否都已完成AI评分"""
+        return answers.exists() and not answers.filter(
+            models.Q(ai_analysis__isnull=True) | models.Q(ai_analysis='')
+        ).exists()
+    
+    def _save_snapshot(self, interview, answers, result):
+        """保存评估快照（不含lastCompare）"""
+        from .models import InterviewEvaluationSnapshot
+        
+        result = {key: value for key, value in result.items() if key != 'lastCompare'}
+        snapshot, _ = InterviewEvaluationSnapshot.objects.update_or_create(
+            interview=interview,
+            defaults={
+                'scores': result['radar']['data']['scores'],
+                'total_score': result['score'],
+                'answer_count': answers.count(),
+                'result': result,
+            }
+        )
+        return snapshot
+    
+    def _get_dimension_scores(self, answers):
+        """一次聚合查询计算六个维度的平均分（百分制）"""
+        averages = answers.aggregate(**{
+            field_name: models.Avg(field_name) for dimension, field_name in self.DIMENSION_FIELDS
+        })
+        return [
+            round((averages[field_name] or 0) * 20, 1)  # 转换为百分制
+            for dimension, field_name in self.DIMENSION_FIELDS
+        ]
+    
+    def _get_knowledge_point_stats(self, answers):
+        """
+        一次分组查询统计知识点出现次数和掌握度
+        
+        Returns:
+            (counts, mastery): counts为{知识点: 出现次数}；
+            mastery为{知识点: 掌握度(0-1)}，只统计已有正确性评分的答案
+        """
+        from .models import AnswerKnowledgePoint
+        
+        scored = models.Q(answer__correctness_score__gt=0)
+        rows = (
+            AnswerKnowledgePoint.objects
+            .filter(answer__in=answers)
+            .values('name')
+            .annotate(
+                count=models.Count('id'),
+                scored_total=models.Sum('answer__correctness_score', filter=scored),
+                scored_count=models.Count('id', filter=scored),
+                first_id=models.Min('id'),
+            )
+            .order_by('first_id')
+        )
+        
+        counts = {}
+        mastery = {}
+        for row in rows:
+            counts[row['name']] = row['count']
+            if row['scored_count']:
+                mastery[row['name']] = round(row['scored_total'] / (row['scored_count'] * 5), 2)  # 转换为0-1的比例
+        return counts, mastery
+    
+    def _get_interview_scores(self, interview):
+        """获取面试的各维度得分，优先使用评估快照"""
+        from .models import InterviewAnswer, InterviewEvaluationSnapshot
+        
+        snapshot = InterviewEvaluationSnapshot.objects.filter(interview=interview).only('scores').first()
+        if snapshot:
+            return snapshot.scores
+        answers = InterviewAnswer.objects.filter(interview=interview)
+        if not answers.exists():
+            return None
+        return self._get_dimension_scores(answers)
+    
+    def _build_evaluation(self, interview, answers):
+        """计算面试评估结果（不含lastCompare）"""
+        if not answers.exists():
+            return None
+        
+        # 计算六个维度的平均分
+        dimensions = [label for label, field in self.DIMENSION_FIELDS]
+        scores = self._get_dimension_scores(answers)
+        
+        # 统计知识点分布及掌握情况
+        knowledge_points, mastery_data = self._get_knowledge_point_stats(answers)
+        
+        # 转换为饼图数据
+        pie_points = [
+            {'label': point, 'value': count}
+            for point, count in knowledge_points.items()
+        ]
+        
+        # 转换为柱状图数据
+        bar_labels = list(mastery_data.keys())
+        bar_accuracy = list(mastery_data.values())
+        
+        # 计算总分
+        total_score = round(sum(scores) / len(scores), 1)
+        
+        # 并发生成雷达图、饼图、柱状图评论和总结，超时的部分使用模板文本
+        comment_requests = {
+            'radar': self._radar_comment_prompt(dimensions, scores),
+            'pie': self._pie_comment_prompt(pie_points),
+            'bar': self._bar_comment_prompt(bar_labels, bar_accuracy),
+        }
+        comment_requests.update(self._summary_prompts(interview, answers, scores, knowledge_points))
+        comments = self._generate_comments(comment_requests)
+        
+        radar_comment = comments['radar']
+        pie_comment = comments['pie']
+        bar_comment = comments['bar']
+        summary = {
+            'starStructure': comments['starStructure'],
+            'technicalSummary': comments['technicalSummary']
+        }
+        
+        return {
+            'radar': {
+                'data': {
+                    'dimensions': dimensions,
+                    'scores': scores
+                },
+                'comment': radar_comment
+            },
+            'pie': {
+                'data': {
+                    'points': pie_points
+                },
+                'comment': pie_comment
+            },
+            'bar': {
+                'data': {
+                    'labels': bar_labels,
+                    'accuracy': bar_accuracy
+                },
+                'comment': bar_comment
+            },
+            'score': total_score,
+            'summary': summary
+        }
+    
+    def _generate_comments(self, comment_requests):
+        """
+        并发调用大模型生成各项评论，共享一个总截止时间
+        
+        Args:
+            comment_requests: {key: (prompt, fallback)}，prompt为None时直接使用fallback
             
-            prompt = f"""请根据以下面试能力评估数据，生成一句简短的点评：
+        Returns:
+            {key: 评论文本}，未在截止时间内返回的评论使用fallback
+        """
+        prompts = {key: prompt for key, (prompt, fallback) in comment_requests.items() if prompt}
+        deadline = getattr(settings, 'EVALUATION_LLM_DEADLINE', 10)
+        results = self.spark_service._send_messages(prompts, timeout=deadline) if prompts else {}
+        
+        comments = {}
+        for key, (prompt, fallback) in comment_requests.items():
+            text = results.get(key)
+            comments[key] = text.strip() if text and text.strip() else fallback
+        return comments
+    
+    def _radar_comment_prompt(self, dimensions, scores):
+        """构建雷达图评论提示词"""
+        # 找出最高和最低分的维度
+        max_score_idx = scores.index(max(scores))
+        min_score_idx = scores.index(min(scores))
+        
+        prompt = f"""请根据以下面试能力评估数据，生成一句简短的点评：
 
 各维度得分：
 {dimensions[max_score_idx]}: {scores[max_score_idx]}分（最高）
@@ -872,20 +914,17 @@ class InterviewEvaluationService:
 2. 突出优势，指出改进方向
 3. 语气要积极专业
 """
-            comment = self.spark_service._send_message(prompt)
-            return comment.strip() if comment else f"{dimensions[max_score_idx]}表现突出，{dimensions[min_score_idx]}方面需加强。"
-            
-        except Exception as e:
-            print(f"生成雷达图评论出错: {e}")
-            return f"{dimensions[max_score_idx]}表现突出，{dimensions[min_score_idx]}方面需加强。"
+        return prompt, f"{dimensions[max_score_idx]}表现突出，{dimensions[min_score_idx]}方面需加强。"
     
-    def _generate_pie_comment(self, points):
-        """生成知识点分布评论"""
-        try:
-            # 按数量排序
-            sorted_points = sorted(points, key=lambda x: x['value'], reverse=True)
-            
-            prompt = f"""请根据以下知识点分布数据，生成一句简短的点评：
+    def _pie_comment_prompt(self, points):
+        """构建知识点分布评论提示词"""
+        if not points:
+            return None, "题目分布较均衡，建议系统性复习。"
+        
+        # 按数量排序
+        sorted_points = sorted(points, key=lambda x: x['value'], reverse=True)
+        
+        prompt = f"""请根据以下知识点分布数据，生成一句简短的点评：
 
 知识点分布：
 {sorted_points[0]['label']}: {sorted_points[0]['value']}次（最多）
@@ -896,24 +935,18 @@ class InterviewEvaluationService:
 2. 评价分布是否均衡
 3. 给出针对性建议
 """
-            comment = self.spark_service._send_message(prompt)
-            return comment.strip() if comment else f"题目分布较均衡，建议重点巩固{sorted_points[0]['label']}模块。"
-            
-        except Exception as e:
-            print(f"生成知识点分布评论出错: {e}")
-            return "题目分布较均衡，建议系统性复习。"
+        return prompt, f"题目分布较均衡，建议重点巩固{sorted_points[0]['label']}模块。"
     
-    def _generate_bar_comment(self, labels, accuracy):
-        """生成知识点掌握评论"""
-        try:
-            if not labels or not accuracy:
-                return "暂无足够数据评估知识点掌握情况。"
-                
-            # 找出掌握最好和最差的知识点
-            max_acc_idx = accuracy.index(max(accuracy))
-            min_acc_idx = accuracy.index(min(accuracy))
+    def _bar_comment_prompt(self, labels, accuracy):
+        """构建知识点掌握评论提示词"""
+        if not labels or not accuracy:
+            return None, "暂无足够数据评估知识点掌握情况。"
             
-            prompt = f"""请根据以下知识点掌握情况，生成一句简短的点评：
+        # 找出掌握最好和最差的知识点
+        max_acc_idx = accuracy.index(max(accuracy))
+        min_acc_idx = accuracy.index(min(accuracy))
+        
+        prompt = f"""请根据以下知识点掌握情况，生成一句简短的点评：
 
 知识点掌握度：
 {labels[max_acc_idx]}: {accuracy[max_acc_idx]*100:.0f}%（最高）
@@ -924,12 +957,7 @@ class InterviewEvaluationService:
 2. 肯定优势，指出提升空间
 3. 语气要积极专业
 """
-            comment = self.spark_service._send_message(prompt)
-            return comment.strip() if comment else f"{labels[max_acc_idx]}掌握扎实，{labels[min_acc_idx]}模块有待提高。"
-            
-        except Exception as e:
-            print(f"生成知识点掌握评论出错: {e}")
-            return f"{labels[max_acc_idx]}掌握扎实，{labels[min_acc_idx]}模块有待提高。"
+        return prompt, f"{labels[max_acc_idx]}掌握扎实，{labels[min_acc_idx]}模块有待提高。"
     
     def _get_last_compare_result(self, interview, dimensions, scores):
         """获取与上一次面试的对比结果"""
@@ -951,22 +979,21 @@ class InterviewEvaluationService:
             if not last_interview:
                 return None
                 
-            # 获取上一次面试的评估结果
-            last_result = self.get_evaluation_result(last_interview.id)
-            if not last_result:
+            # 获取上一次面试的得分向量（快照或单次聚合，不生成评论）
+            last_scores = self._get_interview_scores(last_interview)
+            if not last_scores:
                 return None
             
             # 计算分数变化
             score_change = round(
-                sum(scores) / len(scores) - 
-                sum(last_result['radar']['data']['scores']) / len(last_result['radar']['data']['scores']),
+                sum(scores) / len(scores) - sum(last_scores) / len(last_scores),
                 1
             )
             
             # 计算各维度变化
             radar_delta = []
             for i in range(len(dimensions)):
-                delta = round(scores[i] - last_result['radar']['data']['scores'][i], 1)
+                delta = round(scores[i] - last_scores[i], 1)
                 radar_delta.append(delta)
             
             return {
@@ -978,11 +1005,10 @@ class InterviewEvaluationService:
             print(f"获取对比结果出错: {e}")
             return None
     
-    def _generate_summary(self, interview, answers, scores, knowledge_points):
-        """生成面试总结"""
-        try:
-            # 构建STAR结构
-            star_prompt = f"""请根据以下面试信息，生成一个简短的STAR结构总结：
+    def _summary_prompts(self, interview, answers, scores, knowledge_points):
+        """构建面试总结（STAR结构和技术总结）提示词"""
+        # 构建STAR结构
+        star_prompt = f"""请根据以下面试信息，生成一个简短的STAR结构总结：
 
 面试岗位：{interview.position_name}
 面试表现：总分{sum(scores)/len(scores):.1f}分
@@ -994,13 +1020,13 @@ class InterviewEvaluationService:
 3. 突出技术亮点
 4. 总字数不超过100字
 """
-            star_structure = self.spark_service._send_message(star_prompt)
-            
-            # 生成技术总结
-            tech_prompt = f"""请根据以下面试信息，生成一句技术能力总结：
+        
+        # 生成技术总结
+        last_answer = answers.last()
+        tech_prompt = f"""请根据以下面试信息，生成一句技术能力总结：
 
 面试岗位：{interview.position_name}
-最近一次答案：{answers.last().answer if answers.exists() else ''}
+最近一次答案：{last_answer.answer if last_answer else ''}
 涉及知识点：{', '.join(knowledge_points.keys())}
 
 要求：
@@ -1008,19 +1034,10 @@ class InterviewEvaluationService:
 2. 突出技术特点和进步
 3. 语气要积极专业
 """
-            technical_summary = self.spark_service._send_message(tech_prompt)
-            
-            return {
-                'starStructure': star_structure.strip() if star_structure else 'S: 遇到系统设计题；T: 需要高并发分析；A: 正确使用缓存和分布式锁；R: 得到面试官好评。',
-                'technicalSummary': technical_summary.strip() if technical_summary else '系统设计能力进步明显，表达清晰。'
-            }
-            
-        except Exception as e:
-            print(f"生成面试总结出错: {e}")
-            return {
-                'starStructure': 'S: 遇到系统设计题；T: 需要高并发分析；A: 正确使用缓存和分布式锁；R: 得到面试官好评。',
-                'technicalSummary': '系统设计能力进步明显，表达清晰。'
-            } 
+        return {
+            'starStructure': (star_prompt, 'S: 遇到系统设计题；T: 需要高并发分析；A: 正确使用缓存和分布式锁；R: 得到面试官好评。'),
+            'technicalSummary': (tech_prompt, '系统设计能力进步明显，表达清晰。')
+        }
 
     def get_user_overall_evaluation(self, user):
         """获取用户总体能力评估"""
@@ -1040,44 +1057,13 @@ class InterviewEvaluationService:
                 return None
             
             # 1. 计算六个维度的平均分
-            dimensions = [
-                '专业知识水平', '技能匹配度', '语言表达能力',
-                '逻辑思维能力', '创新能力', '应变抗压能力'
-            ]
-            
-            scores = []
-            for dimension in dimensions:
-                field_name = {
-                    '专业知识水平': 'professional_knowledge',
-                    '技能匹配度': 'skill_matching',
-                    '语言表达能力': 'communication_skills',
-                    '逻辑思维能力': 'logical_thinking',
-                    '创新能力': 'innovation_ability',
-                    '应变抗压能力': 'stress_handling'
-                }[dimension]
-                
-                avg_score = answers.aggregate(
-                    avg_score=models.Avg(field_name)
-                )['avg_score'] or 0
-                scores.append(round(avg_score * 20, 1))  # 转换为百分制
+            dimensions = [label for label, field in self.DIMENSION_FIELDS]
+            scores = self._get_dimension_scores(answers)
             
             # 2. 计算知识点掌握进度
-            knowledge_points = {}
-            for answer in answers:
-                if answer.knowledge_points and answer.correctness_score:
-                    for point in answer.knowledge_points:
-                        if point not in knowledge_points:
-                            knowledge_points[point] = {'total': 0, 'count': 0}
-                        knowledge_points[point]['total'] += answer.correctness_score
-                        knowledge_points[point]['count'] += 1
-            
-            # 转换为进度数据
-            mastery_labels = []
-            mastery_progress = []
-            for point, data in knowledge_points.items():
-                mastery_labels.append(point)
-                progress = data['total'] / (data['count'] * 5)  # 转换为0-1的比例
-                mastery_progress.append(round(progress, 2))
+            knowledge_points, mastery_data = self._get_knowledge_point_stats(answers)
+            mastery_labels = list(mastery_data.keys())
+            mastery_progress = list(mastery_data.values())
             
             # 3. 计算总分趋势
             trends = answers.annotate(
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import AnswerKnowledgePoint, InterviewAnswer, InterviewEvaluationSnapshot
+
+
+@receiver(post_save, sender=InterviewAnswer)
+@receiver(post_delete, sender=InterviewAnswer)
+def invalidate_evaluation_snapshot(sender, instance, **kwargs):
+    """答案新增、修改或删除时，使该面试的评估快照失效"""
+    InterviewEvaluationSnapshot.objects.filter(interview_id=instance.interview_id).delete()
+
+
+@receiver(post_save, sender=InterviewAnswer)
+def sync_answer_knowledge_points(sender, instance, update_fields=None, **kwargs):
+    """将答案的知识点同步到规范化的知识点表，供评估时数据库侧分组统计"""
+    if update_fields is not None and 'knowledge_points' not in update_fields:
+        return
+    names = [str(point)[:200] for point in (instance.knowledge_points or []) if point]
+    existing = list(
+        AnswerKnowledgePoint.objects.filter(answer=instance).order_by('id').values_list('name', flat=True)
+    )
+    if existing == names:
+        return
+    AnswerKnowledgePoint.objects.filter(answer=instance).delete()
+    AnswerKnowledgePoint.objects.bulk_create([
+        AnswerKnowledgePoint(answer=instance, name=name) for name in names
+    ])
@@ -1,13 +1,22 @@
 from celery import shared_task
 from django.conf import settings
 import base64
-from openai import OpenAI
 from .models import InterviewAnswer
-from .services import XunfeiASRService
+from .services import XunfeiASRService, InterviewEvaluationService
+from .recording import mux_clip
+from .qwen_client import get_qwen_client
 import traceback
 import os
 import time
 
+def _refresh_evaluation_snapshot(interview_id):
+    """答案评分完成后，若该面试所有答案均已评分则写入评估快照"""
+    try:
+        if InterviewEvaluationService().refresh_evaluation_snapshot(interview_id):
+            print(f"[调试] 已生成评估快照 - interview_id: {interview_id}")
+    except Exception as e:
+        print(f"[调试] 生成评估快照失败 - interview_id: {interview_id}, error: {str(e)}")
+
 @shared_task(name='interviews.analyze_interview_answer')
 def analyze_interview_answer(answer_id, av_path=None):
     """异步分析面试回答"""
@@ -65,28 +74,11 @@ def analyze_interview_answer(answer_id, av_path=None):
 面试问题：{answer.question}
 应答内容：{answer.answer}"""
         
-        print(f"[调试] 准备调用 AI API - answer_id: {answer_id}")
-        client = OpenAI(
-            api_key=settings.QWEN_API_KEY,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-        )
-        
         # 构建消息内容
         content = [{"type": "text", "text": prompt}]
         
         print(f"[调试] 调用 AI API - answer_id: {answer_id}")
-        completion = client.chat.completions.create(
-            model="qwen2.5-omni-7b",
-            messages=[{"role": "user", "content": content}],
-            modalities=["text"],
-            stream=True
-        )
-        
-        # 处理流式响应
-        full_response = ""
-        for chunk in completion:
-            if chunk.choices[0].delta.content:
-                full_response += chunk.choices[0].delta.content
+        full_response = get_qwen_client().chat(content)
         
         print(f"[调试] AI 分析完成 - answer_id: {answer_id}")
         print("[调试] qwen2.5-omni-7b分析结果：", full_response)
@@ -137,6 +129,7 @@ def analyze_interview_answer(answer_id, av_path=None):
             answer.save()
             
             print(f"[调试] 已更新数据库 - answer_id: {answer_id}")
+            _refresh_evaluation_snapshot(answer.interview_id)
             return True
             
         except Exception as e:
@@ -151,6 +144,7 @@ def analyze_interview_answer(answer_id, av_path=None):
             answer.stress_handling = 3.0
             answer.correctness_score = 3.0
             answer.save()
+            _refresh_evaluation_snapshot(answer.interview_id)
             return False
             
     except Exception as e:
@@ -158,4 +152,77 @@ def analyze_interview_answer(answer_id, av_path=None):
         print(f"错误信息: {str(e)}")
         print("详细错误信息:")
         print(traceback.format_exc())
-        return False 
\ No newline at end of file
+        return False 
+
+
+@shared_task(name='interviews.mux_interview_clip')
+def mux_interview_clip(clip, answer_id=None):
+    """
+    合成面试片段（路由到media队列，由该队列worker的并发数限制同时编码的数量）
+    
+    合成完成后若传入answer_id则继续投递答案分析任务，返回最终文件路径
+    """
+    print(f"[调试] 开始合成面试片段 - answer_id: {answer_id}")
+    av_path = None
+    if clip:
+        try:
+            av_path, metrics = mux_clip(clip)
+            print(f"[调试] 面试片段合成完成 - answer_id: {answer_id}, path: {av_path}, metrics: {metrics}")
+        except Exception as e:
+            print(f"[调试] 面试片段合成失败 - answer_id: {answer_id}, error: {str(e)}")
+            # 合成失败时退回使用原始音频
+            av_path = clip.get('audio_path')
+    if answer_id:
+        analyze_interview_answer.delay(answer_id, av_path)
+    return av_path
+
+
+def _build_video_content(av_path):
+    """
+    构建视频消息内容
+    
+    配置了INTERVIEW_CLIP_BASE_URL（片段目录对外的访问地址）时按URL引用文件；
+    否则仅在文件不超过INTERVIEW_VIDEO_INLINE_MAX_BYTES时内联base64，过大的视频不随请求发送
+    """
+    if not av_path or not av_path.endswith('.mp4') or not os.path.exists(av_path):
+        return None
+    base_url = getattr(settings, 'INTERVIEW_CLIP_BASE_URL', '')
+    if base_url:
+        url = f"{base_url.rstrip('/')}/{os.path.basename(av_path)}"
+    else:
+        max_bytes = getattr(settings, 'INTERVIEW_VIDEO_INLINE_MAX_BYTES', 8 * 1024 * 1024)
+        size = os.path.getsize(av_path)
+        if size > max_bytes:
+            print(f"[调试] 视频过大未随请求发送 - path: {av_path}, size: {size}")
+            return None
+        with open(av_path, "rb") as f:
+            url = f"data:;base64,{base64.b64encode(f.read()).decode('utf-8')}"
+    return {
+        "type": "video_url",
+        "video_url": {
+            "url": url
+        }
+    }
+
+
+@shared_task(name='interviews.analyze_confidence_fluency')
+def analyze_confidence_fluency(av_path, question, answer_text):
+    """
+    判断应答者回答时的信心和表达流畅度
+    
+    接在mux_interview_clip之后执行，av_path为片段合成结果
+    """
+    prompt = f"请根据以下面试问题和应答，判断应答者在回答时的信心和表达流畅度，并按如下标准打1-5分：\\n1分：极度缺乏信心，表达极不流畅，长时间停顿或语无伦次。\\n2分：信心不足，表达有明显卡顿或多次重复、犹豫。\\n3分：信心一般，表达基本流畅但偶有停顿或语气不坚定。\\n4分：信心较强，表达流畅，偶有小瑕疵。\\n5分：非常有信心，表达极其流畅，思路清晰、语气坚定。\\n请输出分析理由和分数。\\n\\n面试问题：{question}\\n应答内容：{answer_text}"
+    try:
+        # 构建消息内容
+        content = [{"type": "text", "text": prompt}]
+        video_content = _build_video_content(av_path)
+        if video_content:
+            content.append(video_content)
+        
+        full_response = get_qwen_client().chat(content)
+        print("[调试] qwen2.5-omni-7b分析结果：", full_response)
+        return full_response
+    except Exception as e:
+        print(f"qwen2.5-omni-7b API调用异常: {e}")
+        return None
@@ -0,0 +1,150 @@
+"""
+共享关键词匹配器
+
+帖子标签、岗位类型分类和简历技能提取共用一张带版本号的关键词表（默认keywords.json，
+可通过KEYWORD_TABLE_PATH指定），导入时一次性构建Aho-Corasick自动机，
+对一段文本只扫描一遍即可得到所有类别的命中。
+
+关键词表格式：
+    {"version": 1, "categories": {"skill": {"MySQL": ["mysql"], ...}, ...}}
+类别下每个标签对应一组别名，命中任一别名即记为该标签（统一返回规范名称）。
+
+匹配不区分大小写；以字母数字开头的别名要求前一个字符不是字母数字，以字母数字结尾的别名
+要求后一个字符不是字母（允许vue3这类版本号），避免"go"命中"google"、"ts"命中"its"之类的误匹配，
+中文别名不受此限制。同一类别中被更长命中包含的短命中不计数。
+
+用法：
+    keyword_matcher.scan(text)                     # {类别: {标签: 命中次数}}
+    keyword_matcher.extract(text, 'skill')         # ['MySQL', 'Redis']
+    keyword_matcher.classify(text, 'position_type')  # 'backend'
+"""
+import json
+import os
+from collections import deque
+
+from django.conf import settings
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(__file__), 'keywords.json')
+
+
+def _is_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+
+class KeywordMatcher:
+    """基于Aho-Corasick自动机的多模式关键词匹配"""
+
+    def __init__(self, table):
+        self.version = table.get('version')
+        self.categories = table.get('categories', {})
+        self._patterns = []
+        self._targets = []  # 与_patterns对应，每个别名命中的[(类别, 标签)]
+        index = {}
+        for category, labels in self.categories.items():
+            for label, aliases in labels.items():
+                for alias in aliases:
+                    alias = alias.lower()
+                    if not alias:
+                        continue
+                    if alias not in index:
+                        index[alias] = len(self._patterns)
+                        self._patterns.append(alias)
+                        self._targets.append([])
+                    target = (category, label)
+                    if target not in self._targets[index[alias]]:
+                        self._targets[index[alias]].append(target)
+        self._build()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _build(self):
+        """构建goto表、失败指针和输出表"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern_id, pattern in enumerate(self._patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(pattern_id)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, text):
+        """扫描一遍文本，返回 {类别: {标签: 命中次数}}，每个类别内标签按首次命中位置排列"""
+        text = (text or '').lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pattern_id in out[node]:
+                pattern = self._patterns[pattern_id]
+                start = i - len(pattern) + 1
+                if _is_word_char(pattern[0]) and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if _is_word_char(pattern[-1]) and i + 1 < len(text) and text[i + 1].isascii() and text[i + 1].isalpha():
+                    continue
+                for category, label in self._targets[pattern_id]:
+                    matches.append((category, start, -i, label))
+
+        # 同一类别中被更长命中包含的命中不计数，如"字节跳动"中的"字节"、"数据分析"中的"数据"
+        matches.sort()
+        hits = {}
+        current, covered, last_span = None, -1, None
+        for category, start, neg_end, label in matches:
+            if category != current:
+                current, covered, last_span = category, -1, None
+            if -neg_end <= covered and (start, neg_end) != last_span:
+                continue
+            covered, last_span = -neg_end, (start, neg_end)
+            labels = hits.setdefault(category, {})
+            labels[label] = labels.get(label, 0) + 1
+        return hits
+
+    def extract(self, text, category, hits=None):
+        """文本中命中的某类别标签（规范名称）；已有scan结果时通过hits传入，避免重复扫描"""
+        if hits is None:
+            hits = self.scan(text)
+        return list(hits.get(category, {}))
+
+    def classify(self, text, category, default='other', hits=None):
+        """返回某类别中命中次数最多的标签，次数相同时按关键词表中的顺序，均未命中时返回default"""
+        if hits is None:
+            hits = self.scan(text)
+        counts = hits.get(category)
+        if not counts:
+            return default
+        order = list(self.categories.get(category, {}))
+        return max(counts, key=lambda label: (counts[label], -order.index(label)))
+
+    def keywords(self, category, label):
+        """某标签的全部别名，用于构造数据库查询条件"""
+        return list(self.categories.get(category, {}).get(label, []))
+
+    def labels(self, category):
+        return list(self.categories.get(category, {}))
+
+
+keyword_matcher = KeywordMatcher.from_file(getattr(settings, 'KEYWORD_TABLE_PATH', DEFAULT_TABLE_PATH))
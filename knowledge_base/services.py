@@ -1,19 +1,13 @@
-import json
-import time
-import hmac
-import base64
-import hashlib
-import websocket
-import threading
 import re
-from datetime import datetime
-from urllib.parse import urlencode
 from typing import List, Dict, Any
 from django.conf import settings
 from django.db import models
 from django.db.models import Q
 from users.models import Resume
 from .models import JobPosition, KnowledgeBaseEntry, InterviewQuestion
+from .spark_client import SparkClientError, get_spark_client
+from .keywords import keyword_matcher
+from posts.questions import extract_questions
 
 class XunfeiSparkService:
     """讯飞星火API服务"""
@@ -22,109 +16,31 @@ class XunfeiSparkService:
         self.app_id = getattr(settings, 'XUNFEI_APP_ID', '')
         self.api_secret = getattr(settings, 'XUNFEI_API_SECRET', '')
         self.api_key = getattr(settings, 'XUNFEI_API_KEY', '')
-        self.spark_url = "wss://spark-api.xf-yun.com/v3.1/chat"
+        self.client = get_spark_client()
         
-    def _create_url(self):
-        """生成鉴权url"""
-        # 生成RFC1123格式的时间戳
-        now = datetime.now()
-        date = now.strftime('%a, %d %b %Y %H:%M:%S GMT')
-        
-        # 拼接字符串
-        signature_origin = f"host: spark-api.xf-yun.com\ndate: {date}\nGET /v3.1/chat HTTP/1.1"
-        
-        # 使用hmac-sha256进行加密
-        signature_sha = hmac.new(
-            self.api_secret.encode('utf-8'),
-            signature_origin.encode('utf-8'),
-            digestmod=hashlib.sha256
-        ).digest()
-        
-        signature_sha_base64 = base64.b64encode(signature_sha).decode()
-        authorization_origin = f'api_key="{self.api_key}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha_base64}"'
-        authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode()
-        
-        # 将请求的鉴权参数组合为字典
-        v = {
-            "authorization": authorization,
-            "date": date,
-            "host": "spark-api.xf-yun.com"
-        }
-    
-        # 拼接鉴权参数，生成url
-        url = f"{self.spark_url}?{urlencode(v)}"
-        
-        return url
-    
-    def _send_message(self, message: str) -> str:
+    def _send_message(self, message: str, timeout: float = None) -> str:
         """发送消息到星火API并获取回复"""
-        url = self._create_url()
-        
-        # 构建请求数据
-        data = {
-            "header": {
-                "app_id": self.app_id,
-                "uid": "12345"
-            },
-            "parameter": {
-                "chat": {
-                    "domain": "general",
-                    "temperature": 0.7,
-                    "max_tokens": 2048
-                }
-            },
-            "payload": {
-                "message": {
-                    "text": [
-                        {"role": "user", "content": message}
-                    ]
-                }
-            }
-        }
-        
-        response_text = ""
-        
-        def on_message(ws, message):
-            nonlocal response_text
-            data = json.loads(message)
-            code = data['header']['code']
-            if code != 0:
-                print(f'请求错误: {code}, {data}')
-                ws.close()
-            else:
-                text = data['payload']['choices']['text'][0]['content']
-                response_text += text
-                if data['header']['status'] == 2:
-                    ws.close()
-        
-        def on_error(ws, error):
-            print(f"错误: {error}")
-        
-        def on_close(ws, close_status_code, close_msg):
-            print("连接关闭")
-        
-        def on_open(ws):
-            ws.send(json.dumps(data))
-        
-        # 创建WebSocket连接
-        ws = websocket.WebSocketApp(
-            url,
-            on_open=on_open,
-            on_message=on_message,
-            on_error=on_error,
-            on_close=on_close
-        )
-        
-        # 在新线程中运行WebSocket
-        wst = threading.Thread(target=ws.run_forever)
-        wst.daemon = True
-        wst.start()
-        
-        # 等待响应完成
-        while ws.sock and ws.sock.connected:
-            time.sleep(0.1)
-        
-        return response_text
+        try:
+            return self.client.chat(message, timeout=timeout, domain="general", temperature=0.7, max_tokens=2048)
+        except SparkClientError as e:
+            print(f'请求错误: {e}')
+            return ""
+
+    def _send_messages(self, messages: Dict[str, str], timeout: float = None) -> Dict[str, str]:
+        """并发发送多条消息，共享一个截止时间；未按时返回的条目为None"""
+        try:
+            return self.client.chat_many(messages, timeout=timeout, domain="general", temperature=0.7, max_tokens=2048)
+        except Exception as e:
+            print(f'请求错误: {e}')
+            return {key: None for key in messages}
+
+    async def _asend_message(self, message: str, timeout: float = None) -> str:
+        """异步发送消息到星火API并获取回复"""
+        try:
+            return await self.client.achat(message, timeout=timeout, domain="general", temperature=0.7, max_tokens=2048)
+        except SparkClientError as e:
+            print(f'请求错误: {e}')
+            return ""
     
     def generate_interview_questions(self, job_position: JobPosition, resume: Resume) -> List[str]:
         """根据岗位和简历生成面试问题"""
@@ -239,29 +155,12 @@ class KnowledgeBaseService:
 
 请直接列出问题，每行一个："""
             
-            # 设置超时调用AI服务（使用线程超时）
-            import threading
-            result = {"response": None, "error": None}
-            
-            def call_ai_service():
-                try:
-                    result["response"] = self.spark_service._send_message(simple_prompt)
-                except Exception as e:
-                    result["error"] = str(e)
+            # 设置超时调用AI服务（超时后共享客户端会取消上游请求）
+            response = self.spark_service._send_message(simple_prompt, timeout=5)
             
-            thread = threading.Thread(target=call_ai_service)
-            thread.start()
-            thread.join(timeout=5)  # 5秒超时
-            
-            if thread.is_alive():
-                print("[调试] AI服务调用超时")
-                return ""
-            elif result["error"]:
-                print(f"[调试] AI服务调用失败: {result['error']}")
-                return ""
-            elif result["response"]:
-                print(f"[调试] AI服务返回: {result['response'][:100]}...")
-                return result["response"]
+            if response:
+                print(f"[调试] AI服务返回: {response[:100]}...")
+                return response
             else:
                 print("[调试] AI服务返回空结果")
                 return ""
@@ -320,11 +219,12 @@ class KnowledgeBaseService:
             
             # 根据技能信息添加针对性问题
             if skills and skills != "未提供":
-                if any(skill in skills.lower() for skill in ['java', 'spring']):
+                skill_set = set(keyword_matcher.extract(skills, 'skill'))
+                if skill_set & {'Java', 'Spring'}:
                     questions.append("请介绍你在Java/Spring开发中的经验和遇到的挑战。")
-                if any(skill in skills.lower() for skill in ['python', 'django']):
+                if skill_set & {'Python', 'Django'}:
                     questions.append("请分享你在Python/Django开发中的实践经验。")
-                if any(skill in skills.lower() for skill in ['react', 'vue', 'javascript']):
+                if skill_set & {'React', 'Vue', 'JavaScript'}:
                     questions.append("请介绍你在前端框架开发中的经验和最佳实践。")
             
             # 根据项目经验添加问题
@@ -347,75 +247,41 @@ class KnowledgeBaseService:
             return []
     
     def _search_interview_posts(self, position: str, position_type: str, skills: str, limit: int = 10) -> list:
-        """从帖子中搜索相关面经"""
+        """从帖子中搜索相关面经（走帖子倒排索引，按相关度排序）"""
         try:
-            from posts.models import Post, Tag
-            from django.db.models import Q
-            
-            # 构建标签查询条件
-            tag_conditions = Q()
-            
-            # 添加岗位类型标签
-            position_type_keywords = {
-                'backend': ['后端', 'java', 'python', 'go', '服务端'],
-                'frontend': ['前端', 'web', 'javascript', 'vue', 'react'],
-                'algo': ['算法', '机器学习', '深度学习', 'AI'],
-                'data': ['数据', '分析师', '数据挖掘'],
-                'pm': ['产品经理', '产品', 'PM'],
-                'qa': ['测试', 'QA', '质量']
-            }
-            
-            if position_type in position_type_keywords:
-                for keyword in position_type_keywords[position_type]:
-                    tag_conditions |= Q(tags__name__icontains=keyword)
-            
-            # 添加职位标签
-            if position:
-                tag_conditions |= Q(tags__name__icontains=position)
-            
-            # 添加技能标签
+            from posts.search import search_posts
+
+            # 查询词：职位、技能、岗位类型关键词和面试相关关键词
+            terms = [position] if position else []
             if skills:
-                for skill in skills.split('，'):  # 处理中文逗号分隔的技能列表
-                    skill = skill.strip()
-                    if skill:
-                        tag_conditions |= Q(tags__name__icontains=skill)
-            
-            # 搜索帖子
-            posts = Post.objects.filter(
-                tag_conditions,
-                tags__tag_type__in=['company', 'position', 'skill']  # 只搜索公司、岗位、技能相关的标签
-            ).distinct()
-            
-            # 构建内容搜索条件
-            content_conditions = Q()
-            
-            # 添加面试相关关键词
-            interview_keywords = ['面试', '面经', '八股文', '技术问题', '考察', '考点']
-            for keyword in interview_keywords:
-                content_conditions |= Q(title__icontains=keyword) | Q(content__icontains=keyword)
-            
-            posts = posts.filter(content_conditions)
-            
-            # 按相关度排序（标签匹配数量）并限制返回数量
-            posts = posts.order_by('-likes_count', '-created_at')[:limit]
-            
-            # 处理结果
+                terms.extend(skill.strip() for skill in skills.split('，') if skill.strip())  # 处理中文逗号分隔的技能列表
+            terms.extend(keyword_matcher.keywords('position_type', position_type))
+            terms.extend(['面试', '面经', '八股文', '技术问题', '考察', '考点'])
+
+            # 只搜索带有公司、岗位、技能标签的帖子
             results = []
-            for post in posts:
-                # 获取公司和岗位标签
-                company_tags = [tag.name for tag in post.tags.filter(tag_type='company')]
-                position_tags = [tag.name for tag in post.tags.filter(tag_type='position')]
-                
+            # 问题已在帖子保存时提取，不加载正文
+            posts = search_posts(' '.join(terms), tag_types=['company', 'position', 'skill'], limit=limit, defer=['content'])
+            for post, score in posts:
+                # tags已预取，不再逐帖查询
+                company_tags = [tag.name for tag in post.tags.all() if tag.tag_type == 'company']
+                position_tags = [tag.name for tag in post.tags.all() if tag.tag_type == 'position']
+
+                questions = post.interview_questions
+                if questions is None:
+                    # 尚未回填的旧帖子（迁移0007之后由extract_post_questions命令回填），不加载正文现场提取
+                    continue
+
                 results.append({
                     'title': post.title,
-                    'content': post.content,
+                    'questions': questions,
                     'company': company_tags[0] if company_tags else '',
                     'position': position_tags[0] if position_tags else '',
                     'likes': post.likes_count
                 })
-            
+
             return results
-            
+
         except Exception as e:
             print(f"搜索面经帖子时出错: {e}")
             return []
@@ -427,9 +293,8 @@ class KnowledgeBaseService:
             
         formatted = []
         for post in posts:
-            # 提取标题和内容中的问题
-            content = post['content']
-            questions = self._extract_questions(content)
+            # 帖子保存时预先提取的问题
+            questions = post['questions']
             
             # 添加帖子来源信息
             source = []
@@ -447,35 +312,7 @@ class KnowledgeBaseService:
     
     def _extract_questions(self, text: str) -> list:
         """从文本中提取问题"""
-        import re  # 在方法中导入re模块
-        questions = []
-        
-        # 常见的问题标记模式
-        patterns = [
-            r'问：(.*?)(?=\n|$)',
-            r'Q：(.*?)(?=\n|$)',
-            r'Q:(.*?)(?=\n|$)',
-            r'\d+[.、](.*?)(?=\n|$)',
-            r'面试官：(.*?)(?=\n|$)',
-            r'面试问题：(.*?)(?=\n|$)',
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.MULTILINE)
-            for match in matches:
-                question = match.group(1).strip()
-                if question and len(question) > 5:  # 过滤太短的问题
-                    questions.append(question)
-        
-        # 如果没有找到明确的问题格式，尝试按段落拆分并识别问题语句
-        if not questions:
-            paragraphs = text.split('\n')
-            for p in paragraphs:
-                p = p.strip()
-                if p and ('?' in p or '？' in p) and len(p) > 10:
-                    questions.append(p)
-        
-        return questions[:10]  # 限制返回的问题数量
+        return extract_questions(text)
     
     def search_relevant_questions(self, position_type, resume, limit=5):
         """
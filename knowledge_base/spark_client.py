@@ -0,0 +1,273 @@
+"""
+讯飞星火大模型共享客户端
+
+进程内所有星火调用共享一个后台事件循环、一个aiohttp会话（复用TCP/TLS连接）
+和一个并发信号量，每次请求受统一的截止时间约束，超时即取消并关闭上游连接。
+
+用法：
+    client = get_spark_client()
+    text = client.chat(prompt, timeout=10)            # 同步调用
+    text = await client.achat(prompt)                 # 异步调用
+    texts = client.chat_many({'a': p1, 'b': p2})      # 并发调用，共享截止时间
+    for token in client.stream(prompt): ...           # 同步流式
+    async for token in client.astream(prompt): ...    # 异步流式
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from email.utils import formatdate
+from urllib.parse import urlencode, urlparse
+
+import aiohttp
+from django.conf import settings
+
+from config.background_loop import BackgroundLoop
+
+logger = logging.getLogger(__name__)
+
+_STREAM_END = object()
+
+
+class SparkClientError(Exception):
+    """星火API返回错误或连接异常"""
+
+
+class SparkTimeoutError(SparkClientError):
+    """请求超过截止时间被取消"""
+
+
+class SparkClient:
+    """基于asyncio的讯飞星火WebSocket客户端"""
+
+    def __init__(self, spark_url=None, max_concurrency=None, default_timeout=None, url_ttl=60):
+        self.app_id = getattr(settings, 'XUNFEI_APP_ID', '')
+        self.api_secret = getattr(settings, 'XUNFEI_API_SECRET', '')
+        self.api_key = getattr(settings, 'XUNFEI_API_KEY', '')
+        self.spark_url = spark_url or getattr(settings, 'SPARK_API_URL', 'wss://spark-api.xf-yun.com/v3.1/chat')
+        self.max_concurrency = max_concurrency or getattr(settings, 'SPARK_MAX_CONCURRENCY', 8)
+        self.default_timeout = default_timeout or getattr(settings, 'SPARK_REQUEST_TIMEOUT', 30)
+        # 鉴权URL在有效期内复用，避免每次请求都重新计算HMAC签名
+        self.url_ttl = url_ttl
+        self._signed_url = None
+        self._signed_at = 0.0
+        self._background = BackgroundLoop('spark-client')
+        self._session = None
+        self._semaphore = None
+
+    # ---------- 后台事件循环 ----------
+
+    def _submit(self, coro):
+        return self._background.submit(coro)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    # ---------- 协议 ----------
+
+    def _create_url(self):
+        """生成（或复用）鉴权url"""
+        now = time.monotonic()
+        if self._signed_url and now - self._signed_at < self.url_ttl:
+            return self._signed_url
+
+        parsed = urlparse(self.spark_url)
+        # 使用RFC1123 GMT格式
+        date = formatdate(timeval=None, localtime=False, usegmt=True)
+        signature_origin = f"host: {parsed.netloc}\ndate: {date}\nGET {parsed.path} HTTP/1.1"
+        signature_sha = hmac.new(
+            self.api_secret.encode('utf-8'),
+            signature_origin.encode('utf-8'),
+            digestmod=hashlib.sha256
+        ).digest()
+        signature_sha_base64 = base64.b64encode(signature_sha).decode()
+        authorization_origin = f'api_key="{self.api_key}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha_base64}"'
+        authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode()
+        v = {
+            "authorization": authorization,
+            "date": date,
+            "host": parsed.netloc
+        }
+        self._signed_url = f"{self.spark_url}?{urlencode(v)}"
+        self._signed_at = now
+        return self._signed_url
+
+    def _build_request(self, message, domain='general', temperature=0.7, max_tokens=2048, uid='12345'):
+        """构建请求数据，message可以是字符串或完整的消息列表"""
+        if isinstance(message, str):
+            message = [{"role": "user", "content": message}]
+        return {
+            "header": {
+                "app_id": self.app_id,
+                "uid": str(uid)
+            },
+            "parameter": {
+                "chat": {
+                    "domain": domain,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens
+                }
+            },
+            "payload": {
+                "message": {
+                    "text": message
+                }
+            }
+        }
+
+    async def _run(self, request_data, on_token):
+        async with self._get_semaphore():
+            session = self._get_session()
+            async with session.ws_connect(self._create_url()) as ws:
+                await ws.send_str(json.dumps(request_data))
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.ERROR:
+                        raise SparkClientError(f"连接错误: {ws.exception()}")
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    data = json.loads(msg.data)
+                    header = data.get('header', {})
+                    if header.get('code') != 0:
+                        raise SparkClientError(f"请求错误: {header.get('code')}, {header.get('message')}")
+                    text = data['payload']['choices']['text'][0]['content']
+                    if text:
+                        on_token(text)
+                    if header.get('status') == 2:
+                        return
+
+    async def _request(self, message, on_token, timeout, params):
+        """在后台循环中执行一次对话，每收到一段文本回调on_token"""
+        timeout = timeout or self.default_timeout
+        request_data = self._build_request(message, **params)
+        try:
+            await asyncio.wait_for(self._run(request_data, on_token), timeout)
+        except asyncio.TimeoutError:
+            raise SparkTimeoutError(f"星火请求超时({timeout}s)")
+        except aiohttp.ClientError as e:
+            raise SparkClientError(f"连接错误: {e}")
+
+    async def _gather(self, messages, timeout, params):
+        """并发执行多条对话，共享一个截止时间；超时或出错的条目结果为None"""
+        timeout = timeout or self.default_timeout
+        parts = {key: [] for key in messages}
+        tasks = {
+            asyncio.ensure_future(self._request(message, parts[key].append, timeout, params)): key
+            for key, message in messages.items()
+        }
+        results = {key: None for key in messages}
+        if not tasks:
+            return results
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            key = tasks[task]
+            if task.exception() is None:
+                results[key] = ''.join(parts[key])
+            else:
+                logger.warning(f"星火并发请求 {key} 失败: {task.exception()}")
+        if pending:
+            logger.warning(f"星火并发请求超时({timeout}s)，未完成: {[tasks[t] for t in pending]}")
+        return results
+
+    # ---------- 同步入口 ----------
+
+    def chat(self, message, timeout=None, **params):
+        """同步调用，返回完整回复文本"""
+        parts = []
+        future = self._submit(self._request(message, parts.append, timeout, params))
+        try:
+            future.result()
+        except BaseException:
+            future.cancel()
+            raise
+        return ''.join(parts)
+
+    def chat_many(self, messages, timeout=None, **params):
+        """同步并发调用，messages为{key: 消息}，返回{key: 回复文本或None}"""
+        return self._submit(self._gather(messages, timeout, params)).result()
+
+    def stream(self, message, timeout=None, **params):
+        """同步流式调用，逐段产出回复文本"""
+        tokens = queue.Queue()
+        future = self._submit(self._request(message, tokens.put, timeout, params))
+        future.add_done_callback(lambda f: tokens.put(_STREAM_END))
+        try:
+            while True:
+                token = tokens.get()
+                if token is _STREAM_END:
+                    break
+                yield token
+            future.result()
+        finally:
+            if not future.done():
+                future.cancel()
+
+    # ---------- 异步入口 ----------
+
+    async def achat(self, message, timeout=None, **params):
+        """异步调用，返回完整回复文本；调用方被取消时上游请求一并取消"""
+        parts = []
+        await asyncio.wrap_future(self._submit(self._request(message, parts.append, timeout, params)))
+        return ''.join(parts)
+
+    async def achat_many(self, messages, timeout=None, **params):
+        """异步并发调用，messages为{key: 消息}，返回{key: 回复文本或None}"""
+        return await asyncio.wrap_future(self._submit(self._gather(messages, timeout, params)))
+
+    async def astream(self, message, timeout=None, **params):
+        """异步流式调用，逐段产出回复文本"""
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+
+        def on_token(text):
+            loop.call_soon_threadsafe(tokens.put_nowait, text)
+
+        future = asyncio.wrap_future(self._submit(self._request(message, on_token, timeout, params)))
+        future.add_done_callback(lambda f: tokens.put_nowait(_STREAM_END))
+        try:
+            while True:
+                token = await tokens.get()
+                if token is _STREAM_END:
+                    break
+                yield token
+            future.result()
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def close(self):
+        """关闭共享会话和后台事件循环"""
+        if self._background.loop is None:
+            return
+        if self._session is not None:
+            self._background.submit(self._session.close()).result()
+        self._background.stop()
+        self._session = None
+        self._semaphore = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_spark_client():
+    """获取进程内共享的星火客户端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SparkClient()
+    return _client
@@ -1,3 +1,65 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+
+from .keywords import KeywordMatcher
 
 # Create your tests here.
+
+TABLE = {
+    'version': 1,
+    'categories': {
+        'company': {
+            '字节跳动': ['字节跳动', '字节'],
+            'Google': ['google', '谷歌'],
+        },
+        'skill': {
+            'Go': ['go', 'golang'],
+            'Vue': ['vue'],
+            'Node.js': ['node.js', 'nodejs'],
+            'JavaScript': ['javascript', 'js'],
+        },
+        'position_type': {
+            'backend': ['后端', 'go', 'node.js'],
+            'frontend': ['前端', 'js', 'vue'],
+        },
+    },
+}
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.matcher = KeywordMatcher(TABLE)
+
+    def test_ascii_alias_requires_word_boundary(self):
+        self.assertEqual(self.matcher.extract('面试官在Google工作', 'skill'), [])
+        self.assertEqual(self.matcher.extract('面试官在Google工作', 'company'), ['Google'])
+        self.assertEqual(self.matcher.extract('会用go写服务', 'skill'), ['Go'])
+        self.assertEqual(self.matcher.extract('熟悉Go、gorm', 'skill'), ['Go'])
+
+    def test_trailing_version_digits_allowed(self):
+        self.assertEqual(self.matcher.extract('项目用vue3写的', 'skill'), ['Vue'])
+        self.assertEqual(self.matcher.extract('vuex状态管理', 'skill'), [])
+
+    def test_contained_match_not_counted(self):
+        hits = self.matcher.scan('字节跳动后端一面')
+        self.assertEqual(hits['company'], {'字节跳动': 1})
+        hits = self.matcher.scan('字节跳动一面，字节二面')
+        self.assertEqual(hits['company'], {'字节跳动': 2})
+
+    def test_node_js_suppresses_inner_js(self):
+        hits = self.matcher.scan('node.js')
+        self.assertEqual(hits['skill'], {'Node.js': 1})
+        self.assertEqual(hits['position_type'], {'backend': 1})
+
+    def test_classify_tie_follows_table_order(self):
+        text = '用node.js和react，也写js'
+        hits = self.matcher.scan(text)
+        self.assertEqual(hits['position_type'], {'backend': 1, 'frontend': 1})
+        self.assertEqual(self.matcher.classify(text, 'position_type', hits=hits), 'backend')
+        self.assertEqual(self.matcher.classify('写js和vue', 'position_type'), 'frontend')
+        self.assertEqual(self.matcher.classify('产品经理', 'position_type'), 'other')
+
+    def test_shipped_table(self):
+        from .keywords import keyword_matcher
+        hits = keyword_matcher.scan('在google用go和vue3，字节跳动 node.js')
+        self.assertEqual(hits['company'], {'字节跳动': 1})
+        self.assertEqual(hits['skill'], {'Go': 1, 'Vue': 1, 'Node.js': 1})
@@ -1,4 +1,5 @@
 from django.db import models
+from knowledge_base.keywords import keyword_matcher
 
 # Create your models here.
 
@@ -64,25 +65,9 @@ class NowCoderPosition(models.Model):
     @property
     def position_type(self):
         """根据岗位名称和要求检测岗位类型"""
-        text_to_check = f"{self.job_name or ''} {self.job_request or ''} {self.add_info or ''}".lower()
-        
-        # 关键字映射
-        keywords_map = {
-            'backend': ['后端', 'backend', 'java', 'python', 'go', 'nodejs', 'node.js', 'php', 'c++', '服务端', 'api', 'spring', 'django', 'flask'],
-            'frontend': ['前端', 'frontend', 'javascript', 'js', 'react', 'vue', 'angular', 'html', 'css', 'typescript', 'ts', 'ui', 'ux'],
-            'pm': ['产品', 'product', 'pm', '产品经理', 'product manager', '需求', '运营'],
-            'qa': ['测试', 'test', 'qa', 'quality', '自动化测试', '接口测试', '性能测试'],
-            'algo': ['算法', 'algorithm', '机器学习', 'ml', '深度学习', 'ai', '人工智能'],
-            'data': ['数据', 'data', '大数据', 'bigdata', '数据分析', '数据挖掘', '数据科学', '数据工程']
-        }
-        
-        # 遍历关键字映射，找到匹配的类型
-        for position_type, keywords in keywords_map.items():
-            for keyword in keywords:
-                if keyword in text_to_check:
-                    return position_type
-        
-        return 'other'
+        text_to_check = f"{self.job_name or ''} {self.job_request or ''} {self.add_info or ''}"
+        # 按共享关键词表分类，命中最多的类型优先
+        return keyword_matcher.classify(text_to_check, 'position_type')
     
     @property
     def position_name(self):
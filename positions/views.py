@@ -6,6 +6,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from .models import Position, NowCoderPosition
 from .serializers import PositionSerializer, NowCoderPositionSerializer
 from django.db.models import Q
+from knowledge_base.keywords import keyword_matcher
 
 # Create your views here.
 
@@ -105,21 +106,10 @@ class PositionViewSet(viewsets.ReadOnlyModelViewSet):
 
         queryset = self.get_queryset()
         
-        # 根据岗位类型关键字过滤
-        if position_type == 'backend':
-            keywords = ['后端', 'backend', 'java', 'python', 'go', 'nodejs', 'node.js', 'php', 'c++', '服务端', 'api']
-        elif position_type == 'frontend':
-            keywords = ['前端', 'frontend', 'javascript', 'js', 'react', 'vue', 'angular', 'html', 'css', 'typescript', 'ts']
-        elif position_type == 'pm':
-            keywords = ['产品', 'product', 'pm', '产品经理', 'product manager', '需求', '运营']
-        elif position_type == 'qa':
-            keywords = ['测试', 'test', 'qa', 'quality', '自动化测试', '接口测试', '性能测试']
-        elif position_type == 'algo':
-            keywords = ['算法', 'algorithm', '机器学习', 'ml', '深度学习', 'ai', '人工智能']
-        elif position_type == 'data':
-            keywords = ['数据', 'data', '大数据', 'bigdata', '数据分析', '数据挖掘', '数据科学', '数据工程']
-        else:
+        # 根据岗位类型关键字过滤（与NowCoderPosition.position_type共用关键词表）
+        if position_type not in keyword_matcher.labels('position_type'):
             return Response({'error': '无效的岗位类型'}, status=400)
+        keywords = keyword_matcher.keywords('position_type', position_type)
 
         # 构建查询条件
         q_objects = Q()
@@ -145,18 +135,9 @@ class PositionViewSet(viewsets.ReadOnlyModelViewSet):
         
         # 统计各个类型的岗位数量
         type_stats = {}
-        type_keywords = {
-            'backend': ['后端', 'java', 'python', 'go', 'php', 'c++'],
-            'frontend': ['前端', 'javascript', 'react', 'vue', 'angular'],
-            'pm': ['产品', 'pm', '产品经理'],
-            'qa': ['测试', 'qa', 'quality'],
-            'algo': ['算法', '机器学习', 'ai'],
-            'data': ['数据', 'bigdata', '数据分析']
-        }
-        
-        for type_name, keywords in type_keywords.items():
+        for type_name in keyword_matcher.labels('position_type'):
             q_objects = Q()
-            for keyword in keywords:
+            for keyword in keyword_matcher.keywords('position_type', type_name):
                 q_objects |= Q(job_name__icontains=keyword)
             count = self.get_queryset().filter(q_objects).count()
             type_stats[type_name] = count
@@ -4,7 +4,7 @@ from .models import Post, Reply
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'created_at', 'updated_at', 'reply_count')
-    list_filter = ('created_at', 'author')
+    list_filter = ('created_at', 'author', 'tags_status')
     search_fields = ('title', 'content', 'author__username')
     readonly_fields = ('created_at', 'updated_at')
     
@@ -0,0 +1,144 @@
+"""
+帖子流和帖子详情的响应缓存
+
+缓存的是序列化后的JSON响应体，键中带有版本号：
+    posts:feed:all:v<版本>:<游标>:<每页条数>
+    posts:detail:<帖子ID>:v<版本>
+帖子或回复写入后（事务提交时）由信号递增对应的版本号，旧版本的缓存不再被读取，随过期时间淘汰。
+版本键丢失（被淘汰或缓存重启）时以当前毫秒时间重新初始化，不会与旧版本重合。
+
+同一个键未命中时只有拿到锁的请求生成响应，其余请求在POST_CACHE_LOCK_WAIT秒内等待其结果，
+避免热门帖子失效瞬间大量请求同时查库（缓存击穿）。
+
+配置：
+    POST_CACHE_TIMEOUT       缓存过期时间（秒），默认300，为0时不使用缓存
+    POST_CACHE_LOCK_TIMEOUT  生成锁的过期时间（秒），默认10
+    POST_CACHE_LOCK_WAIT     等待其他请求生成结果的最长时间（秒），默认1
+
+命中率等指标：/metrics/cache/（staff用户或携带METRICS_TOKEN令牌，见config.ws_metrics）。
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+
+from config.ws_metrics import metrics_access_allowed, metrics_denied_response
+
+
+class ResponseCache:
+    """带版本号失效和防击穿的响应缓存"""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # 等待其他请求生成后命中的次数
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _version_key(self, scope):
+        return f'posts:{self.namespace}:{scope}:version'
+
+    def version(self, scope):
+        key = self._version_key(scope)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            version = cache.get(key)
+        return version
+
+    def invalidate(self, scope):
+        """递增版本号，使该范围内的缓存全部失效"""
+        key = self._version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+        self._count('invalidations')
+
+    def get_or_build(self, scope, build, params=''):
+        """
+        返回缓存的响应，未命中时调用build()生成
+
+        build返回JsonResponse，只有状态码为200的响应会被缓存
+        """
+        timeout = getattr(settings, 'POST_CACHE_TIMEOUT', 300)
+        if not timeout:
+            return build()
+        key = f'posts:{self.namespace}:{scope}:v{self.version(scope)}:{params}'
+        content = cache.get(key)
+        if content is not None:
+            self._count('hits')
+            return self._response(content, 'HIT')
+
+        lock_key = f'{key}:lock'
+        locked = cache.add(lock_key, 1, getattr(settings, 'POST_CACHE_LOCK_TIMEOUT', 10))
+        if not locked:
+            # 其他请求正在生成，等待其结果；超时后自行生成
+            deadline = time.monotonic() + getattr(settings, 'POST_CACHE_LOCK_WAIT', 1)
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                content = cache.get(key)
+                if content is not None:
+                    self._count('coalesced')
+                    return self._response(content, 'HIT')
+
+        self._count('misses')
+        try:
+            response = build()
+            if response.status_code == 200:
+                cache.set(key, response.content, timeout)
+            response['X-Cache'] = 'MISS'
+            return response
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+    def _response(self, content, status):
+        response = HttpResponse(content, content_type='application/json')
+        response['X-Cache'] = status
+        return response
+
+    def as_dict(self):
+        served = self.hits + self.coalesced + self.misses
+        return {
+            'hits': self.hits,
+            'coalesced': self.coalesced,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round((self.hits + self.coalesced) / served, 4) if served else None,
+        }
+
+
+feed_cache = ResponseCache('feed')
+detail_cache = ResponseCache('detail')
+
+
+def invalidate_posts(post_ids):
+    """在当前事务提交后使帖子流和这些帖子的详情缓存失效"""
+    post_ids = set(post_ids)
+
+    def invalidate():
+        feed_cache.invalidate('all')
+        for post_id in post_ids:
+            detail_cache.invalidate(post_id)
+
+    transaction.on_commit(invalidate)
+
+
+def cache_metrics_view(request):
+    """本进程的响应缓存指标（仅staff用户或携带令牌的请求可访问）"""
+    if not metrics_access_allowed(request):
+        return metrics_denied_response()
+    return JsonResponse({
+        'backend': settings.CACHES['default']['BACKEND'],
+        'feed': feed_cache.as_dict(),
+        'detail': detail_cache.as_dict(),
+    })
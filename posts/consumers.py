@@ -1,27 +1,34 @@
 import json
 import asyncio
-import websocket
+import logging
+from collections import defaultdict
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.conf import settings
-from datetime import datetime
-import time
-import hashlib
-import base64
-import hmac
-from urllib.parse import urlencode
-import logging
-from channels.exceptions import DenyConnection
-from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
-from email.utils import formatdate
+from config.ws_metrics import ConnectionMetricsMixin
+from knowledge_base.spark_client import SparkClientError, get_spark_client
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
-class AIChatConsumer(AsyncWebsocketConsumer):
+# 进程内聊天生成的并发控制：每个用户同时只能有AI_CHAT_MAX_CONCURRENT_PER_USER个生成，
+# 全部聊天最多占用AI_CHAT_MAX_CONCURRENT个星火并发，其余星火并发留给面试流程
+_user_generations = defaultdict(int)
+_chat_semaphore = None
+
+
+def _get_chat_semaphore():
+    global _chat_semaphore
+    if _chat_semaphore is None:
+        _chat_semaphore = asyncio.Semaphore(getattr(settings, 'AI_CHAT_MAX_CONCURRENT', 4))
+    return _chat_semaphore
+
+
+class AIChatConsumer(ConnectionMetricsMixin, AsyncWebsocketConsumer):
     """AI聊天WebSocket消费者"""
-    
+
     async def connect(self):
+        self.generation = None
         # 检查用户认证
         if self.scope["user"].is_anonymous:
             await self.close()
@@ -29,110 +36,125 @@ class AIChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
         self.user = self.scope["user"]
         logger.info(f"AI聊天WebSocket连接已建立 - 用户: {self.user.username}")
-    
+
     async def disconnect(self, close_code):
+        # 浏览器断开后取消正在进行的生成，上游星火连接随之关闭
+        if self.generation and not self.generation.done():
+            self.generation.cancel()
         logger.info(f"AI聊天WebSocket连接已断开: {close_code} - 用户: {self.user.username if hasattr(self, 'user') else 'Unknown'}")
-    
+
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
-            message = data.get('message', '')
-            if not message:
-                await self.send(text_data=json.dumps({
-                    'type': 'error',
-                    'text': '消息不能为空'
-                }))
-                return
-            
-            def create_url():
-                # 使用RFC1123 GMT格式
-                date = formatdate(timeval=None, localtime=False, usegmt=True)
-                signature_origin = f"host: spark-api.xf-yun.com\ndate: {date}\nGET /v3.1/chat HTTP/1.1"
-                signature_sha = hmac.new(
-                    settings.XUNFEI_API_SECRET.encode('utf-8'),
-                    signature_origin.encode('utf-8'),
-                    digestmod=hashlib.sha256
-                ).digest()
-                signature_sha_base64 = base64.b64encode(signature_sha).decode()
-                authorization_origin = f'api_key="{settings.XUNFEI_API_KEY}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha_base64}"'
-                authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode()
-                params = {
-                    "authorization": authorization,
-                    "date": date,
-                    "host": "spark-api.xf-yun.com"
-                }
-                url = f"wss://spark-api.xf-yun.com/v3.1/chat?{urlencode(params)}"
-                return url, date
-            
-            url, date = create_url()
-            logger.info(f"正在连接讯飞API: {url}")
-            # WebSocket header必须为列表
-            headers = [
-                f"Host: spark-api.xf-yun.com",
-                f"Date: {date}",
-            ]
-            ws = websocket.create_connection(url, header=headers, timeout=10)
-            logger.info("讯飞API WebSocket连接成功")
-            request_data = {
-                "header": {
-                    "app_id": settings.XUNFEI_APP_ID,
-                    "uid": str(self.user.id)
-                },
-                "parameter": {
-                    "chat": {
-                        "domain": "generalv3",
-                        "temperature": 0.5,
-                        "max_tokens": 2048
-                    }
-                },
-                "payload": {
-                    "message": {
-                        "text": [
-                            {"role": "user", "content": message}
-                        ]
-                    }
-                }
-            }
-            logger.info(f"发送请求数据: {json.dumps(request_data, ensure_ascii=False)}")
-            ws.send(json.dumps(request_data))
-            while True:
-                response = ws.recv()
-                logger.info(f"收到响应: {response}")
-                response_data = json.loads(response)
-                if response_data['header']['code'] != 0:
-                    error_msg = response_data.get('payload', {}).get('text', '请求失败')
-                    logger.error(f"API错误: {error_msg}")
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'text': error_msg
-                    }))
-                    break
-                if 'payload' in response_data and 'choices' in response_data['payload']:
-                    text = response_data['payload']['choices']['text'][0]['content']
-                    logger.info(f"AI回复: {text}")
-                    await self.send(text_data=json.dumps({
-                        'type': 'message',
-                        'text': text
-                    }))
-                else:
-                    logger.error(f"响应格式异常: {response_data}")
-                    await self.send(text_data=json.dumps({
-                        'type': 'error',
-                        'text': '响应格式异常'
-                    }))
-                    break
-                if response_data['header']['status'] == 2:
-                    logger.info("对话结束")
-                    break
-            ws.close()
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'text': '无效的JSON格式'
             }))
+            return
+        if data.get('type') == 'cancel':
+            if self.generation and not self.generation.done():
+                self.generation.cancel()
+            return
+        message = data.get('message', '')
+        if not message:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'text': '消息不能为空'
+            }))
+            return
+        if _user_generations[self.user.id] >= getattr(settings, 'AI_CHAT_MAX_CONCURRENT_PER_USER', 1):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'text': '上一条消息还在生成中，请稍后再试'
+            }))
+            return
+        # 生成在独立任务中进行，期间仍能处理取消消息和断开事件
+        _user_generations[self.user.id] += 1
+        self.generation = asyncio.ensure_future(self.generate(message))
+        self.generation.add_done_callback(lambda task: self._release_user_slot())
+
+    def _release_user_slot(self):
+        _user_generations[self.user.id] -= 1
+        if _user_generations[self.user.id] <= 0:
+            del _user_generations[self.user.id]
+
+    async def generate(self, message):
+        """调用星火流式生成，并把回复转发给浏览器"""
+        semaphore = _get_chat_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), getattr(settings, 'AI_CHAT_QUEUE_TIMEOUT', 5))
+        except asyncio.TimeoutError:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'text': '当前对话人数较多，请稍后再试'
+            }))
+            return
+        try:
+            await self.relay(get_spark_client().astream(
+                message,
+                domain='generalv3',
+                temperature=0.5,
+                max_tokens=2048,
+                uid=str(self.user.id)
+            ))
+            await self.send(text_data=json.dumps({'type': 'done'}))
+        except asyncio.CancelledError:
+            logger.info(f"AI聊天生成已取消 - 用户: {self.user.username}")
+            raise
+        except SparkClientError as e:
+            logger.error(f"API错误: {e}")
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'text': str(e)
+            }))
         except Exception as e:
             logger.error(f"处理消息时出错: {str(e)}")
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'text': f'处理消息时出错: {str(e)}'
-            })) 
\ No newline at end of file
+            }))
+        finally:
+            semaphore.release()
+
+    async def relay(self, tokens):
+        """
+        转发生成的文本
+
+        读取上游和向浏览器发送分开进行：发送较慢时，期间到达的多段文本合并为一条消息发送，
+        消息条数随发送速度自适应，不会在内存中积压大量小消息。
+        """
+        pending = []
+        arrived = asyncio.Event()
+        finished = False
+
+        async def read():
+            nonlocal finished
+            try:
+                async for token in tokens:
+                    logger.debug(f"AI回复: {token}")
+                    pending.append(token)
+                    arrived.set()
+            finally:
+                finished = True
+                arrived.set()
+
+        reader = asyncio.ensure_future(read())
+        try:
+            while True:
+                await arrived.wait()
+                arrived.clear()
+                if pending:
+                    text = ''.join(pending)
+                    pending.clear()
+                    await self.send(text_data=json.dumps({
+                        'type': 'message',
+                        'text': text
+                    }))
+                if finished and not pending:
+                    break
+            # 抛出上游错误
+            await reader
+        finally:
+            if not reader.done():
+                reader.cancel()
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.questions import extract_questions
+
+class Command(BaseCommand):
+    help = '为尚未提取的帖子回填面经问题（--all 重新提取全部帖子）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批处理的帖子数')
+        parser.add_argument('--all', action='store_true', help='重新提取全部帖子（修改提取规则后使用）')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.all() if options['all'] else Post.objects.filter(interview_questions__isnull=True)
+        self.stdout.write('开始提取帖子面经问题...')
+        last_id, processed, with_questions = 0, 0, 0
+        while True:
+            batch = list(posts.filter(id__gt=last_id).order_by('id').only('id', 'content')[:batch_size])
+            if not batch:
+                break
+            for post in batch:
+                post.interview_questions = extract_questions(post.content)
+                with_questions += bool(post.interview_questions)
+            # bulk_update不触发信号，也不改动updated_at
+            Post.objects.bulk_update(batch, ['interview_questions'])
+            processed += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f'已处理 {processed} 个帖子')
+        self.stdout.write(self.style.SUCCESS(f'提取完成，共 {processed} 个帖子，其中 {with_questions} 个包含问题'))
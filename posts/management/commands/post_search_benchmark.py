@@ -0,0 +1,171 @@
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from knowledge_base.keywords import keyword_matcher
+from posts.models import Post, PostSearchTerm, Tag
+from posts.search import document_terms, search_posts
+
+BENCHMARK_USERNAME = 'search_benchmark'
+SENTENCES = [
+    '一面问了{skill}的底层原理，追问了很多细节',
+    '手撕了一道算法题，{skill}相关的八股文也问了不少',
+    '项目里用到了{skill}，面试官让我讲讲为什么这样设计',
+    '二面是{position}的leader，聊了职业规划和实习经历',
+    '感觉{company}的面试体验不错，考察点比较全面',
+    '最后反问环节问了团队的技术栈和{industry}业务方向',
+    '整体难度中等，建议多准备{skill}和计算机网络',
+    'hr面问了期望薪资和到岗时间，{level}流程大概两周',
+]
+
+
+class Command(BaseCommand):
+    help = '生成合成帖子语料，压测帖子全文检索（默认100万帖，结束后删除生成的数据）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000, help='合成帖子数')
+        parser.add_argument('--batch-size', type=int, default=2000, help='每批写入的帖子数')
+        parser.add_argument('--queries', type=int, default=100, help='检索查询次数')
+        parser.add_argument('--legacy-queries', type=int, default=3, help='对比用的LIKE查询次数')
+        parser.add_argument('--seed', type=int, default=0, help='随机种子')
+        parser.add_argument('--keep', action='store_true', help='保留生成的数据')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocab = {category: keyword_matcher.labels(category)
+                 for category in ('company', 'position', 'skill', 'industry', 'level')}
+        user, _ = get_user_model().objects.get_or_create(username=BENCHMARK_USERNAME)
+        tags = {}
+        for tag_type in ('company', 'position', 'skill'):
+            for name in vocab[tag_type]:
+                tags[(name, tag_type)], _ = Tag.objects.get_or_create(
+                    name=name, tag_type=tag_type, defaults={'description': '检索压测标签'}
+                )
+
+        metrics = {'posts': options['posts']}
+        try:
+            metrics.update(self.build_corpus(user, tags, vocab, rng, options))
+            cache.delete('posts:search:document_count')
+            metrics['search'] = self.run_queries(vocab, rng, options['queries'])
+            metrics['legacy_like'] = self.run_legacy_queries(vocab, rng, options['legacy_queries'])
+        finally:
+            if not options['keep']:
+                self.stdout.write('删除生成的数据...')
+                self.cleanup(user)
+        self.stdout.write(json.dumps(metrics, ensure_ascii=False, indent=2))
+
+    def build_corpus(self, user, tags, vocab, rng, options):
+        through = Post.tags.through
+        insert_seconds = index_seconds = 0.0
+        terms = 0
+        last_id = Post.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        created = 0
+        while created < options['posts']:
+            size = min(options['batch_size'], options['posts'] - created)
+            docs = [self.synthetic_post(vocab, rng) for _ in range(size)]
+
+            started = time.perf_counter()
+            Post.objects.bulk_create([Post(title=title, content=content, author=user) for title, content, _ in docs])
+            # 部分数据库的bulk_create不回填主键，按插入顺序读回ID
+            ids = list(Post.objects.filter(author=user, id__gt=last_id).order_by('id').values_list('id', flat=True))
+            through.objects.bulk_create([
+                through(post_id=post_id, tag_id=tags[pair].id)
+                for post_id, (_, _, doc_tags) in zip(ids, docs) for pair in doc_tags
+            ])
+            insert_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            rows = [
+                PostSearchTerm(term=term, post_id=post_id, weight=weight)
+                for post_id, (title, content, doc_tags) in zip(ids, docs)
+                for term, weight in document_terms(title, content, doc_tags).items()
+            ]
+            PostSearchTerm.objects.bulk_create(rows, batch_size=5000)
+            index_seconds += time.perf_counter() - started
+
+            terms += len(rows)
+            created += size
+            last_id = ids[-1]
+            if created % (options['batch_size'] * 50) == 0 or created == options['posts']:
+                self.stdout.write(f'已生成 {created} 个帖子')
+        return {
+            'insert_seconds': round(insert_seconds, 2),
+            'index_seconds': round(index_seconds, 2),
+            'index_posts_per_second': round(created / index_seconds, 1) if index_seconds else None,
+            'terms': terms,
+            'terms_per_post': round(terms / created, 1) if created else 0,
+        }
+
+    def synthetic_post(self, vocab, rng):
+        company = rng.choice(vocab['company'])
+        position = rng.choice(vocab['position'])
+        skill = rng.choice(vocab['skill'])
+        level = rng.choice(vocab['level'])
+        title = f'{company}{position}{level}面经'
+        content = '，'.join(
+            rng.choice(SENTENCES).format(
+                skill=rng.choice(vocab['skill']), position=position, company=company,
+                industry=rng.choice(vocab['industry']), level=level
+            )
+            for _ in range(rng.randint(4, 8))
+        )
+        return title, content, [(company, 'company'), (position, 'position'), (skill, 'skill')]
+
+    def run_queries(self, vocab, rng, count):
+        latencies, filtered, empty = [], [], 0
+        for i in range(count):
+            query = f"{rng.choice(vocab['position'])} {rng.choice(vocab['skill'])} 面经"
+            tag_filters = {'company': rng.choice(vocab['company'])} if i % 2 else None
+            started = time.perf_counter()
+            results = search_posts(query, tag_filters=tag_filters, limit=10)
+            elapsed = (time.perf_counter() - started) * 1000
+            (filtered if tag_filters else latencies).append(elapsed)
+            empty += not results
+        return {
+            'unfiltered': self.summary(latencies),
+            'company_filtered': self.summary(filtered),
+            'empty_results': empty,
+        }
+
+    def run_legacy_queries(self, vocab, rng, count):
+        """原_search_interview_posts的LIKE查询方式，作为对比"""
+        latencies = []
+        for _ in range(count):
+            conditions = Q()
+            for keyword in (rng.choice(vocab['position']), rng.choice(vocab['skill'])):
+                conditions |= Q(tags__name__icontains=keyword)
+            content_conditions = Q()
+            for keyword in ('面试', '面经', '八股文', '技术问题', '考察', '考点'):
+                content_conditions |= Q(title__icontains=keyword) | Q(content__icontains=keyword)
+            started = time.perf_counter()
+            list(Post.objects.filter(conditions, tags__tag_type__in=['company', 'position', 'skill'])
+                 .distinct().filter(content_conditions).order_by('-likes_count', '-created_at')[:10])
+            latencies.append((time.perf_counter() - started) * 1000)
+        return self.summary(latencies)
+
+    def summary(self, latencies):
+        if not latencies:
+            return None
+        latencies = sorted(latencies)
+        return {
+            'count': len(latencies),
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0], 2),
+            'max_ms': round(latencies[-1], 2),
+        }
+
+    def cleanup(self, user):
+        PostSearchTerm.objects.filter(post__author=user).delete()
+        Post.tags.through.objects.filter(post__author=user).delete()
+        while True:
+            ids = list(Post.objects.filter(author=user).values_list('id', flat=True)[:5000])
+            if not ids:
+                break
+            Post.objects.filter(id__in=ids).delete()
+        cache.delete('posts:search:document_count')
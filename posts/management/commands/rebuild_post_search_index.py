@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.search import index_posts
+
+class Command(BaseCommand):
+    help = '重建全部帖子的全文检索索引（首次部署或批量导入帖子后运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批处理的帖子数')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.stdout.write('开始重建帖子检索索引...')
+        last_id, indexed, terms = 0, 0, 0
+        while True:
+            posts = list(
+                Post.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'title', 'content').prefetch_related('tags')[:batch_size]
+            )
+            if not posts:
+                break
+            terms += index_posts(posts)
+            indexed += len(posts)
+            last_id = posts[-1].id
+            self.stdout.write(f'已索引 {indexed} 个帖子')
+        self.stdout.write(self.style.SUCCESS(f'重建完成，共 {indexed} 个帖子、{terms} 个词项'))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0003_post_likes_count_post_replies_count_tag_post_tags"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="tags_status",
+            field=models.CharField(
+                choices=[
+                    ("none", "未生成"),
+                    ("pending", "等待生成"),
+                    ("processing", "生成中"),
+                    ("done", "已生成"),
+                    ("failed", "生成失败"),
+                ],
+                db_index=True,
+                default="none",
+                max_length=20,
+                verbose_name="标签生成状态",
+            ),
+        ),
+    ]
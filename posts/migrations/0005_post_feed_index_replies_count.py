@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:55
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_replies_count(apps, schema_editor):
+    Post = apps.get_model("posts", "Post")
+    Reply = apps.get_model("posts", "Reply")
+    counts = (
+        Reply.objects.filter(post=models.OuterRef("pk"))
+        .order_by()
+        .values("post")
+        .annotate(total=models.Count("id"))
+        .values("total")
+    )
+    Post.objects.update(
+        replies_count=Coalesce(
+            models.Subquery(counts, output_field=models.PositiveIntegerField()), 0
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0004_post_tags_status"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="posts_post_feed_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_replies_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0005_post_feed_index_replies_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostSearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=64, verbose_name="词项")),
+                ("weight", models.FloatField(default=0, verbose_name="权重")),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_terms",
+                        to="posts.post",
+                        verbose_name="帖子",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "帖子检索词项",
+                "verbose_name_plural": "帖子检索词项",
+                "unique_together": {("term", "post")},
+            },
+        ),
+    ]
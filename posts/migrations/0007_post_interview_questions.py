@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0006_postsearchterm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="interview_questions",
+            field=models.JSONField(blank=True, null=True, verbose_name="面经问题"),
+        ),
+    ]
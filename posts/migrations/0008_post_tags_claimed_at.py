@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0007_post_interview_questions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="tags_claimed_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="标签任务领取时间"
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+import math
+import re
+from collections import defaultdict
+
+from django.db import migrations
+
+# 与编写本迁移时的posts.search保持一致，不引用应用代码
+TITLE_BOOST = 3.0
+TAG_BOOST = 5.0
+CONTENT_BOOST = 1.0
+CONTENT_CHARS = 2000
+TERM_MAX_LENGTH = 64
+BATCH_SIZE = 500
+
+_TOKEN_RE = re.compile(r"[\u4e00-\u9fff]+|[a-z0-9][a-z0-9+#.]*")
+
+
+def tokenize(text):
+    for match in _TOKEN_RE.finditer((text or "").lower()):
+        token = match.group()
+        if "\u4e00" <= token[0] <= "\u9fff":
+            if len(token) == 1:
+                yield token
+            for i in range(len(token) - 1):
+                yield token[i : i + 2]
+        else:
+            token = token.rstrip(".")
+            if token:
+                yield token[:TERM_MAX_LENGTH]
+
+
+def document_terms(title, content, tags):
+    weights = defaultdict(float)
+    fields = [(title, TITLE_BOOST), ((content or "")[:CONTENT_CHARS], CONTENT_BOOST)]
+    fields += [(name, TAG_BOOST) for name, _ in tags]
+    for text, boost in fields:
+        counts = defaultdict(int)
+        for token in tokenize(text):
+            counts[token] += 1
+        for token, tf in counts.items():
+            weights[token] += boost * (1 + math.log(tf))
+    for name, tag_type in tags:
+        weights.setdefault(f"tag:{tag_type}:{name.lower()}"[:TERM_MAX_LENGTH], 0.0)
+        weights.setdefault(f"type:{tag_type}", 0.0)
+    return weights
+
+
+def index_existing_posts(apps, schema_editor):
+    """为已有帖子建立检索词项（按ID分批，重复执行时先删除该批已有的词项）"""
+    Post = apps.get_model("posts", "Post")
+    PostSearchTerm = apps.get_model("posts", "PostSearchTerm")
+    Through = Post.tags.through
+    last_id = 0
+    while True:
+        posts = list(
+            Post.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "title", "content")[:BATCH_SIZE]
+        )
+        if not posts:
+            break
+        post_ids = [post_id for post_id, _, _ in posts]
+        tags = defaultdict(list)
+        for post_id, name, tag_type in Through.objects.filter(
+            post_id__in=post_ids
+        ).values_list("post_id", "tag__name", "tag__tag_type"):
+            tags[post_id].append((name, tag_type))
+        rows = [
+            PostSearchTerm(term=term, post_id=post_id, weight=weight)
+            for post_id, title, content in posts
+            for term, weight in document_terms(title, content, tags[post_id]).items()
+        ]
+        PostSearchTerm.objects.filter(post_id__in=post_ids).delete()
+        PostSearchTerm.objects.bulk_create(rows, batch_size=2000)
+        last_id = post_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("posts", "0008_post_tags_claimed_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_posts, migrations.RunPython.noop),
+    ]
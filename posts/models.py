@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
 
+from .questions import extract_questions
+
 # Create your models here.
 
 class Tag(models.Model):
@@ -29,12 +31,23 @@ class Tag(models.Model):
         return f"[{self.get_tag_type_display()}] {self.name}"
 
 class Post(models.Model):
+    TAGS_STATUS_CHOICES = [
+        ('none', '未生成'),
+        ('pending', '等待生成'),
+        ('processing', '生成中'),
+        ('done', '已生成'),
+        ('failed', '生成失败'),
+    ]
+
     title = models.CharField(max_length=200, verbose_name='标题')
     content = models.TextField(verbose_name='内容')
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='作者')
     tags = models.ManyToManyField(Tag, blank=True, verbose_name='标签')
+    tags_status = models.CharField(max_length=20, choices=TAGS_STATUS_CHOICES, default='none', db_index=True, verbose_name='标签生成状态')
+    tags_claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='标签任务领取时间')  # 超时仍在生成中视为任务中断
     likes_count = models.PositiveIntegerField(default=0, verbose_name='点赞数')
     replies_count = models.PositiveIntegerField(default=0, verbose_name='回复数')
+    interview_questions = models.JSONField(null=True, blank=True, verbose_name='面经问题')  # 保存时从正文提取，为空表示尚未提取
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
@@ -42,10 +55,24 @@ class Post(models.Model):
         verbose_name = '帖子'
         verbose_name_plural = '帖子'
         ordering = ['-created_at']
+        indexes = [
+            # 帖子流按(created_at, id)游标分页
+            models.Index(fields=['-created_at', '-id'], name='posts_post_feed_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """保存时从正文提取面经问题；只更新部分字段且不含content时跳过"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.interview_questions = extract_questions(self.content)
+        elif 'content' in update_fields:
+            self.interview_questions = extract_questions(self.content)
+            kwargs['update_fields'] = set(update_fields) | {'interview_questions'}
+        super().save(*args, **kwargs)
+
 class Reply(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='replies', verbose_name='帖子')
     content = models.TextField(verbose_name='回复内容')
@@ -61,3 +88,17 @@ class Reply(models.Model):
 
     def __str__(self):
         return f"{self.author.username} 回复 {self.post.title}"
+
+class PostSearchTerm(models.Model):
+    """帖子全文检索的倒排索引：每个(词项, 帖子)一行，由posts.search维护"""
+    term = models.CharField(max_length=64, verbose_name='词项')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_terms', verbose_name='帖子')
+    weight = models.FloatField(default=0, verbose_name='权重')
+
+    class Meta:
+        verbose_name = '帖子检索词项'
+        verbose_name_plural = '帖子检索词项'
+        unique_together = ['term', 'post']  # 联合索引同时用于按词项查找倒排列表
+
+    def __str__(self):
+        return f"{self.term} -> {self.post_id}"
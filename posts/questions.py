@@ -0,0 +1,42 @@
+"""
+面经帖子的问题提取
+
+帖子保存时（Post.save）提取正文中的面试问题，存入Post.interview_questions，
+生成面试问题时直接读取，不再每次对长正文逐个跑正则。
+历史帖子运行 python manage.py extract_post_questions 回填。
+"""
+import re
+
+# 常见的问题标记模式，按顺序匹配
+QUESTION_PATTERNS = [
+    re.compile(pattern, re.MULTILINE)
+    for pattern in (
+        r'问：(.*?)(?=\n|$)',
+        r'Q：(.*?)(?=\n|$)',
+        r'Q:(.*?)(?=\n|$)',
+        r'\d+[.、](.*?)(?=\n|$)',
+        r'面试官：(.*?)(?=\n|$)',
+        r'面试问题：(.*?)(?=\n|$)',
+    )
+]
+MAX_QUESTIONS = 10
+
+
+def extract_questions(text):
+    """从文本中提取问题，最多MAX_QUESTIONS个"""
+    text = text or ''
+    questions = []
+    for pattern in QUESTION_PATTERNS:
+        for match in pattern.finditer(text):
+            question = match.group(1).strip()
+            if question and len(question) > 5:  # 过滤太短的问题
+                questions.append(question)
+
+    # 如果没有找到明确的问题格式，尝试按段落拆分并识别问题语句
+    if not questions:
+        for p in text.split('\n'):
+            p = p.strip()
+            if p and ('?' in p or '？' in p) and len(p) > 10:
+                questions.append(p)
+
+    return questions[:MAX_QUESTIONS]
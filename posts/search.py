@@ -0,0 +1,174 @@
+"""
+帖子全文检索
+
+倒排索引保存在PostSearchTerm表中，每个(词项, 帖子)一行，按词项查找走(term, post)联合索引，
+检索代价只与查询词项的倒排列表长度有关，不再对帖子表做LIKE全表扫描。
+
+分词：中文按相邻两字切分（二元组），查询也按同样方式切分，无需分词词典即可匹配任意中文词；
+英文和数字按单词切分并转为小写（保留c++、node.js这类符号）。
+
+权重：标签5、标题3、正文1，同一字段内词频按1+log(tf)累加；
+另外为每个标签写入权重为0的过滤词项（tag:<类型>:<名称>、type:<类型>），用于按标签过滤。
+
+排序：BM25风格的 Σ 权重 × idf，idf = log(1 + N / df)，df在查询时按词项统计；
+df超过总帖子数POST_SEARCH_MAX_DF_RATIO（默认0.5）的词项在有其他词项时不参与打分。
+
+索引维护：帖子保存、标签变化（信号及标签生成任务）时在事务提交后重建该帖子的词项；
+已有帖子由迁移0009建立词项；绕过ORM批量导入后运行 python manage.py rebuild_post_search_index。
+迁移中内联了分词和权重计算，修改这里的规则后需重建索引。
+"""
+import math
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+
+from .models import Post, PostSearchTerm
+
+TITLE_BOOST = 3.0
+TAG_BOOST = 5.0
+CONTENT_BOOST = 1.0
+TERM_MAX_LENGTH = PostSearchTerm._meta.get_field('term').max_length
+
+_TOKEN_RE = re.compile(r'[\u4e00-\u9fff]+|[a-z0-9][a-z0-9+#.]*')
+
+
+def _is_cjk(ch):
+    return '\u4e00' <= ch <= '\u9fff'
+
+
+def tokenize(text):
+    """切分文本，按出现顺序产出词项（可重复）"""
+    for match in _TOKEN_RE.finditer((text or '').lower()):
+        token = match.group()
+        if _is_cjk(token[0]):
+            if len(token) == 1:
+                yield token
+            for i in range(len(token) - 1):
+                yield token[i:i + 2]
+        else:
+            token = token.rstrip('.')
+            if token:
+                yield token[:TERM_MAX_LENGTH]
+
+
+def tag_filter_term(tag_type, name):
+    return f'tag:{tag_type}:{name.lower()}'[:TERM_MAX_LENGTH]
+
+
+def tag_type_term(tag_type):
+    return f'type:{tag_type}'
+
+
+def document_terms(title, content, tags):
+    """
+    计算一篇帖子的词项权重
+
+    Args:
+        tags: [(name, tag_type)]
+    Returns:
+        {词项: 权重}
+    """
+    content = (content or '')[:getattr(settings, 'POST_SEARCH_CONTENT_CHARS', 2000)]
+    weights = defaultdict(float)
+    fields = [(title, TITLE_BOOST), (content, CONTENT_BOOST)] + [(name, TAG_BOOST) for name, _ in tags]
+    for text, boost in fields:
+        counts = defaultdict(int)
+        for token in tokenize(text):
+            counts[token] += 1
+        for token, tf in counts.items():
+            weights[token] += boost * (1 + math.log(tf))
+    for name, tag_type in tags:
+        weights.setdefault(tag_filter_term(tag_type, name), 0.0)
+        weights.setdefault(tag_type_term(tag_type), 0.0)
+    return weights
+
+
+def index_posts(posts):
+    """重建这些帖子的词项（帖子需预取tags）"""
+    posts = list(posts)
+    rows = []
+    for post in posts:
+        tags = [(tag.name, tag.tag_type) for tag in post.tags.all()]
+        for term, weight in document_terms(post.title, post.content, tags).items():
+            rows.append(PostSearchTerm(term=term, post_id=post.id, weight=weight))
+    with transaction.atomic():
+        PostSearchTerm.objects.filter(post_id__in=[post.id for post in posts]).delete()
+        PostSearchTerm.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
+
+
+def reindex_posts(post_ids):
+    """按ID重建帖子的词项"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return 0
+    posts = Post.objects.filter(id__in=post_ids).only('id', 'title', 'content').prefetch_related('tags')
+    return index_posts(posts)
+
+
+def schedule_reindex(post_ids):
+    """在当前事务提交后重建这些帖子的词项"""
+    post_ids = set(post_ids)
+    transaction.on_commit(lambda: reindex_posts(post_ids))
+
+
+def _document_count():
+    return cache.get_or_set('posts:search:document_count', Post.objects.count, 600) or 1
+
+
+def search_posts(query, tag_filters=None, tag_types=None, limit=10, offset=0, defer=()):
+    """
+    按相关度检索帖子
+
+    Args:
+        query: 查询文本
+        tag_filters: {标签类型: 标签名或标签名列表}，同一类型内任一匹配，不同类型需同时满足
+        tag_types: 帖子至少带有其中一种类型的标签
+        defer: 不需要加载的帖子字段（如content）
+    Returns:
+        [(post, score)]，post已预取author和tags
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+
+    postings = PostSearchTerm.objects.all()
+    for tag_type, names in (tag_filters or {}).items():
+        names = [names] if isinstance(names, str) else names
+        postings = postings.filter(post_id__in=PostSearchTerm.objects.filter(
+            term__in=[tag_filter_term(tag_type, name) for name in names]
+        ).values('post_id'))
+    if tag_types:
+        postings = postings.filter(post_id__in=PostSearchTerm.objects.filter(
+            term__in=[tag_type_term(tag_type) for tag_type in tag_types]
+        ).values('post_id'))
+
+    # 各词项的文档频率，用于计算idf
+    total = _document_count()
+    document_frequency = dict(
+        PostSearchTerm.objects.filter(term__in=terms).values_list('term').annotate(df=Count('id'))
+    )
+    if not document_frequency:
+        return []
+    # 出现在大多数帖子中的词项（如“面经”）区分度很低，倒排列表却最长，有其他词项时不参与打分
+    max_df = total * getattr(settings, 'POST_SEARCH_MAX_DF_RATIO', 0.5)
+    selective = {term: df for term, df in document_frequency.items() if df <= max_df}
+    idf = {term: math.log(1 + total / df) for term, df in (selective or document_frequency).items()}
+
+    ranked = list(
+        postings.filter(term__in=idf.keys())
+        .values('post_id')
+        .annotate(score=Sum(F('weight') * Case(
+            *[When(term=term, then=Value(value)) for term, value in idf.items()],
+            default=Value(0.0), output_field=FloatField()
+        )))
+        .order_by('-score', '-post_id')[offset:offset + limit]
+    )
+    posts = Post.objects.select_related('author').prefetch_related('tags').defer(*defer).in_bulk(
+        [row['post_id'] for row in ranked]
+    )
+    return [(posts[row['post_id']], row['score']) for row in ranked if row['post_id'] in posts]
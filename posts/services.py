@@ -7,12 +7,25 @@ import hmac
 from urllib.parse import urlencode
 from datetime import datetime, timezone
 from django.conf import settings
+from django.db import transaction
 from .models import Tag, Post
+from knowledge_base.keywords import keyword_matcher
 import re
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 大模型返回的标签分类与Tag.tag_type的对应关系
+TAG_TYPE_MAPPING = {
+    'companies': 'company',
+    'positions': 'position',
+    'skills': 'skill',
+    'industries': 'industry',
+    'levels': 'level'
+}
+
+TAG_NAME_MAX_LENGTH = Tag._meta.get_field('name').max_length
+
 class XunfeiTagService:
     """讯飞大模型标签生成服务"""
     
@@ -66,9 +79,13 @@ class XunfeiTagService:
         使用讯飞大模型从帖子标题和内容中生成标签
         返回: {'companies': [], 'positions': [], 'skills': [], 'industries': [], 'levels': []}
         """
+        keyword_tags = self._fallback_extract_tags(title, content)
+        if self._is_confident(keyword_tags):
+            return keyword_tags
+
         if not all([self.app_id, self.api_secret, self.api_key]):
             logger.error("讯飞API配置不完整")
-            return self._fallback_extract_tags(title, content)
+            return keyword_tags
         
         try:
             # 构建提示词
@@ -84,8 +101,30 @@ class XunfeiTagService:
             
         except Exception as e:
             logger.error(f"讯飞大模型调用失败: {e}")
-            return self._fallback_extract_tags(title, content)
-    
+            return keyword_tags
+
+    def generate_tags_for_posts(self, posts):
+        """
+        一次大模型调用为多篇帖子生成标签
+        返回: {post.id: {'companies': [], 'positions': [], 'skills': [], 'industries': [], 'levels': []}}
+        关键词结果可信的帖子不进入大模型调用；大模型调用失败或结果中缺少某篇帖子时，该帖子使用关键词结果
+        """
+        keyword_tags = {post.id: self._fallback_extract_tags(post.title, post.content) for post in posts}
+        uncertain = [post for post in posts if not self._is_confident(keyword_tags[post.id])]
+        parsed = {}
+        if uncertain and not all([self.app_id, self.api_secret, self.api_key]):
+            logger.error("讯飞API配置不完整")
+        elif uncertain:
+            try:
+                prompt = self._build_batch_tag_extraction_prompt(uncertain)
+                # 每篇帖子的标签约需数百token
+                result = self._call_xunfei_api(prompt, max_tokens=min(4096, 512 * len(uncertain)))
+                parsed = self._parse_batch_tag_result(result)
+            except Exception as e:
+                logger.error(f"讯飞大模型批量调用失败: {e}")
+
+        return {post.id: parsed.get(str(post.id)) or keyword_tags[post.id] for post in posts}
+
     def _build_tag_extraction_prompt(self, title, content):
         """构建标签提取的提示词"""
         prompt = f"""
@@ -117,8 +156,46 @@ class XunfeiTagService:
 - 技能要具体化，避免过于宽泛
 """
         return prompt
-    
-    def _call_xunfei_api(self, prompt):
+
+    def _build_batch_tag_extraction_prompt(self, posts):
+        """构建多篇帖子的标签提取提示词，结果按帖子编号返回"""
+        sections = "\n\n".join(
+            f"【帖子{post.id}】\n标题：{post.title}\n内容：{post.content[:500]}"
+            for post in posts
+        )
+        example_id = posts[0].id
+        prompt = f"""
+请从以下{len(posts)}篇面试经验分享中分别提取相关标签信息，并按照指定格式返回JSON：
+
+{sections}
+
+请为每篇帖子提取以下类型的标签：
+1. 公司名称（如：阿里巴巴、腾讯、字节跳动等）
+2. 岗位名称（如：前端工程师、Java开发、产品经理等）
+3. 技能要求（如：Python、MySQL、算法、设计模式等）
+4. 行业分类（如：互联网、金融、教育等）
+5. 级别要求（如：实习、校招、社招、高级等）
+
+返回格式严格按照以下JSON格式，键为帖子编号：
+{{
+    "{example_id}": {{
+        "companies": ["公司1", "公司2"],
+        "positions": ["岗位1", "岗位2"],
+        "skills": ["技能1", "技能2", "技能3"],
+        "industries": ["行业1"],
+        "levels": ["级别1"]
+    }}
+}}
+
+注意：
+- 只返回JSON，不要其他文字
+- 每篇帖子都要返回，如果某个类型没有相关信息，返回空数组
+- 公司名称要准确，避免简称
+- 技能要具体化，避免过于宽泛
+"""
+        return prompt
+
+    def _call_xunfei_api(self, prompt, max_tokens=1024):
         """调用讯飞API（使用HTTP接口）"""
         url = "https://spark-api-open.xf-yun.com/v1/chat/completions"
         
@@ -135,7 +212,7 @@ class XunfeiTagService:
                     "content": prompt
                 }
             ],
-            "max_tokens": 1024,
+            "max_tokens": max_tokens,
             "temperature": 0.1,
             "stream": False
         }
@@ -162,90 +239,115 @@ class XunfeiTagService:
             if json_match:
                 json_str = json_match.group()
                 tags = json.loads(json_str)
-                
-                # 验证并清理数据
-                cleaned_tags = {
-                    'companies': [tag.strip() for tag in tags.get('companies', []) if tag.strip()],
-                    'positions': [tag.strip() for tag in tags.get('positions', []) if tag.strip()],
-                    'skills': [tag.strip() for tag in tags.get('skills', []) if tag.strip()],
-                    'industries': [tag.strip() for tag in tags.get('industries', []) if tag.strip()],
-                    'levels': [tag.strip() for tag in tags.get('levels', []) if tag.strip()],
-                }
-                
-                return cleaned_tags
+                return self._clean_tags(tags)
             else:
                 raise ValueError("无法从结果中提取JSON")
                 
         except Exception as e:
             logger.error(f"解析标签结果失败: {e}")
+            return {key: [] for key in TAG_TYPE_MAPPING}
+
+    def _parse_batch_tag_result(self, result):
+        """解析批量标签结果，返回 {帖子编号字符串: 标签}，无法解析时返回空字典"""
+        try:
+            json_match = re.search(r'\{.*\}', result, re.DOTALL)
+            if not json_match:
+                raise ValueError("无法从结果中提取JSON")
+            data = json.loads(json_match.group())
             return {
-                'companies': [],
-                'positions': [],
-                'skills': [],
-                'industries': [],
-                'levels': []
+                str(post_id).strip(): self._clean_tags(tags)
+                for post_id, tags in data.items()
+                if isinstance(tags, dict)
             }
+        except Exception as e:
+            logger.error(f"解析批量标签结果失败: {e}")
+            return {}
+
+    def _clean_tags(self, tags):
+        """验证并清理数据：去掉空白、非字符串和超出长度的标签"""
+        return {
+            key: [
+                tag.strip() for tag in tags.get(key, [])
+                if isinstance(tag, str) and tag.strip() and len(tag.strip()) <= TAG_NAME_MAX_LENGTH
+            ]
+            for key in TAG_TYPE_MAPPING
+        }
     
     def _fallback_extract_tags(self, title, content):
-        """备用标签提取方法（基于关键词匹配）"""
-        text = f"{title} {content}".lower()
-        
-        # 定义常见的标签关键词
-        company_keywords = ['阿里', '腾讯', '字节', '美团', '滴滴', '京东', '百度', '网易', '小米', '华为']
-        position_keywords = ['前端', '后端', 'java', 'python', '产品', '运营', '测试', '算法', 'ai', '数据']
-        skill_keywords = ['mysql', 'redis', 'spring', 'vue', 'react', 'docker', 'kubernetes', 'git']
-        industry_keywords = ['互联网', '金融', '教育', '医疗', '电商', '游戏']
-        level_keywords = ['实习', '校招', '社招', '应届', '经验']
-        
-        result = {
-            'companies': [kw for kw in company_keywords if kw in text],
-            'positions': [kw for kw in position_keywords if kw in text],
-            'skills': [kw for kw in skill_keywords if kw in text],
-            'industries': [kw for kw in industry_keywords if kw in text],
-            'levels': [kw for kw in level_keywords if kw in text]
-        }
-        
-        return result
+        """备用标签提取方法（基于共享关键词表，一次扫描得到各类标签）"""
+        hits = keyword_matcher.scan(f"{title} {content}")
+        return {key: keyword_matcher.extract(None, tag_type, hits=hits) for key, tag_type in TAG_TYPE_MAPPING.items()}
+
+    def _is_confident(self, tags):
+        """
+        关键词结果是否足够可信，可信时不再调用大模型
+
+        需要同时命中公司和岗位，且标签总数不少于POST_TAG_MIN_KEYWORD_TAGS
+        """
+        if not tags.get('companies') or not tags.get('positions'):
+            return False
+        return sum(len(names) for names in tags.values()) >= getattr(settings, 'POST_TAG_MIN_KEYWORD_TAGS', 3)
     
     def create_tags_for_post(self, post):
         """为帖子创建标签"""
         try:
-            # 生成标签
-            tag_data = self.generate_tags_from_content(post.title, post.content)
-            
-            created_tags = []
-            
-            # 创建各类型标签
-            tag_type_mapping = {
-                'companies': 'company',
-                'positions': 'position', 
-                'skills': 'skill',
-                'industries': 'industry',
-                'levels': 'level'
-            }
-            
-            for key, tag_type in tag_type_mapping.items():
-                for tag_name in tag_data.get(key, []):
-                    tag, created = Tag.objects.get_or_create(
-                        name=tag_name,
-                        tag_type=tag_type,
-                        defaults={'description': f'自动生成的{tag_type}标签'}
-                    )
-                    created_tags.append(tag)
-                    if created:
-                        logger.info(f"创建新标签: [{tag.get_tag_type_display()}] {tag.name}")
-            
-            # 关联标签到帖子
-            if created_tags:
-                post.tags.set(created_tags)
-                logger.info(f"为帖子 {post.id} 设置了 {len(created_tags)} 个标签")
-            
-            return created_tags
-            
+            return self.create_tags_for_posts([post]).get(post.id, [])
         except Exception as e:
             logger.error(f"为帖子创建标签失败: {e}")
             return []
 
+    def create_tags_for_posts(self, posts):
+        """
+        为一批帖子生成并保存标签，返回 {post.id: [Tag]}
+
+        一次大模型调用覆盖整批帖子；标签用bulk_create(ignore_conflicts=True)批量插入，
+        帖子与标签的关联通过中间表一次性写入。没有生成任何标签的帖子保留原有标签。
+        """
+        tag_data = self.generate_tags_for_posts(posts)
+
+        wanted = {}
+        for post in posts:
+            pairs = []
+            for key, tag_type in TAG_TYPE_MAPPING.items():
+                for tag_name in tag_data.get(post.id, {}).get(key, []):
+                    if (tag_name, tag_type) not in pairs:
+                        pairs.append((tag_name, tag_type))
+            if pairs:
+                wanted[post.id] = pairs
+        if not wanted:
+            return {post.id: [] for post in posts}
+
+        all_pairs = {pair for pairs in wanted.values() for pair in pairs}
+        names = {name for name, _ in all_pairs}
+        through = Post.tags.through
+        with transaction.atomic():
+            existing = set(Tag.objects.filter(name__in=names).values_list('name', 'tag_type'))
+            missing = all_pairs - existing
+            if missing:
+                # 并发任务可能同时创建同名标签，依赖(name, tag_type)唯一约束忽略冲突
+                Tag.objects.bulk_create(
+                    [Tag(name=name, tag_type=tag_type, description=f'自动生成的{tag_type}标签')
+                     for name, tag_type in missing],
+                    ignore_conflicts=True
+                )
+                for name, tag_type in sorted(missing):
+                    logger.info(f"创建新标签: [{dict(Tag.TAG_TYPES)[tag_type]}] {name}")
+
+            tags = {(tag.name, tag.tag_type): tag for tag in Tag.objects.filter(name__in=names)}
+            through.objects.filter(post_id__in=wanted.keys()).delete()
+            through.objects.bulk_create(
+                [through(post_id=post_id, tag_id=tags[pair].id)
+                 for post_id, pairs in wanted.items() for pair in pairs if pair in tags],
+                ignore_conflicts=True
+            )
+
+        result = {}
+        for post in posts:
+            result[post.id] = [tags[pair] for pair in wanted.get(post.id, []) if pair in tags]
+            if result[post.id]:
+                logger.info(f"为帖子 {post.id} 设置了 {len(result[post.id])} 个标签")
+        return result
+
 
 # 服务实例
 tag_service = XunfeiTagService() 
\ No newline at end of file
@@ -0,0 +1,51 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_posts
+from .models import Post, Reply
+from .search import schedule_reindex
+
+
+@receiver(post_save, sender=Reply)
+def increment_replies_count(sender, instance, created, **kwargs):
+    """新增回复时在同一事务中维护帖子的回复数"""
+    if created:
+        Post.objects.filter(id=instance.post_id).update(replies_count=F('replies_count') + 1)
+
+
+@receiver(post_delete, sender=Reply)
+def decrement_replies_count(sender, instance, **kwargs):
+    """删除回复（含级联删除的子回复）时维护帖子的回复数"""
+    Post.objects.filter(id=instance.post_id).update(replies_count=Greatest(F('replies_count') - 1, 0))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_cache(sender, instance, **kwargs):
+    """帖子新增、修改或删除时，使帖子流和该帖子详情的缓存失效"""
+    invalidate_posts([instance.id])
+
+
+@receiver(post_save, sender=Post)
+def reindex_post(sender, instance, **kwargs):
+    """帖子新增或修改后（事务提交时）重建其检索词项"""
+    schedule_reindex([instance.id])
+
+
+@receiver(post_save, sender=Reply)
+@receiver(post_delete, sender=Reply)
+def invalidate_reply_cache(sender, instance, **kwargs):
+    """回复变化会改变帖子详情和帖子流中的回复数"""
+    invalidate_posts([instance.post_id])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def sync_post_tags(sender, instance, action, pk_set, **kwargs):
+    """通过post.tags修改标签时使详情缓存失效并重建检索词项（标签任务批量写中间表，由任务自行处理）"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    post_ids = [instance.id] if isinstance(instance, Post) else (pk_set or [])
+    invalidate_posts(post_ids)
+    schedule_reindex(post_ids)
@@ -0,0 +1,112 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .cache import invalidate_posts
+from .models import Post
+from .search import reindex_posts
+from .services import tag_service
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_post_tagging(post_ids):
+    """
+    将帖子标记为等待生成标签，并在事务提交后按POST_TAG_BATCH_SIZE分批投递生成任务
+
+    任务投递失败时帖子标记为生成失败，客户端可通过tags_status得知
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    Post.objects.filter(id__in=post_ids).update(tags_status='pending')
+    invalidate_posts(post_ids)
+    batch_size = getattr(settings, 'POST_TAG_BATCH_SIZE', 5)
+
+    def dispatch():
+        for i in range(0, len(post_ids), batch_size):
+            batch = post_ids[i:i + batch_size]
+            try:
+                generate_post_tags.delay(batch)
+            except Exception:
+                logger.exception(f"投递标签生成任务失败 - post_ids: {batch}")
+                Post.objects.filter(id__in=batch).update(tags_status='failed')
+                invalidate_posts(batch)
+
+    transaction.on_commit(dispatch)
+
+
+def _requeue_stale_posts():
+    """
+    生成中超过POST_TAG_PROCESSING_TIMEOUT秒的帖子（worker被杀、任务中断）重新置为等待生成，
+    由本次或之后的标签任务补齐批次时领取。返回重新排队的帖子数
+    """
+    timeout = getattr(settings, 'POST_TAG_PROCESSING_TIMEOUT', 600)
+    count = Post.objects.filter(
+        tags_status='processing', tags_claimed_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(tags_status='pending')
+    if count:
+        logger.warning(f"{count} 个帖子标签生成超时，重新排队")
+    return count
+
+
+def _claim_posts(candidate_ids, limit=None):
+    """
+    逐个以条件更新领取帖子，只保留本任务成功从pending改为processing的帖子，多个worker不会领到同一篇；
+    领够limit篇即停止
+    """
+    now = timezone.now()
+    claimed = []
+    for post_id in candidate_ids:
+        if limit is not None and len(claimed) >= limit:
+            break
+        if Post.objects.filter(id=post_id, tags_status='pending').update(tags_status='processing', tags_claimed_at=now):
+            claimed.append(post_id)
+    return claimed
+
+
+@shared_task(name='posts.generate_post_tags')
+def generate_post_tags(post_ids):
+    """
+    为一批帖子生成标签（一次大模型调用）
+
+    批次不满POST_TAG_BATCH_SIZE时顺带处理其他等待中的帖子，逐篇发帖产生的单帖任务也能合并调用；
+    已被其他任务领取的帖子不再是pending状态，会被跳过。返回本次处理的帖子数
+    """
+    batch_size = getattr(settings, 'POST_TAG_BATCH_SIZE', 5)
+    _requeue_stale_posts()
+    ids = _claim_posts(Post.objects.filter(id__in=post_ids, tags_status='pending').values_list('id', flat=True))
+    # 补齐批次：候选多取一些，被其他任务抢先领取的跳过
+    while len(ids) < batch_size:
+        candidates = list(
+            Post.objects.filter(tags_status='pending').order_by('created_at')
+            .values_list('id', flat=True)[:(batch_size - len(ids)) * 2]
+        )
+        if not candidates:
+            break
+        ids += _claim_posts(candidates, limit=batch_size - len(ids))
+    if not ids:
+        logger.info(f"没有等待生成标签的帖子 - post_ids: {post_ids}")
+        return 0
+
+    invalidate_posts(ids)
+    logger.info(f"开始生成帖子标签 - post_ids: {ids}")
+    try:
+        posts = list(Post.objects.filter(id__in=ids).only('id', 'title', 'content'))
+        tag_service.create_tags_for_posts(posts)
+        # 标签通过中间表批量写入，不会触发信号，这里重建检索词项
+        reindex_posts(ids)
+    except Exception:
+        logger.exception(f"生成帖子标签出错 - post_ids: {ids}")
+        Post.objects.filter(id__in=ids, tags_status='processing').update(tags_status='failed')
+        invalidate_posts(ids)
+        return 0
+
+    # 处理期间被修改而重新排队的帖子保持pending，由其自己的任务重新生成
+    Post.objects.filter(id__in=ids, tags_status='processing').update(tags_status='done')
+    invalidate_posts(ids)
+    logger.info(f"帖子标签生成完成 - post_ids: {ids}")
+    return len(ids)
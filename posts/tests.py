@@ -1,3 +1,59 @@
-from django.test import TestCase
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+
+from .models import Reply
+from .views import _build_reply_tree
 
 # Create your tests here.
+
+
+def make_children(edges):
+    """edges: [(reply_id, parent_reply_id)]，按顺序构造内存中的回复分组"""
+    author = get_user_model()(username='tester')
+    children = defaultdict(list)
+    for reply_id, parent_id in edges:
+        children[parent_id].append(Reply(id=reply_id, content=f'reply {reply_id}', author=author, parent_reply_id=parent_id))
+    return children
+
+
+@override_settings(REPLY_TREE_MAX_DEPTH=3, REPLY_TREE_MAX_CHILDREN=2)
+class ReplyTreeTests(SimpleTestCase):
+    def test_depth_cap_marks_has_more_children(self):
+        # 1 -> 2 -> 3 -> 4 -> 5 的单链
+        children = make_children([(1, None), (2, 1), (3, 2), (4, 3), (5, 4)])
+        tree = _build_reply_tree(children)
+
+        node = tree[0]
+        for expected_id, depth in ((1, 0), (2, 1)):
+            self.assertEqual((node['id'], node['depth']), (expected_id, depth))
+            self.assertFalse(node['has_more_children'])
+            node = node['child_replies'][0]
+
+        # 第三层（depth=2）是最深一层：子回复不展开，标记还有更多
+        self.assertEqual((node['id'], node['depth']), (3, 2))
+        self.assertEqual(node['child_count'], 1)
+        self.assertEqual(node['child_replies'], [])
+        self.assertTrue(node['has_more_children'])
+
+    def test_children_capped_per_level(self):
+        children = make_children([(1, None), (2, 1), (3, 1), (4, 1)])
+        node = _build_reply_tree(children)[0]
+        self.assertEqual([child['id'] for child in node['child_replies']], [2, 3])
+        self.assertEqual(node['child_count'], 3)
+        self.assertTrue(node['has_more_children'])
+
+    def test_offset_paging(self):
+        children = make_children([(1, None), (2, 1), (3, 1), (4, 1), (5, 1), (6, 5)])
+        pages = [_build_reply_tree(children, parent_id=1, depth=1, offset=offset) for offset in (0, 2, 4)]
+        self.assertEqual([[reply['id'] for reply in page] for page in pages], [[2, 3], [4, 5], []])
+        # 分页加载的子树从所在层重新计算深度上限
+        self.assertEqual(pages[1][1]['depth'], 1)
+        self.assertEqual([child['id'] for child in pages[1][1]['child_replies']], [6])
+
+    def test_subtree_depth_limit_from_explicit_max_depth(self):
+        children = make_children([(1, None), (2, 1), (3, 2)])
+        node = _build_reply_tree(children, max_depth=1)[0]
+        self.assertEqual(node['child_replies'], [])
+        self.assertTrue(node['has_more_children'])
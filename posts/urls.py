@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (
-    create_post, delete_post, update_post, list_posts, chat_with_ai,
-    get_post_detail, create_reply, update_reply, delete_reply
+    create_post, delete_post, update_post, list_posts, search_posts, chat_with_ai,
+    get_post_detail, get_reply_children, get_post_tags, create_reply, update_reply, delete_reply
 )
 
 urlpatterns = [
@@ -9,7 +9,10 @@ urlpatterns = [
     path('delete/<int:post_id>/', delete_post, name='delete_post'),
     path('update/<int:post_id>/', update_post, name='update_post'),
     path('list/', list_posts, name='list_posts'),
+    path('search/', search_posts, name='search_posts'),
     path('detail/<int:post_id>/', get_post_detail, name='get_post_detail'),
+    path('tags/<int:post_id>/', get_post_tags, name='get_post_tags'),
+    path('detail/<int:post_id>/replies/', get_reply_children, name='get_reply_children'),
     path('chat/', chat_with_ai, name='chat_with_ai'),
     
     # 回复相关接口
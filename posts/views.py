@@ -5,19 +5,24 @@ from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from .models import Post, Reply
+from .cache import detail_cache, feed_cache
+from . import search as post_search
+from .tasks import enqueue_post_tagging
 import json
+import logging
 from django.core.paginator import Paginator
-import websocket
-from websocket import WebSocketBadStatusException
-import json
-import time
-import hashlib
+from django.db import transaction
+from django.db.models import Q
+import asyncio
 import base64
-import hmac
-from urllib.parse import urlencode
-from datetime import datetime, timezone
+import binascii
+from collections import defaultdict
+from datetime import datetime
 from django.http import StreamingHttpResponse
 from django.conf import settings
+from knowledge_base.spark_client import SparkClientError, get_spark_client
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -32,7 +37,9 @@ def create_post(request):
         if not title or not content:
             return JsonResponse({'error': '标题和内容不能为空'}, status=400)
         post = Post.objects.create(title=title, content=content, author=request.user)
-        return JsonResponse({'msg': '发帖成功', 'post_id': post.id})
+        # 标签在后台任务中生成，客户端通过tags_status轮询
+        enqueue_post_tagging([post.id])
+        return JsonResponse({'msg': '发帖成功', 'post_id': post.id, 'tags_status': 'pending'})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -62,89 +69,280 @@ def update_post(request, post_id):
         data = json.loads(request.body.decode())
         title = data.get('title')
         content = data.get('content')
+        changed = (title and title != post.title) or (content and content != post.content)
         if title:
             post.title = title
         if content:
             post.content = content
         post.save()
+        if changed:
+            enqueue_post_tagging([post.id])
         return JsonResponse({'msg': '修改成功'})
     except Post.DoesNotExist:
         return JsonResponse({'error': '帖子不存在'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+def _encode_feed_cursor(post):
+    """把帖子的(created_at, id)编码为不透明的游标"""
+    raw = f"{post.created_at.isoformat()}|{post.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_feed_cursor(cursor):
+    """解析游标，格式错误时抛出ValueError"""
+    try:
+        created_at, post_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, AttributeError) as e:
+        raise ValueError(str(e))
+
+def _feed_item(post):
+    return {
+        'id': post.id,
+        'title': post.title,
+        'content': post.content,
+        'author': post.author.username,
+        'created_at': post.created_at,
+        'updated_at': post.updated_at,
+        'reply_count': post.replies_count,
+        'likes_count': post.likes_count,
+        'tags_status': post.tags_status
+    }
+
+def _build_feed_page(posts, cursor, page_size):
+    """按游标取一页帖子"""
+    if cursor:
+        created_at, post_id = _decode_feed_cursor(cursor)
+        posts = posts.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id))
+    # 多取一条判断是否还有下一页
+    page = list(posts[:page_size + 1])
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    return JsonResponse({
+        'results': [_feed_item(post) for post in page],
+        'next_cursor': _encode_feed_cursor(page[-1]) if has_more else None,
+        'has_more': has_more
+    })
+
 @csrf_exempt
 @api_view(['GET'])
 def list_posts(request):
+    """
+    帖子流
+
+    默认按页码分页，返回total/num_pages/current_page（不缓存）。只有前POST_FEED_COUNT_PAGES页（默认5）统计总数，
+    更深的页不做COUNT，total/num_pages返回None，用has_more判断是否还有下一页；
+    页码分页的响应也带next_cursor，客户端可以从任意一页切换到游标分页继续往下翻。
+    传入cursor参数（首页传空值cursor=）或mode=cursor时按(created_at, id)游标分页：
+    传入上一页返回的next_cursor获取下一页，每页只做一次带索引的范围查询，不统计总数，
+    翻到多深的位置代价都相同；结果经响应缓存，有帖子或回复写入时失效。
+    """
     try:
-        page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('page_size', 10))
-        posts = Post.objects.all().order_by('-created_at')
-        paginator = Paginator(posts, page_size)
-        page_obj = paginator.get_page(page)
-        data = [
-            {
-                'id': post.id,
-                'title': post.title,
-                'content': post.content,
-                'author': post.author.username,
-                'created_at': post.created_at,
-                'updated_at': post.updated_at,
-                'reply_count': post.replies.count()
-            }
-            for post in page_obj
-        ]
+        page_size = min(max(int(request.GET.get('page_size', 10)), 1), getattr(settings, 'POST_FEED_MAX_PAGE_SIZE', 50))
+        posts = Post.objects.select_related('author').order_by('-created_at', '-id')
+
+        if 'cursor' not in request.GET and request.GET.get('mode') != 'cursor':
+            page_number = max(int(request.GET.get('page', 1)), 1)
+            total = num_pages = None
+            if page_number <= getattr(settings, 'POST_FEED_COUNT_PAGES', 5):
+                paginator = Paginator(posts, page_size)
+                page_obj = paginator.get_page(page_number)
+                page, page_number, has_more = list(page_obj), page_obj.number, page_obj.has_next()
+                total, num_pages = paginator.count, paginator.num_pages
+            else:
+                # 深页不统计总数，多取一条判断是否还有下一页
+                offset = (page_number - 1) * page_size
+                page = list(posts[offset:offset + page_size + 1])
+                has_more = len(page) > page_size
+                page = page[:page_size]
+            return JsonResponse({
+                'results': [_feed_item(post) for post in page],
+                'total': total,
+                'num_pages': num_pages,
+                'current_page': page_number,
+                'has_more': has_more,
+                'next_cursor': _encode_feed_cursor(page[-1]) if has_more else None
+            })
+
+        cursor = request.GET.get('cursor', '')
+        return feed_cache.get_or_build(
+            'all', lambda: _build_feed_page(posts, cursor, page_size), params=f'{cursor}:{page_size}'
+        )
+    except ValueError:
+        return JsonResponse({'error': '参数格式错误'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@api_view(['GET'])
+def search_posts(request):
+    """
+    帖子全文检索，按相关度排序
+
+    参数：q 查询文本；company/position/skill 按该类型的标签名过滤（可用英文逗号分隔多个）；
+    tag_type 帖子至少带有其中一种类型的标签（逗号分隔）；page_size、offset 分页。
+    """
+    try:
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return JsonResponse({'error': '请输入搜索内容'}, status=400)
+        page_size = min(max(int(request.GET.get('page_size', 10)), 1), getattr(settings, 'POST_FEED_MAX_PAGE_SIZE', 50))
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        tag_filters = {
+            tag_type: [name.strip() for name in request.GET[tag_type].split(',') if name.strip()]
+            for tag_type in ('company', 'position', 'skill') if request.GET.get(tag_type)
+        }
+        tag_types = [t.strip() for t in request.GET.get('tag_type', '').split(',') if t.strip()]
+
+        results = post_search.search_posts(
+            query, tag_filters=tag_filters, tag_types=tag_types, limit=page_size + 1, offset=offset
+        )
+        has_more = len(results) > page_size
         return JsonResponse({
-            'results': data,
-            'total': paginator.count,
-            'num_pages': paginator.num_pages,
-            'current_page': page_obj.number
+            'results': [
+                dict(_feed_item(post), score=round(score, 4),
+                     tags=[{'name': tag.name, 'tag_type': tag.tag_type} for tag in post.tags.all()])
+                for post, score in results[:page_size]
+            ],
+            'next_offset': offset + page_size if has_more else None,
+            'has_more': has_more
         })
+    except ValueError:
+        return JsonResponse({'error': '参数格式错误'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+def _load_reply_children(post):
+    """一次查询取出帖子的全部回复（连同作者），按父回复分组，返回 {parent_reply_id: [Reply]}"""
+    children = defaultdict(list)
+    replies = Reply.objects.filter(post=post).select_related('author').order_by('created_at', 'id')
+    for reply in replies:
+        children[reply.parent_reply_id].append(reply)
+    return children
+
+def _build_reply_tree(children, parent_id=None, depth=0, offset=0, max_depth=None):
+    """
+    在内存中组装回复树
+
+    每层最多返回REPLY_TREE_MAX_CHILDREN条，超过max_depth层（默认REPLY_TREE_MAX_DEPTH）的子回复不展开；
+    child_count为直接子回复总数，has_more_children为True时客户端通过get_reply_children继续加载
+    """
+    if max_depth is None:
+        max_depth = depth + getattr(settings, 'REPLY_TREE_MAX_DEPTH', 5)
+    max_children = getattr(settings, 'REPLY_TREE_MAX_CHILDREN', 20)
+    result = []
+    for reply in children.get(parent_id, [])[offset:offset + max_children]:
+        kids = children.get(reply.id, [])
+        child_replies = _build_reply_tree(children, reply.id, depth + 1, 0, max_depth) if depth + 1 < max_depth else []
+        result.append({
+            'id': reply.id,
+            'content': reply.content,
+            'author': reply.author.username,
+            'created_at': reply.created_at,
+            'updated_at': reply.updated_at,
+            'parent_reply_id': reply.parent_reply_id,
+            'depth': depth,
+            'child_count': len(kids),
+            'has_more_children': len(child_replies) < len(kids),
+            'child_replies': child_replies
+        })
+    return result
+
+def _build_post_detail(post_id):
+    """帖子详情响应，帖子不存在时抛出Post.DoesNotExist"""
+    post = Post.objects.select_related('author').get(id=post_id)
+    
+    # 一次查询取出所有回复，在内存中组装回复树
+    children = _load_reply_children(post)
+    replies = _build_reply_tree(children)
+    
+    # 构建帖子详细信息
+    post_data = {
+        'id': post.id,
+        'title': post.title,
+        'content': post.content,
+        'author': post.author.username,
+        'created_at': post.created_at,
+        'updated_at': post.updated_at,
+        'reply_count': sum(len(group) for group in children.values()),
+        'tags': [{'name': tag.name, 'tag_type': tag.tag_type} for tag in post.tags.all()],
+        'tags_status': post.tags_status,
+        'top_level_reply_count': len(children.get(None, [])),
+        'has_more_replies': len(replies) < len(children.get(None, [])),
+        'replies': replies
+    }
+    
+    return JsonResponse({
+        'success': True,
+        'post': post_data
+    })
+
 @csrf_exempt
 @api_view(['GET'])
 def get_post_detail(request, post_id):
-    """获取帖子详细信息，包含所有回复"""
+    """获取帖子详细信息，包含回复树（层数和每层条数受限，其余通过get_reply_children加载），结果经响应缓存"""
     try:
-        post = get_object_or_404(Post, id=post_id)
-        
-        # 获取所有回复（包括嵌套回复）
-        def get_replies_with_children(parent_reply=None):
-            """递归获取回复及其子回复"""
-            replies = Reply.objects.filter(post=post, parent_reply=parent_reply).order_by('created_at')
-            result = []
-            for reply in replies:
-                reply_data = {
-                    'id': reply.id,
-                    'content': reply.content,
-                    'author': reply.author.username,
-                    'created_at': reply.created_at,
-                    'updated_at': reply.updated_at,
-                    'parent_reply_id': reply.parent_reply.id if reply.parent_reply else None,
-                    'child_replies': get_replies_with_children(reply)
-                }
-                result.append(reply_data)
-            return result
-        
-        # 构建帖子详细信息
-        post_data = {
-            'id': post.id,
-            'title': post.title,
-            'content': post.content,
-            'author': post.author.username,
-            'created_at': post.created_at,
-            'updated_at': post.updated_at,
-            'reply_count': post.replies.count(),
-            'replies': get_replies_with_children()
-        }
-        
+        return detail_cache.get_or_build(post_id, lambda: _build_post_detail(post_id))
+    except Post.DoesNotExist:
+        return JsonResponse({'error': '帖子不存在'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@api_view(['GET'])
+def get_reply_children(request, post_id):
+    """
+    分页加载回复树中未展开的部分
+
+    参数 parent_reply_id：父回复ID，不传时加载顶层回复；offset：从该父回复的第几条子回复开始。
+    返回的子树从父回复的下一层开始，再展开REPLY_TREE_MAX_DEPTH层
+    """
+    try:
+        post = Post.objects.only('id').get(id=post_id)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        parent_reply_id = request.GET.get('parent_reply_id')
+        parent_reply_id = int(parent_reply_id) if parent_reply_id else None
+
+        children = _load_reply_children(post)
+        depth = 0
+        if parent_reply_id is not None:
+            parents = {reply.id: reply.parent_reply_id for group in children.values() for reply in group}
+            if parent_reply_id not in parents:
+                return JsonResponse({'error': '父回复不存在'}, status=404)
+            # 在内存中沿父回复链计算层级
+            ancestor = parent_reply_id
+            while ancestor is not None:
+                depth += 1
+                ancestor = parents.get(ancestor)
+
+        replies = _build_reply_tree(children, parent_reply_id, depth, offset)
+        total = len(children.get(parent_reply_id, []))
         return JsonResponse({
             'success': True,
-            'post': post_data
+            'parent_reply_id': parent_reply_id,
+            'offset': offset,
+            'child_count': total,
+            'has_more': offset + len(replies) < total,
+            'replies': replies
+        })
+    except ValueError:
+        return JsonResponse({'error': '参数格式错误'}, status=400)
+    except Post.DoesNotExist:
+        return JsonResponse({'error': '帖子不存在'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@api_view(['GET'])
+def get_post_tags(request, post_id):
+    """获取帖子的标签生成状态和标签，供发帖后轮询"""
+    try:
+        post = Post.objects.only('id', 'tags_status').get(id=post_id)
+        return JsonResponse({
+            'post_id': post.id,
+            'tags_status': post.tags_status,
+            'tags': [{'name': tag.name, 'tag_type': tag.tag_type} for tag in post.tags.all()]
         })
-        
     except Post.DoesNotExist:
         return JsonResponse({'error': '帖子不存在'}, status=404)
     except Exception as e:
@@ -179,7 +377,9 @@ def create_reply(request, post_id):
             except Reply.DoesNotExist:
                 return JsonResponse({'error': '父回复不存在'}, status=404)
         
-        reply = Reply.objects.create(**reply_data)
+        # 回复和帖子回复数（由信号维护）在同一事务中写入
+        with transaction.atomic():
+            reply = Reply.objects.create(**reply_data)
         
         return JsonResponse({
             'success': True,
@@ -259,134 +459,55 @@ def delete_reply(request, reply_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-def create_url():
-    """生成讯飞API请求URL"""
-    url = 'wss://spark-api.xf-yun.com/v3.1/chat'
-    
-    # 生成RFC1123格式的时间戳
-    now = datetime.now(timezone.utc)  # 使用UTC时间
-    date = now.strftime('%a, %d %b %Y %H:%M:%S GMT')
-    
-    # 拼接字符串
-    signature_origin = "host: " + "spark-api.xf-yun.com" + "\n"
-    signature_origin += "date: " + date + "\n"
-    signature_origin += "GET " + "/v3.1/chat" + " HTTP/1.1"
-    
-    # 进行hmac-sha256进行加密
-    signature_sha = hmac.new(
-        settings.XUNFEI_API_SECRET.encode('utf-8'),
-        signature_origin.encode('utf-8'),
-        digestmod=hashlib.sha256
-    ).digest()
-    
-    signature_sha_base64 = base64.b64encode(signature_sha).decode()
-    authorization_origin = f'api_key="{settings.XUNFEI_API_KEY}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha_base64}"'
-    authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode()
-    
-    # 将请求的鉴权参数组合为字典
-    v = {
-        "authorization": authorization,
-        "date": date,
-        "host": "spark-api.xf-yun.com"
-    }
-    # 拼接鉴权参数，生成url
-    url = url + '?' + urlencode(v)
-    
-    # 打印调试信息（生产环境应移除）
-    print(f"Debug - Date: {date}")
-    print(f"Debug - Signature Origin: {signature_origin}")
-    print(f"Debug - API Key: {settings.XUNFEI_API_KEY}")
-    print(f"Debug - API Secret: {settings.XUNFEI_API_SECRET}")
-    
-    return url
+def _sse(payload, event=None):
+    """按SSE格式编码一条事件"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def _stream_chat(message):
+    """
+    逐段产出星火回复的SSE事件
+
+    上游请求在共享星火客户端的事件循环和连接池中执行，不占用线程；
+    客户端断开时Django取消本生成器，上游请求随之取消。
+    """
+    try:
+        async for text in get_spark_client().astream(
+            message,
+            timeout=getattr(settings, 'AI_CHAT_TIMEOUT', 120),
+            domain='generalv3',  # 星火X1模型使用generalv3
+            temperature=0.5,
+            max_tokens=2048,
+            uid='12345'
+        ):
+            yield _sse({'content': text})
+        yield _sse({}, event='done')
+    except asyncio.CancelledError:
+        logger.info("客户端已断开，取消星火请求")
+        raise
+    except SparkClientError as e:
+        logger.warning(f"星火API错误: {e}")
+        yield _sse({'error': str(e)}, event='error')
+    except Exception:
+        logger.exception("AI对话请求失败")
+        yield _sse({'error': '请求失败'}, event='error')
 
 @csrf_exempt
-def chat_with_ai(request):
-    """讯飞大模型对话接口"""
+async def chat_with_ai(request):
+    """讯飞大模型对话接口（SSE流式返回，需在ASGI下运行）"""
     if request.method != 'POST':
         return JsonResponse({'error': '仅支持POST请求'}, status=405)
     
     try:
         data = json.loads(request.body.decode())
-        message = data.get('message', '')
-        if not message:
-            return JsonResponse({'error': '消息不能为空'}, status=400)
-        
-        def generate_response():
-            """生成流式响应"""
-            try:
-                url = create_url()
-                print(f"正在连接讯飞API: {url}")
-                ws = websocket.create_connection(url, timeout=10)
-                print("WebSocket连接成功")
-                
-                # 构建请求数据
-                data = {
-                    "header": {
-                        "app_id": settings.XUNFEI_APP_ID,
-                        "uid": "12345"
-                    },
-                    "parameter": {
-                        "chat": {
-                            "domain": "generalv3",  # 星火X1模型使用generalv3
-                            "temperature": 0.5,
-                            "max_tokens": 2048
-                        }
-                    },
-                    "payload": {
-                        "message": {
-                            "text": [
-                                {"role": "user", "content": message}
-                            ]
-                        }
-                    }
-                }
-                
-                print(f"发送请求数据: {json.dumps(data, ensure_ascii=False)}")
-                ws.send(json.dumps(data))
-                
-                while True:
-                    response = ws.recv()
-                    print(f"收到响应: {response}")
-                    response_data = json.loads(response)
-                    
-                    # 检查响应状态
-                    if response_data['header']['code'] != 0:
-                        error_msg = response_data.get('payload', {}).get('text', '请求失败')
-                        print(f"API错误: {error_msg}")
-                        yield f"data: {json.dumps({'error': error_msg})}\n\n"
-                        break
-                    
-                    # 检查是否有文本内容
-                    if 'payload' in response_data and 'choices' in response_data['payload']:
-                        text = response_data['payload']['choices']['text'][0]['content']
-                        print(f"AI回复: {text}")
-                        yield f"data: {json.dumps({'content': text})}\n\n"
-                    else:
-                        print(f"响应格式异常: {response_data}")
-                        yield f"data: {json.dumps({'error': '响应格式异常'})}\n\n"
-                        break
-                    
-                    # 检查是否结束
-                    if response_data['header']['status'] == 2:
-                        print("对话结束")
-                        break
-                
-                ws.close()
-                
-            except WebSocketBadStatusException as e:
-                error_msg = f'WebSocket连接失败: {str(e)}'
-                print(error_msg)
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
-            except Exception as e:
-                error_msg = f'请求失败: {str(e)}'
-                print(error_msg)
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
-        
-        return StreamingHttpResponse(
-            generate_response(),
-            content_type='text/plain'
-        )
-        
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
+    except ValueError:
+        return JsonResponse({'error': '无效的JSON格式'}, status=400)
+    message = data.get('message', '')
+    if not message:
+        return JsonResponse({'error': '消息不能为空'}, status=400)
+    
+    return StreamingHttpResponse(
+        _stream_chat(message),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
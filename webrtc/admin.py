@@ -27,5 +27,5 @@ class VideoFrameAdmin(admin.ModelAdmin):
     readonly_fields = ('id', 'timestamp')
     
     def frame_size(self, obj):
-        return f"{len(obj.frame_data)} bytes"
+        return f"{obj.size} bytes"
     frame_size.short_description = '帧大小'
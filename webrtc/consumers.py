@@ -4,15 +4,21 @@ import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
+from config.ws_metrics import ConnectionMetricsMixin
 from .models import VideoStream, WebRTCConnection  # type: ignore
 from .services import webrtc_service
-from interviews.services import XunfeiRTASRClient
+from .groups import join_stream_group, leave_stream_group, stream_group_name
+from .frames import FrameProtocolError, pack_video_frame, unpack_video_frame
+from .frame_store import keyframe_writer
+from interviews.rtasr import Transcript, rtasr_manager
+from interviews.detection import PersonCheckMixin, person_detector
+from interviews.recording import ClipRecorder
 from interviews.models import InterviewAnswer
+import time
 import uuid
 import base64
 from knowledge_base.services import KnowledgeBaseService
 from users.models import Resume
-import threading
 import cv2
 import numpy as np
 import torch
@@ -20,23 +26,18 @@ from torchvision import transforms
 from PIL import Image
 import sys
 sys.path.append('./pytorch_model')
-from ultralytics import YOLO
 import requests
-from config.local_settings import QWEN_API_KEY
 import os
 import datetime
-import wave
-import ffmpeg
 import numpy as np
 from requests_toolbelt.multipart.encoder import MultipartEncoder
-from openai import OpenAI
 import traceback
 import re
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
-class WebRTCConsumer(AsyncWebsocketConsumer):
+class WebRTCConsumer(ConnectionMetricsMixin, PersonCheckMixin, AsyncWebsocketConsumer):
     """WebRTC WebSocket消费者"""
     PHASE_INTRO = 'intro'
     PHASE_QUESTION = 'question'
@@ -51,21 +52,22 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
         self.connection = None
         self.interview_id = None  # 面试ID
         self.resume_id = None     # 简历ID
-        self.rtasr_client = None  # 讯飞RTASR实例
+        self.rtasr_session = None  # 讯飞RTASR会话
         self.question_queue = []  # 面试问题队列
         self.phase = self.PHASE_INTRO
         self.last_asr_text = ''
         self._ws_loop = None
         self.current_question = None
         self.current_question_knowledge_points = []  # 当前问题的知识点
-        self.current_answer_sentences = []
+        self.transcript = Transcript()  # 当前回答的转写文本
         self.current_answer_final = []
         self.current_answer_start_time = None
         self.current_question_idx = 0 # 新增：记录当前问题的序号
-        self.audio_buffer = []
-        self.video_frame_buffer = []
+        self.clip_recorder = None  # 当前问题的音视频录制器
         self.coding_problems = []  # 代码题列表
         self.current_coding_problem = None  # 当前代码题
+        self.binary_frames = False  # 客户端是否使用二进制视频帧协议
+        self.frame_seq = 0  # JSON视频帧的序号
     
     async def connect(self):
         print("[WebRTCConsumer] connect called")
@@ -77,34 +79,8 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
             self.session_id = str(uuid.uuid4())
             loop = asyncio.get_event_loop()
             self._ws_loop = loop
-            def on_rtasr_result(text):
-                print('[RTASR回调]', text)
-                asyncio.run_coroutine_threadsafe(self.handle_asr_result(text), loop)
-            def start_rtasr():
-                retry_count = 0
-                max_retries = 3
-                while retry_count < max_retries:
-                    try:
-                        print(f"[WebRTCConsumer] RTASR ws connecting... (尝试 {retry_count + 1}/{max_retries})")
-                        self.rtasr_client = XunfeiRTASRClient(app_id='08425c8a', api_key='c64481ae5aac8c1ad9993125c7a6fdbc', on_result=on_rtasr_result)
-                        self.rtasr_client.connect()
-                        print("[WebRTCConsumer] RTASR ws connected")
-                        # 连接成功，发送通知
-                        asyncio.run_coroutine_threadsafe(
-                            self.send(text_data=json.dumps({'type': 'asr_status', 'status': 'connected', 'message': '语音识别已启用'})), loop)
-                        return
-                    except Exception as e:
-                        retry_count += 1
-                        print(f"[WebRTCConsumer] RTASR ws connect error (尝试 {retry_count}): {e}")
-                        if retry_count < max_retries:
-                            import time
-                            time.sleep(2)  # 等待2秒后重试
-                        else:
-                            # 所有重试都失败，发送友好的错误消息
-                            error_msg = "语音识别服务暂不可用，但不影响面试进行。您可以继续面试，答案将通过其他方式记录。"
-                            asyncio.run_coroutine_threadsafe(
-                                self.send(text_data=json.dumps({'type': 'asr_status', 'status': 'failed', 'message': error_msg})), loop)
-            threading.Thread(target=start_rtasr, daemon=True).start()
+            # 收到第一段音频时才建立RTASR连接，断线后自动重连并重发未识别完的音频
+            self.rtasr_session = rtasr_manager.open(self.channel_name, self.handle_asr_result, self.on_asr_status)
             
             # 注意：问题队列的初始化将在handle_create_stream中进行，因为此时还没有interview_id
             await self.send(text_data=json.dumps({
@@ -120,24 +96,32 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
         print(f"[WebRTCConsumer] disconnect called, code={close_code}")
         """断开WebSocket连接"""
         try:
-            if self.rtasr_client:
-                print("[WebRTCConsumer] closing RTASR ws...")
-                try:
-                    self.rtasr_client.close()
-                    print("[WebRTCConsumer] RTASR ws closed")
-                except Exception as e:
-                    print(f"[WebRTCConsumer] RTASR ws close error: {e}")
+            self.cancel_person_checks()
+            person_detector.discard(self.channel_name)
+            self.discard_clip_recorder()
+            if self.rtasr_session:
+                print("[WebRTCConsumer] closing RTASR session...")
+                await rtasr_manager.close(self.channel_name)
             if self.connection:
                 await self.update_connection_state('disconnected')
             if self.video_stream:
+                if self.owns_video_stream():
+                    # 推流方离开，流随之停用：写入剩余帧并释放该流在keyframe_writer中的状态
+                    await keyframe_writer.close(self.video_stream.id)
+                else:
+                    await keyframe_writer.flush(self.video_stream.id)
+                await leave_stream_group(self.channel_layer, self.video_stream.id, self.channel_name)
                 await self.deactivate_video_stream()
             logger.info(f"WebRTC连接已断开: {self.user.username if self.user else 'Unknown'} - {close_code}")
         except Exception as e:
             logger.error(f"断开连接时出错: {str(e)}")
             print(f"[WebRTCConsumer] disconnect error: {e}")
     
-    async def receive(self, text_data):
-        """接收WebSocket消息"""
+    async def receive(self, text_data=None, bytes_data=None):
+        """接收WebSocket消息（二进制消息为视频帧，其余为JSON）"""
+        if bytes_data is not None:
+            await self.handle_binary_video_frame(bytes_data)
+            return
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
@@ -194,6 +178,7 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
             title = data.get('title', '未命名流')
             description = data.get('description', '')
             self.interview_id = data.get('interview_id')  # 获取面试ID
+            self.binary_frames = bool(data.get('binary_frames', False))
             
             if not self.interview_id:
                 raise ValueError("缺少面试ID")
@@ -220,10 +205,7 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 raise ValueError("创建连接记录失败")
             
             # 加入视频流组
-            await self.channel_layer.group_add(
-                f"stream_{self.video_stream.id}",
-                self.channel_name
-            )
+            await join_stream_group(self.channel_layer, self.video_stream.id, self.channel_name)
             
             # 初始化问题队列（现在有了interview_id和resume_id）
             self.question_queue = await self.init_question_queue()
@@ -261,6 +243,8 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 }))
                 return
             
+            self.binary_frames = bool(data.get('binary_frames', False))
+            
             # 获取视频流
             self.video_stream = await self.get_video_stream(stream_id)
             if not self.video_stream:
@@ -273,10 +257,14 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
             # 创建连接记录
             self.connection = await self.create_connection()
             
+            # 加入视频流组，接收该流的广播
+            member_count = await join_stream_group(self.channel_layer, self.video_stream.id, self.channel_name)
+            
             await self.send(text_data=json.dumps({
                 'type': 'stream_joined',
                 'stream_id': str(self.video_stream.id),
                 'title': self.video_stream.title,
+                'member_count': member_count,
                 'text': '成功加入视频流'
             }))
             
@@ -303,7 +291,7 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
             
             # 广播offer给其他连接
             await self.channel_layer.group_send(
-                f"stream_{self.video_stream.id}",
+                stream_group_name(self.video_stream.id),
                 {
                     'type': 'broadcast_offer',
                     'offer': offer,
@@ -388,6 +376,9 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 'text': '未初始化视频流，请先创建或加入视频流'
             }))
             return
+        # 缓冲超过单会话上限时丢弃视频帧，优先保证音频
+        if self.should_shed_frame():
+            return
         try:
             frame_data = data.get('frame_data')
             frame_type = data.get('frame_type', 'keyframe')
@@ -406,57 +397,70 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 img_bytes = base64.b64decode(frame_data)
             else:
                 raise ValueError("frame_data类型错误，必须为str或bytes")
-            np_arr = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-            if img is None:
-                await self.send(text_data=json.dumps({
-                    'type': 'error',
-                    'text': '无法解码图像数据'
-                }))
-                return
-            # 1. YOLOv11检测人数（只加载一次模型）
-            if not hasattr(self, 'yolo_model'):
-                self.yolo_model = YOLO('yolo11n.pt')
-            results = self.yolo_model(img)
-            persons = [b for b in results[0].boxes.data.cpu().numpy() if int(b[5]) == 0]
-            if len(persons) > 1:
-                await self.send(text_data=json.dumps({
-                    'type': 'cheat_detected',
-                    'text': '检测到多个人，疑似作弊！'
-                }))
-                return
-            elif len(persons) == 1:
-                pass  # 目前不做任何处理
-            # 2. 原生PyTorch情绪识别
-            # self.load_fer_model() # 删除VGG/FER2013相关代码
-            # x1, y1, x2, y2 = map(int, persons[0][:4])
-            # face_img = img[y1:y2, x1:x2]
-            # if face_img.size == 0:
-            #     print('未检测到有效人脸区域')
-            # else:
-            #     emotion_idx, emotion_name = self.predict_emotion(face_img)
-            #     print(f'情绪类别: {emotion_name}（索引: {emotion_idx}）')
-            # 保存视频帧
-            await self.save_video_frame(img_bytes, frame_type)
-            # 广播给其他观看者
-            await self.channel_layer.group_send(
-                f"stream_{self.video_stream.id}",
-                {
-                    'type': 'broadcast_video_frame',
-                    'frame_data': frame_data,
-                    'frame_type': frame_type,
-                    'peer_id': self.peer_id,
-                    'exclude': self.channel_name
-                }
-            )
-            if frame_data:
-                self.video_frame_buffer.append(frame_data)
+            self.frame_seq += 1
+            await self.process_video_frame(img_bytes, frame_type, {
+                'frame_data': frame_data,
+                'seq': self.frame_seq
+            })
         except Exception as e:
             logger.error(f"处理视频帧失败: {str(e)}")
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'text': f'处理视频帧失败: {str(e)}'
             }))
+
+    async def handle_binary_video_frame(self, data):
+        """处理二进制协议的视频帧，转发时原样发送收到的整帧"""
+        if self.video_stream is None:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'text': '未初始化视频流，请先创建或加入视频流'
+            }))
+            return
+        if self.should_shed_frame():
+            return
+        try:
+            peer_id, frame_type, seq, img_bytes = unpack_video_frame(data)
+        except FrameProtocolError as e:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'text': f'处理视频帧失败: {str(e)}'
+            }))
+            return
+        self.binary_frames = True
+        # 帧头中的peer_id与本连接一致时直接转发原始数据，否则以本连接的peer_id重新打包
+        if peer_id != (self.peer_id or ''):
+            data = pack_video_frame(self.peer_id, frame_type, seq, img_bytes)
+        try:
+            await self.process_video_frame(img_bytes, frame_type, {
+                'frame': data,
+                'seq': seq
+            })
+        except Exception as e:
+            logger.error(f"处理视频帧失败: {str(e)}")
+
+    async def process_video_frame(self, img_bytes, frame_type, payload):
+        """
+        按到达顺序广播、保存并录制该帧，人数检测作为旁路任务运行（检测到多人时推送cheat_detected）
+
+        payload为二进制整帧（frame，原样转发）或base64字符串（frame_data）
+        """
+        started = time.perf_counter()
+        await self.channel_layer.group_send(
+            stream_group_name(self.video_stream.id),
+            {
+                'type': 'broadcast_video_frame',
+                'frame_type': frame_type,
+                'peer_id': self.peer_id,
+                'exclude': self.channel_name,
+                **payload
+            }
+        )
+        await self.save_video_frame(img_bytes, frame_type)
+        self.get_clip_recorder().add_frame(img_bytes)
+        self.conn_stats.frames_processed += 1
+        self.conn_stats.observe('video_frame', time.perf_counter() - started)
+        self.start_person_check(img_bytes)
     
     async def handle_audio_frame(self, data):
         """处理音频帧数据，转发到讯飞ASR，推送转写结果"""
@@ -465,8 +469,8 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
             audio_data = data.get('audio_data')  # base64字符串
             is_end = data.get('end', False)
             if is_end:
-                if self.rtasr_client and self.rtasr_client.connected and not self.rtasr_client.closed:
-                    self.rtasr_client.send_audio(b'', is_last=True)
+                if self.rtasr_session:
+                    await self.rtasr_session.end()
                 return
             if not audio_data:
                 await self.send(text_data=json.dumps({
@@ -475,14 +479,13 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 }))
                 return
             audio_bytes = base64.b64decode(audio_data)
-            if self.rtasr_client and self.rtasr_client.connected and not self.rtasr_client.closed:
-                self.rtasr_client.send_audio(audio_bytes)
+            if self.rtasr_session and not self.rtasr_session.failed:
+                await self.rtasr_session.send_audio(audio_bytes)
             else:
                 # RTASR不可用时，仍然保存音频数据，但不进行实时转写
                 # 这样音频可以用于后续的离线分析
                 pass
-            if audio_data:
-                self.audio_buffer.append(audio_data)
+            self.get_clip_recorder().add_audio(audio_bytes)
         except Exception as e:
             await self.send(text_data=json.dumps({
                 'type': 'error',
@@ -524,8 +527,8 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
             manual_text = data.get('answer_text', '')
             if manual_text:
                 self.current_answer_final = [manual_text]
-            elif self.current_answer_sentences:
-                self.current_answer_final = self.current_answer_sentences
+            elif self.transcript.text():
+                self.current_answer_final = [self.transcript.text()]
             else:
                 # 如果都没有，提供一个默认的答案记录
                 self.current_answer_final = ["[用户已完成回答，但未收集到文本内容]"]
@@ -544,8 +547,8 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
         answer_text = data.get('text', '')
         if answer_text:
             print(f"[调试] 收到手动输入答案: {answer_text}")
-            # 添加到当前答案句子列表中
-            self.current_answer_sentences.append(answer_text)
+            # 添加到当前答案中
+            self.transcript.add_sentence(answer_text)
             
             # 发送确认消息
             await self.send(text_data=json.dumps({
@@ -822,52 +825,47 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
         return asyncio.to_thread(func)
 
 
+    def get_buffered_bytes(self):
+        """录制写盘队列、RTASR发送/重发缓冲和视频流关键帧缓冲中的字节数"""
+        total = 0
+        if self.clip_recorder:
+            total += self.clip_recorder.pending_bytes
+        if self.rtasr_session:
+            total += self.rtasr_session.buffered_bytes
+        if self.video_stream:
+            total += keyframe_writer.buffered_bytes(self.video_stream.id)
+        return total
+
+    async def on_asr_status(self, status):
+        """RTASR连接状态变化，通知前端"""
+        print(f"[WebRTCConsumer] RTASR status: {status}")
+        messages = {
+            'connected': '语音识别已启用',
+            'reconnecting': '语音识别连接中断，正在重连',
+            'failed': '语音识别服务暂不可用，但不影响面试进行。您可以继续面试，答案将通过其他方式记录。',
+        }
+        await self.send(text_data=json.dumps({'type': 'asr_status', 'status': status, 'message': messages[status]}))
+
     async def handle_asr_result(self, text):
         """处理语音识别结果"""
         try:
-            # 只处理中文文本
-            if not text:
+            # 当前句只保留最新的中间结果，句子确定后才进入答案
+            update = self.transcript.feed(text)
+            if update is None:
                 return
             
-            # 递归提取所有字符串中的中文
-            def extract_chinese(obj):
-                result = ''
-                if isinstance(obj, str):
-                    # 匹配所有中文
-                    result += ''.join(char for char in obj if '\u4e00' <= char <= '\u9fff' or char in '，。！？、；：""''（）《》【】')
-                elif isinstance(obj, list):
-                    for item in obj:
-                        result += extract_chinese(item)
-                elif isinstance(obj, dict):
-                    for key in obj:
-                        result += extract_chinese(obj[key])
-                return result
-            
-            # 如果text是JSON字符串，尝试提取所有中文
-            try:
-                obj = json.loads(text) if isinstance(text, str) else text
-                text = extract_chinese(obj)
-            except:
-                pass
+            # 只推送发生变化的那一句，前端按sentence序号替换（在切换问题之前推送，序号属于当前回答）
+            await self.send(text_data=json.dumps(dict(update, type='asr_result')))
             
             # 更新当前回答
             if self.phase == self.PHASE_INTRO or self.phase == self.PHASE_QUESTION:
-                if text:
-                    self.current_answer_sentences.append(text)
-                    # 如果检测到说完了，保存答案
-                    if "说完了" in text or "完毕" in text:
-                        print("[调试] handle_asr_result current_answer_final:", self.current_answer_final)
-                        print("[调试] handle_asr_result 检测到说完了，准备保存答案")
-                        # 更新最终答案
-                        self.current_answer_final = self.current_answer_sentences
-                        await self.save_current_answer()
-                        await self.next_question()
-                    
-            # 发送转写结果给前端
-            await self.send(text_data=json.dumps({
-                'type': 'asr_result',
-                'text': text
-            }))
+                # 如果检测到说完了，保存答案（只看最终结果，避免中间结果和最终结果各触发一次）
+                if update['final'] and ("说完了" in update['text'] or "完毕" in update['text']):
+                    print("[调试] handle_asr_result 检测到说完了，准备保存答案")
+                    # 更新最终答案
+                    self.current_answer_final = [self.transcript.text()]
+                    await self.save_current_answer()
+                    await self.next_question()
             
         except Exception as e:
             print(f"[调试] handle_asr_result错误: {e}")
@@ -897,7 +895,7 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 self.current_question = question_data
                 self.current_question_knowledge_points = ["通用技能", "专业能力"]
             
-            self.current_answer_sentences = []
+            self.transcript.reset()
             self.current_answer_final = []
             from datetime import datetime
             self.current_answer_start_time = datetime.now()
@@ -907,9 +905,8 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 'text': self.current_question
             }))
             self.phase = self.PHASE_QUESTION
-            # 新问题开始时清空buffer
-            self.audio_buffer = []
-            self.video_frame_buffer = []
+            # 新问题开始时丢弃上一段未保存的录制内容
+            self.discard_clip_recorder()
         else:
             # 保存最后一道题答案
             await self.save_current_answer()
@@ -951,19 +948,17 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 
                 print(f"[调试] 已保存答案记录，知识点: {knowledge_points}")
                 
-                # 保存音视频片段
-                av_path = await self.save_av_clip_for_question()
-                
-                # 将分析任务加入队列
-                from interviews.tasks import analyze_interview_answer
-                await database_sync_to_async(analyze_interview_answer.delay)(str(answer.id), av_path)
-                print(f"[调试] 已创建答案记录并加入分析队列 - id: {answer.id}, av_path: {av_path}")
+                # 结束音视频录制，排队合成片段，合成完成后由合成任务投递答案分析
+                clip = await self.save_av_clip_for_question()
+                from interviews.tasks import mux_interview_clip
+                await database_sync_to_async(mux_interview_clip.delay)(clip, str(answer.id))
+                print(f"[调试] 已创建答案记录并加入合成队列 - id: {answer.id}, clip: {clip}")
                 
                 # 清空当前问题和答案
                 self.current_question = None
                 self.current_question_knowledge_points = []
                 self.current_answer_final = []
-                self.current_answer_sentences = []
+                self.transcript.reset()
                 self.current_answer_start_time = None
                 
             except Exception as e:
@@ -996,107 +991,29 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
                 'text': f'结束面试时出错: {str(e)}'
             }))
 
+    def get_clip_recorder(self):
+        """获取当前问题的录制器，不存在时创建"""
+        if self.clip_recorder is None:
+            self.clip_recorder = ClipRecorder(self.session_id or 'unknown', self.current_question_idx)
+        return self.clip_recorder
+
+    def discard_clip_recorder(self):
+        self.cancel_person_checks()
+        if self.clip_recorder is not None:
+            self.clip_recorder.discard()
+            self.clip_recorder = None
+
     async def save_av_clip_for_question(self):
         """
-        保存当前问题的音视频片段到本地文件，返回带声mp4路径。
+        结束当前问题的音视频录制，返回交给合成任务的片段描述（无录制内容时为None）。
         """
-        save_dir = './interview_clips'
-        os.makedirs(save_dir, exist_ok=True)
-        q_idx = getattr(self, 'current_question_idx', 0)
-        session_id = getattr(self, 'session_id', 'unknown')
-        audio_path = os.path.join(save_dir, f'{session_id}_q{q_idx+1}.wav')
-        img_dir = os.path.join(save_dir, f'{session_id}_q{q_idx+1}_frames')
-        os.makedirs(img_dir, exist_ok=True)
-        video_path = os.path.join(save_dir, f'{session_id}_q{q_idx+1}_av.mp4')
-
-        # 保存音频
-        if self.audio_buffer:
-            pcm_bytes = b''.join([base64.b64decode(chunk) for chunk in self.audio_buffer])
-            with wave.open(audio_path, 'wb') as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)
-                wf.setframerate(16000)
-                wf.writeframes(pcm_bytes)
-        else:
-            audio_path = None
-
-        # 保存视频帧
-        img_paths = []
-        if self.video_frame_buffer:
-            for i, b64img in enumerate(self.video_frame_buffer):
-                img_path = os.path.join(img_dir, f'frame_{i:04d}.jpg')
-                with open(img_path, 'wb') as f:
-                    f.write(base64.b64decode(b64img))
-                img_paths.append(img_path)
-
-        # 合成带声mp4
-        if audio_path and img_paths:
-            video_stream = ffmpeg.input(os.path.join(img_dir, 'frame_%04d.jpg'), framerate=1)
-            audio_stream = ffmpeg.input(audio_path)
-            (
-                ffmpeg
-                .output(video_stream, audio_stream, video_path, vcodec='libx264', acodec='aac', pix_fmt='yuv420p', shortest=None)
-                .run(overwrite_output=True)
-            )
-            av_path = video_path
-        elif audio_path:
-            av_path = audio_path
-        elif img_paths:
-            # 只合成无声视频
-            video_only_path = os.path.join(save_dir, f'{session_id}_q{q_idx+1}_video.mp4')
-            (
-                ffmpeg
-                .input(os.path.join(img_dir, 'frame_%04d.jpg'), framerate=1)
-                .output(video_only_path, vcodec='libx264', pix_fmt='yuv420p')
-                .run(overwrite_output=True)
-            )
-            av_path = video_only_path
-        else:
-            av_path = None
-
-        self.current_question_idx = q_idx + 1
-        return av_path
+        self.cancel_person_checks()
+        recorder, self.clip_recorder = self.clip_recorder, None
+        self.current_question_idx += 1
+        if recorder is None:
+            return None
+        return await recorder.finish()
 
-    async def analyze_confidence_fluency(self, question, answer_text, av_path=None):
-        prompt = f"请根据以下面试问题和应答，判断应答者在回答时的信心和表达流畅度，并按如下标准打1-5分：\\n1分：极度缺乏信心，表达极不流畅，长时间停顿或语无伦次。\\n2分：信心不足，表达有明显卡顿或多次重复、犹豫。\\n3分：信心一般，表达基本流畅但偶有停顿或语气不坚定。\\n4分：信心较强，表达流畅，偶有小瑕疵。\\n5分：非常有信心，表达极其流畅，思路清晰、语气坚定。\\n请输出分析理由和分数。\\n\\n面试问题：{question}\\n应答内容：{answer_text}"
-        try:
-            client = OpenAI(
-                api_key=QWEN_API_KEY,
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            )
-            
-            # 构建消息内容
-            content = [{"type": "text", "text": prompt}]
-            
-            # 如果有视频文件，添加为base64编码的内容
-            if av_path and av_path.endswith('.mp4'):
-                with open(av_path, "rb") as f:
-                    video_bytes = f.read()
-                video_b64 = base64.b64encode(video_bytes).decode('utf-8')
-                content.append({
-                    "type": "video_url",
-                    "video_url": {
-                        "url": f"data:;base64,{video_b64}"
-                    }
-                })
-            
-            completion = client.chat.completions.create(
-                model="qwen2.5-omni-7b",
-                messages=[{"role": "user", "content": content}],
-                modalities=["text"],
-                stream=True
-            )
-            
-            # 处理流式响应
-            full_response = ""
-            for chunk in completion:
-                if chunk.choices[0].delta.content:
-                    full_response += chunk.choices[0].delta.content
-            
-            print("[调试] qwen2.5-omni-7b分析结果：", full_response)
-        except Exception as e:
-            print(f"qwen2.5-omni-7b API调用异常: {e}")
-    
     # 数据库操作方法
     @database_sync_to_async
     def get_user(self):
@@ -1137,6 +1054,10 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
             self.connection.connection_state = state
             self.connection.save()
     
+    def owns_video_stream(self):
+        """当前连接的用户是否是视频流的创建者"""
+        return bool(self.user and self.video_stream and self.video_stream.user_id == getattr(self.user, 'id', None))
+    
     @database_sync_to_async
     def deactivate_video_stream(self):
         """停用视频流"""
@@ -1144,23 +1065,9 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
             self.video_stream.is_active = False
             self.video_stream.save()
     
-    @database_sync_to_async
-    def save_video_frame(self, frame_data, frame_type):
-        """保存视频帧"""
-        from .models import VideoFrame  # type: ignore
-        # 确保frame_data是bytes格式，因为VideoFrame.frame_data是BinaryField
-        if isinstance(frame_data, str):
-            # 如果是base64字符串，先解码为bytes
-            if frame_data.startswith('data:image'):
-                frame_data = frame_data.split(',', 1)[-1]
-            frame_data = base64.b64decode(frame_data)
-        elif not isinstance(frame_data, bytes):
-            frame_data = bytes(frame_data)
-        return VideoFrame.objects.create(  # type: ignore
-            video_stream=self.video_stream,
-            frame_data=frame_data,
-            frame_type=frame_type
-        )
+    async def save_video_frame(self, frame_data, frame_type):
+        """在视频流的帧率预算内保存视频帧，由keyframe_writer批量写入帧存储"""
+        await keyframe_writer.submit(self.video_stream.id, frame_data, frame_type, self.video_stream)
     
     # 广播方法
     async def broadcast_offer(self, event):
@@ -1188,10 +1095,24 @@ class WebRTCConsumer(AsyncWebsocketConsumer):
         }))
     
     async def broadcast_video_frame(self, event):
-        """广播视频帧"""
+        """
+        广播视频帧：二进制协议的客户端收到整帧二进制数据，旧客户端收到JSON+base64；
+        只有双方协议不同时才做转换
+        """
+        if event.get('exclude') == self.channel_name:
+            return
+        frame = event.get('frame')
+        if self.binary_frames:
+            if frame is None:
+                frame = pack_video_frame(event['peer_id'], event['frame_type'], event.get('seq', 0), base64.b64decode(event['frame_data']))
+            await self.send(bytes_data=frame)
+            return
+        frame_data = event.get('frame_data')
+        if frame_data is None:
+            frame_data = base64.b64encode(unpack_video_frame(frame)[3]).decode('utf-8')
         await self.send(text_data=json.dumps({
             'type': 'video_frame',
-            'frame_data': event['frame_data'],
+            'frame_data': frame_data,
             'frame_type': event['frame_type'],
             'peer_id': event['peer_id']
         }))
@@ -0,0 +1,303 @@
+"""
+视频关键帧存储
+
+帧的JPEG数据保存在可插拔的帧存储中，数据库的VideoFrame只保存存储键、大小等元数据。
+存储键是内容的SHA-256，相同画面只保存一份。
+
+配置示例：
+    VIDEO_FRAME_STORE = {
+        'BACKEND': 'local',                     # local：本地内容寻址目录；s3：S3兼容对象存储
+        'OPTIONS': {'root': './video_frames'},
+    }
+    VIDEO_FRAME_STORE = {
+        'BACKEND': 's3',
+        'OPTIONS': {'bucket': 'frames', 'endpoint_url': 'http://minio:9000', 'access_key': '...', 'secret_key': '...'},
+    }
+
+保留策略：每个VideoStream的帧保留frame_ttl_hours小时（为空时使用VIDEO_FRAME_TTL_HOURS），
+每个流最多保留VIDEO_FRAME_MAX_PER_STREAM帧，由sweep_expired_frames（管理命令sweep_video_frames）清理。
+
+实时链路中的关键帧统一交给keyframe_writer，按流限速并批量写入。
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 1000
+
+
+def frame_key(data):
+    """帧内容的存储键"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class FrameStore:
+    """帧存储接口"""
+
+    def put(self, key, data):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def delete(self, keys):
+        raise NotImplementedError
+
+
+class LocalFrameStore(FrameStore):
+    """本地内容寻址目录：root/ab/cd/<sha256>.jpg"""
+
+    def __init__(self, root='./video_frames'):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], f'{key}.jpg')
+
+    def put(self, key, data):
+        path = self._path(key)
+        if os.path.exists(path):
+            return  # 内容相同，无需重复写入
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，读取方不会看到写了一半的文件
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+class S3FrameStore(FrameStore):
+    """S3兼容对象存储（需要安装boto3）"""
+
+    def __init__(self, bucket, prefix='video_frames/', endpoint_url=None, access_key=None,
+                 secret_key=None, region=None):
+        try:
+            import boto3
+        except ImportError:
+            raise ImproperlyConfigured('使用S3帧存储需要安装boto3')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region
+        )
+
+    def _key(self, key):
+        return f'{self.prefix}{key[:2]}/{key}.jpg'
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, ContentType='image/jpeg')
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+
+    def delete(self, keys):
+        keys = list(keys)
+        # 单次请求最多删除1000个对象
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': self._key(key)} for key in keys[i:i + 1000]], 'Quiet': True}
+            )
+
+
+FRAME_STORE_BACKENDS = {
+    'local': LocalFrameStore,
+    's3': S3FrameStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_frame_store():
+    """获取配置的帧存储"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = getattr(settings, 'VIDEO_FRAME_STORE', {})
+            backend = config.get('BACKEND', 'local')
+            if backend not in FRAME_STORE_BACKENDS:
+                raise ImproperlyConfigured(f'未知的帧存储后端: {backend}')
+            _store = FRAME_STORE_BACKENDS[backend](**config.get('OPTIONS', {}))
+    return _store
+
+
+def save_frames(video_stream, frames):
+    """
+    批量保存帧：先写入帧存储，再一次bulk_create元数据（同步函数）
+
+    Args:
+        video_stream: VideoStream实例
+        frames: [(jpeg_bytes, frame_type, timestamp)]，timestamp为None时取当前时间
+    """
+    from .models import VideoFrame
+
+    store = get_frame_store()
+    rows = []
+    for data, frame_type, timestamp in frames:
+        key = frame_key(data)
+        store.put(key, data)
+        rows.append(VideoFrame(
+            video_stream=video_stream,
+            storage_key=key,
+            size=len(data),
+            frame_type=frame_type,
+            timestamp=timestamp or timezone.now()
+        ))
+    return VideoFrame.objects.bulk_create(rows)
+
+
+def delete_frames(frame_ids):
+    """删除帧记录，并删除不再被任何帧引用的存储对象，返回删除的帧数"""
+    from .models import VideoFrame
+
+    frame_ids = list(frame_ids)
+    store = get_frame_store()
+    for i in range(0, len(frame_ids), SWEEP_BATCH_SIZE):
+        batch = frame_ids[i:i + SWEEP_BATCH_SIZE]
+        keys = set(VideoFrame.objects.filter(id__in=batch).values_list('storage_key', flat=True))
+        VideoFrame.objects.filter(id__in=batch).delete()
+        still_used = set(VideoFrame.objects.filter(storage_key__in=keys).values_list('storage_key', flat=True))
+        store.delete(keys - still_used)
+    return len(frame_ids)
+
+
+def sweep_expired_frames(now=None):
+    """按各VideoStream的保留策略清理过期帧，返回删除的帧数"""
+    from .models import VideoFrame, VideoStream
+
+    now = now or timezone.now()
+    default_ttl = getattr(settings, 'VIDEO_FRAME_TTL_HOURS', 72)
+    max_frames = getattr(settings, 'VIDEO_FRAME_MAX_PER_STREAM', None)
+    deleted = 0
+    streams = VideoStream.objects.filter(frames__isnull=False).distinct().only('id', 'frame_ttl_hours')
+    for stream in streams:
+        ttl = stream.frame_ttl_hours if stream.frame_ttl_hours is not None else default_ttl
+        frames = VideoFrame.objects.filter(video_stream=stream)
+        expired_ids = set(frames.filter(timestamp__lt=now - timedelta(hours=ttl)).values_list('id', flat=True))
+        if max_frames:
+            expired_ids.update(frames.order_by('-timestamp').values_list('id', flat=True)[max_frames:])
+        if expired_ids:
+            deleted += delete_frames(expired_ids)
+            logger.info(f"视频流 {stream.id} 清理过期帧 {len(expired_ids)} 个")
+    return deleted
+
+
+class KeyframeWriter:
+    """
+    按视频流缓冲关键帧并批量写入
+
+    - 每个流有独立的帧率预算（VIDEO_FRAME_MAX_FPS），超出预算的帧直接丢弃，
+      无论多少个对等端在推流，单个流的写入速率都有上限
+    - 缓冲满VIDEO_FRAME_BATCH_SIZE帧或距第一帧超过VIDEO_FRAME_FLUSH_INTERVAL秒时，
+      在线程中调用save_frames一次性写入
+    - 缓存每个流的VideoStream实例，写入时不再重复查询
+    """
+
+    def __init__(self, max_fps=None, batch_size=None, flush_interval=None):
+        self.max_fps = max_fps or getattr(settings, 'VIDEO_FRAME_MAX_FPS', 1.0)
+        self.batch_size = batch_size or getattr(settings, 'VIDEO_FRAME_BATCH_SIZE', 10)
+        self.flush_interval = flush_interval or getattr(settings, 'VIDEO_FRAME_FLUSH_INTERVAL', 5.0)
+        self._streams = {}
+
+    def _get(self, stream_id):
+        key = str(stream_id)
+        state = self._streams.get(key)
+        if state is None:
+            state = self._streams[key] = {
+                'video_stream': None,
+                'frames': [],
+                'last_accepted': float('-inf'),
+                'flush_task': None,
+            }
+        return state
+
+    def buffered_bytes(self, stream_id):
+        """该流缓冲中尚未写入的帧字节数"""
+        state = self._streams.get(str(stream_id))
+        return sum(len(frame[0]) for frame in state['frames']) if state else 0
+
+    def allow(self, stream_id):
+        """判断该流当前是否还有帧率预算，有则占用一个名额"""
+        state = self._get(stream_id)
+        now = time.monotonic()
+        if now - state['last_accepted'] < 1.0 / self.max_fps:
+            return False
+        state['last_accepted'] = now
+        return True
+
+    async def add(self, stream_id, jpeg_bytes, frame_type='keyframe', video_stream=None):
+        """加入一帧（不检查帧率预算）"""
+        state = self._get(stream_id)
+        if video_stream is not None:
+            state['video_stream'] = video_stream
+        state['frames'].append((jpeg_bytes, frame_type, timezone.now()))
+        if len(state['frames']) >= self.batch_size:
+            await self.flush(stream_id)
+        elif state['flush_task'] is None:
+            state['flush_task'] = asyncio.ensure_future(self._flush_later(stream_id))
+
+    async def submit(self, stream_id, jpeg_bytes, frame_type='keyframe', video_stream=None):
+        """在帧率预算内加入一帧，返回是否被接受"""
+        if not self.allow(stream_id):
+            return False
+        await self.add(stream_id, jpeg_bytes, frame_type, video_stream)
+        return True
+
+    async def _flush_later(self, stream_id):
+        await asyncio.sleep(self.flush_interval)
+        self._get(stream_id)['flush_task'] = None
+        await self.flush(stream_id)
+
+    async def flush(self, stream_id):
+        """立即写入该流缓冲中的帧"""
+        from .models import VideoStream
+
+        state = self._streams.get(str(stream_id))
+        if not state or not state['frames']:
+            return
+        frames, state['frames'] = state['frames'], []
+        task, state['flush_task'] = state['flush_task'], None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        try:
+            if state['video_stream'] is None:
+                state['video_stream'] = await database_sync_to_async(VideoStream.objects.get)(id=stream_id)
+            await database_sync_to_async(save_frames, thread_sensitive=False)(state['video_stream'], frames)
+        except VideoStream.DoesNotExist:
+            logger.error(f"视频流不存在: {stream_id}")
+        except Exception as e:
+            logger.error(f"批量保存关键帧失败: {e}")
+
+    async def close(self, stream_id):
+        """写入剩余帧并释放该流的缓冲和缓存"""
+        await self.flush(stream_id)
+        self._streams.pop(str(stream_id), None)
+
+
+keyframe_writer = KeyframeWriter()
@@ -0,0 +1,49 @@
+"""
+视频流组（stream_{id}）的成员管理和规模统计
+
+组成员由通道层保存：进程内通道层只在本进程可见，
+Redis通道层按组名分片保存在对应的Redis节点上，所有ASGI进程看到的是同一份成员。
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def stream_group_name(stream_id):
+    return f"stream_{stream_id}"
+
+
+async def get_group_size(channel_layer, group):
+    """返回组内未过期的成员数；通道层不支持查询（如Pub/Sub通道层）时返回None"""
+    groups = getattr(channel_layer, 'groups', None)
+    if isinstance(groups, dict):
+        # InMemoryChannelLayer
+        return len(groups.get(group, {}))
+    if hasattr(channel_layer, '_group_key') and hasattr(channel_layer, 'consistent_hash'):
+        # RedisChannelLayer：组成员是以加入时间为分数的有序集合
+        connection = channel_layer.connection(channel_layer.consistent_hash(group))
+        return await connection.zcount(
+            channel_layer._group_key(group),
+            time.time() - channel_layer.group_expiry,
+            '+inf'
+        )
+    return None
+
+
+async def join_stream_group(channel_layer, stream_id, channel_name):
+    """加入视频流组，返回加入后的组成员数"""
+    group = stream_group_name(stream_id)
+    await channel_layer.group_add(group, channel_name)
+    size = await get_group_size(channel_layer, group)
+    logger.info(f"加入视频流组 {group}，当前成员数: {size}")
+    return size
+
+
+async def leave_stream_group(channel_layer, stream_id, channel_name):
+    """离开视频流组，返回离开后的组成员数"""
+    group = stream_group_name(stream_id)
+    await channel_layer.group_discard(group, channel_name)
+    size = await get_group_size(channel_layer, group)
+    logger.info(f"离开视频流组 {group}，当前成员数: {size}")
+    return size
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from webrtc.frame_store import sweep_expired_frames
+
+class Command(BaseCommand):
+    help = '按视频流的保留策略清理过期的关键帧及其存储对象'
+
+    def handle(self, *args, **options):
+        self.stdout.write('开始清理过期关键帧...')
+        deleted = sweep_expired_frames()
+        self.stdout.write(self.style.SUCCESS(f'清理完成，共删除 {deleted} 帧'))
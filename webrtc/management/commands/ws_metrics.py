@@ -0,0 +1,45 @@
+import json
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = '查看ASGI进程中各WebSocket连接的缓冲、帧数、处理耗时和事件循环延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/metrics/connections/', help='ASGI进程的指标地址')
+        parser.add_argument('--token', default=None, help='指标访问令牌，默认使用METRICS_TOKEN设置')
+        parser.add_argument('--json', action='store_true', help='输出原始JSON')
+
+    def handle(self, *args, **options):
+        try:
+            token = options['token'] or getattr(settings, 'METRICS_TOKEN', '')
+            if not token:
+                raise CommandError('未配置指标访问令牌，请设置METRICS_TOKEN或使用--token')
+            response = requests.get(options['url'], headers={'X-Metrics-Token': token}, timeout=5)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise CommandError(f'获取指标失败: {e}')
+        data = response.json()
+        if options['json']:
+            self.stdout.write(json.dumps(data, ensure_ascii=False, indent=2))
+            return
+
+        process = data['process']
+        lag = data['loop_lag']
+        self.stdout.write(
+            f"进程 {process['pid']}：连接 {process['connections']}，"
+            f"RSS {process.get('rss_bytes', process['max_rss_bytes']) / 1048576:.1f}MB，CPU {process['cpu_seconds']}s"
+        )
+        self.stdout.write(f"事件循环延迟：最近 {lag['last_ms']}ms，p95 {lag['p95_ms']}ms，最大 {lag['max_ms']}ms")
+        self.stdout.write(f"{'类型':<20}{'用户':<16}{'缓冲KB':>10}{'收帧':>8}{'处理':>8}{'丢弃':>8}{'CPU秒':>8}{'p95ms':>8}")
+        connections = sorted(data['connections'], key=lambda c: c['buffered_bytes'], reverse=True)
+        for conn in connections:
+            p95 = max((h['p95_ms'] or 0 for h in conn['latency'].values()), default=0)
+            self.stdout.write(
+                f"{conn['kind']:<20}{str(conn['user']):<16}{conn['buffered_bytes'] / 1024:>10.1f}"
+                f"{conn['frames_received']:>8}{conn['frames_processed']:>8}{conn['frames_shed']:>8}"
+                f"{conn['cpu_seconds']:>8}{p95:>8}"
+            )
@@ -0,0 +1,127 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:37
+
+import hashlib
+import os
+
+import django.utils.timezone
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations, models
+
+
+def _frame_writer():
+    """
+    按settings.VIDEO_FRAME_STORE返回put(key, data)
+
+    存储布局在此固定为本迁移编写时的格式（与当时的webrtc.frame_store一致），
+    不引用应用代码，之后修改帧存储模块不会影响本迁移。
+    """
+    config = getattr(settings, "VIDEO_FRAME_STORE", {})
+    backend = config.get("BACKEND", "local")
+    options = config.get("OPTIONS", {})
+
+    if backend == "local":
+        root = options.get("root", "./video_frames")
+
+        def put(key, data):
+            path = os.path.join(root, key[:2], key[2:4], f"{key}.jpg")
+            if os.path.exists(path):
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        return put
+
+    if backend == "s3":
+        try:
+            import boto3
+        except ImportError:
+            raise ImproperlyConfigured("使用S3帧存储需要安装boto3")
+        prefix = options.get("prefix", "video_frames/")
+        client = boto3.client(
+            "s3",
+            endpoint_url=options.get("endpoint_url"),
+            aws_access_key_id=options.get("access_key"),
+            aws_secret_access_key=options.get("secret_key"),
+            region_name=options.get("region"),
+        )
+
+        def put(key, data):
+            client.put_object(
+                Bucket=options["bucket"],
+                Key=f"{prefix}{key[:2]}/{key}.jpg",
+                Body=data,
+                ContentType="image/jpeg",
+            )
+
+        return put
+
+    raise ImproperlyConfigured(f"未知的帧存储后端: {backend}")
+
+
+def move_frames_to_store(apps, schema_editor):
+    """把已有帧的二进制数据搬到帧存储中，只保留存储键和大小"""
+    VideoFrame = apps.get_model("webrtc", "VideoFrame")
+    put = None
+    batch = []
+    for frame in VideoFrame.objects.only("id", "frame_data").iterator(chunk_size=500):
+        if put is None:
+            put = _frame_writer()  # 没有帧时不需要存储配置
+        data = bytes(frame.frame_data)
+        frame.storage_key = hashlib.sha256(data).hexdigest()
+        frame.size = len(data)
+        put(frame.storage_key, data)
+        batch.append(frame)
+        if len(batch) >= 500:
+            VideoFrame.objects.bulk_update(batch, ["storage_key", "size"])
+            batch = []
+    if batch:
+        VideoFrame.objects.bulk_update(batch, ["storage_key", "size"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webrtc", "0003_delete_interviewanswer"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="videoframe",
+            name="size",
+            field=models.PositiveIntegerField(default=0, verbose_name="帧大小"),
+        ),
+        migrations.AddField(
+            model_name="videoframe",
+            name="storage_key",
+            field=models.CharField(
+                db_index=True, default="", max_length=64, verbose_name="存储键"
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="videostream",
+            name="frame_ttl_hours",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="为空时使用全局设置VIDEO_FRAME_TTL_HOURS",
+                null=True,
+                verbose_name="关键帧保留时长（小时）",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="videoframe",
+            name="timestamp",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now, verbose_name="时间戳"
+            ),
+        ),
+        migrations.RunPython(move_frames_to_store, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="videoframe",
+            name="frame_data",
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 import uuid
 
 User = get_user_model()  # type: ignore
@@ -11,6 +12,7 @@ class VideoStream(models.Model):  # type: ignore
     title = models.CharField(max_length=200, verbose_name='流标题')
     description = models.TextField(blank=True, verbose_name='流描述')
     is_active = models.BooleanField(default=False, verbose_name='是否活跃')
+    frame_ttl_hours = models.PositiveIntegerField(null=True, blank=True, verbose_name='关键帧保留时长（小时）', help_text='为空时使用全局设置VIDEO_FRAME_TTL_HOURS')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     
@@ -52,11 +54,12 @@ class WebRTCConnection(models.Model):  # type: ignore
         return f"{self.peer_id} - {self.connection_state}"
 
 class VideoFrame(models.Model):  # type: ignore
-    """视频帧模型（用于存储关键帧）"""
+    """视频帧模型（用于存储关键帧，JPEG数据保存在帧存储中，这里只保存元数据）"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     video_stream = models.ForeignKey(VideoStream, on_delete=models.CASCADE, related_name='frames')  # type: ignore
-    frame_data = models.BinaryField(verbose_name='帧数据')
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name='时间戳')
+    storage_key = models.CharField(max_length=64, db_index=True, verbose_name='存储键')
+    size = models.PositiveIntegerField(default=0, verbose_name='帧大小')
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='时间戳')
     frame_type = models.CharField(
         max_length=20,
         choices=[
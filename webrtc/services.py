@@ -8,7 +8,8 @@ from av import VideoFrame
 import base64
 import json
 from typing import Dict, Optional, List
-from .models import VideoStream, WebRTCConnection, VideoFrame as VideoFrameModel
+from .models import VideoStream, WebRTCConnection
+from .frame_store import keyframe_writer
 from websocket import create_connection, WebSocketConnectionClosedException
 
 import base64
@@ -46,8 +47,8 @@ class VideoStreamTrack(MediaStreamTrack):
         # 将视频帧转换为OpenCV格式
         img = frame.to_ndarray(format="bgr24")
         
-        # 保存关键帧到数据库
-        if self.frame_count % 30 == 0:  # 每30帧保存一次关键帧
+        # 保存关键帧到数据库，按流的帧率预算采样，超出预算的帧不做JPEG编码
+        if self.video_stream and keyframe_writer.allow(self.video_stream.id):
             await self.save_keyframe(img)
         
         self.frame_count += 1
@@ -67,27 +68,11 @@ class VideoStreamTrack(MediaStreamTrack):
             logger.error(f"保存关键帧失败: {str(e)}")
     
     async def save_frame_to_db(self, frame_data: bytes, frame_type: str):
-        """保存帧数据到数据库"""
+        """保存帧数据到数据库（交给keyframe_writer批量写入）"""
         try:
-            # 使用数据库同步操作
-            await self._save_frame_async(frame_data, frame_type)
+            await keyframe_writer.add(self.video_stream.id, frame_data, frame_type, self.video_stream)
         except Exception as e:
             logger.error(f"保存帧到数据库失败: {str(e)}")
-    
-    @staticmethod
-    async def _save_frame_async(frame_data: bytes, frame_type: str):
-        """异步保存帧数据"""
-        from channels.db import database_sync_to_async
-        
-        @database_sync_to_async
-        def save_frame():
-            return VideoFrameModel.objects.create(
-                video_stream=VideoStream.objects.get(id=1),  # 这里需要根据实际情况获取
-                frame_data=frame_data,
-                frame_type=frame_type
-            )
-        
-        return await save_frame()
 
 class WebRTCService:
     """WebRTC服务类"""
@@ -153,13 +138,8 @@ class WebRTCService:
             # 这里可以添加视频处理逻辑
             # 例如：人脸检测、对象识别、视频压缩等
             
-            # 保存关键帧
-            if hasattr(self, '_frame_counter'):
-                self._frame_counter += 1
-            else:
-                self._frame_counter = 0
-            
-            if self._frame_counter % 30 == 0:  # 每30帧保存一次
+            # 保存关键帧：按流的帧率预算采样，超出预算的帧不做JPEG编码
+            if keyframe_writer.allow(stream_id):
                 await self.save_video_frame(img, stream_id)
             
         except Exception as e:
@@ -178,25 +158,9 @@ class WebRTCService:
         except Exception as e:
             logger.error(f"保存视频帧失败: {str(e)}")
     
-    @staticmethod
-    async def _save_frame_to_db(frame_data: bytes, stream_id: str, frame_type: str):
-        """异步保存帧数据到数据库"""
-        from channels.db import database_sync_to_async
-        
-        @database_sync_to_async
-        def save_frame():
-            try:
-                video_stream = VideoStream.objects.get(id=stream_id)
-                return VideoFrameModel.objects.create(
-                    video_stream=video_stream,
-                    frame_data=frame_data,
-                    frame_type=frame_type
-                )
-            except VideoStream.DoesNotExist:
-                logger.error(f"视频流不存在: {stream_id}")
-                return None
-        
-        return await save_frame()
+    async def _save_frame_to_db(self, frame_data: bytes, stream_id: str, frame_type: str):
+        """交给keyframe_writer批量写入，VideoStream实例由writer按流缓存"""
+        await keyframe_writer.add(stream_id, frame_data, frame_type, self.video_streams.get(stream_id))
     
     async def create_offer(self, session_id: str, stream_id: str) -> RTCSessionDescription:
         """创建offer"""
@@ -0,0 +1,11 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .frame_store import delete_frames
+from .models import VideoStream
+
+
+@receiver(pre_delete, sender=VideoStream)
+def delete_stream_frames(sender, instance, **kwargs):
+    """删除视频流前先删除其关键帧，级联删除只会删掉数据库记录而留下存储对象"""
+    delete_frames(instance.frames.values_list('id', flat=True))